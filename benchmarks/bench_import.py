@@ -0,0 +1,76 @@
+"""
+Import-time benchmark for the API server.
+
+Measures, in fresh interpreters, how long `import server` takes and checks
+that importing does not load the models (they load lazily / at warmup).
+Fails when the median import time exceeds the budget, so startup cost is
+tracked over time.
+
+Usage:
+  python benchmarks/bench_import.py [--runs 5] [--max-seconds 3.0] [--json out.json]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import server
+elapsed = time.perf_counter() - t0
+import processor_bert
+print(json.dumps({
+    "seconds": elapsed,
+    "models_loaded": processor_bert.is_loaded(),
+    "torch_imported": "torch" in sys.modules,
+}))
+"""
+
+
+def measure_import(runs):
+    """Import the server `runs` times, each in a new interpreter."""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = [s["seconds"] for s in samples]
+    return {
+        "runs": runs,
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "max_seconds": max(seconds),
+        "models_loaded_at_import": any(s["models_loaded"] for s in samples),
+        "torch_imported_at_import": any(s["torch_imported"] for s in samples),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark `import server`")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="Budget for the median import time")
+    parser.add_argument("--json", type=Path, help="Write the result as JSON to this file")
+    args = parser.parse_args()
+
+    result = measure_import(args.runs)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+    if result["models_loaded_at_import"]:
+        print("FAIL: importing server loaded the models", file=sys.stderr)
+        sys.exit(1)
+    if result["median_seconds"] > args.max_seconds:
+        print(f"FAIL: median import {result['median_seconds']:.2f}s > {args.max_seconds:.2f}s", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,275 @@
+"""
+Memory / throughput benchmark: in-process models vs. the inference sidecar.
+
+Starts `uvicorn server:app --workers N` once per mode and drives it with
+concurrent POST /classify-json requests built from synthetic_logs.csv /
+resources/test.csv (LegacyCRM rows left out, so no LLM calls are made):
+
+  inprocess - every uvicorn worker loads its own encoder and classifier
+  sidecar   - training/inference_sidecar.py owns the models (one process, or
+              --sidecar-processes of them) and the workers stay thin
+
+For each mode it reports logs/sec and p50/p95/p99 request latency, and the
+memory of every process involved (uvicorn supervisor, workers, sidecar) after
+the load: RSS, and PSS, which splits pages shared by several processes
+(libraries) between them, so the PSS total is the memory the deployment
+really takes. The result, embedding-store, template and lexical shortcuts
+are turned off so every log reaches BERT. Reads /proc, so Linux only.
+
+Usage:
+  python benchmarks/bench_sidecar.py [--workers 4] [--sidecar-processes 1]
+      [--modes inprocess,sidecar] [--requests 300] [--batch 32]
+      [--concurrency 8] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+MODES = ("inprocess", "sidecar")
+
+# Every log goes through the encoder: the benchmark measures where the model runs
+BENCH_ENV = {
+    "EMBEDDING_STORE_INFERENCE": "off",
+    "RESULT_CACHE_SIZE": "0",
+    "TEMPLATE_CACHE_SIZE": "0",
+    "LEXICAL_ENABLED": "false",
+}
+
+
+# ==================== DATA ====================
+def load_logs():
+    """(source, log_message) pairs from the repo's sample data, without LegacyCRM."""
+    frames = []
+    for path in (PROJECT_ROOT / "synthetic_logs.csv", PROJECT_ROOT / "resources" / "test.csv"):
+        if path.exists():
+            frames.append(pd.read_csv(path, usecols=["source", "log_message"]))
+    if not frames:
+        raise FileNotFoundError("Neither synthetic_logs.csv nor resources/test.csv was found")
+    df = pd.concat(frames, ignore_index=True).dropna()
+    df = df[df["source"] != "LegacyCRM"]
+    return list(zip(df["source"], df["log_message"].astype(str)))
+
+
+# ==================== PROCESSES ====================
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children():
+    """pid -> list of child pids, from /proc."""
+    children = {}
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # The command name (field 2) may contain spaces: split after its closing paren
+            fields = (entry / "stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry.name))
+    return children
+
+
+def process_tree(pid):
+    """pid and all of its descendants."""
+    children = _children()
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        todo.extend(children.get(current, []))
+    return pids
+
+
+def memory(pid):
+    """RSS and PSS of one process in MB (PSS None where smaps_rollup is missing)."""
+    values = {}
+    try:
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                values["Rss"] = int(line.split()[1]) / 1024
+    return {"rss_mb": round(values.get("Rss", 0.0), 1), "pss_mb": round(values["Pss"], 1) if "Pss" in values else None}
+
+
+def _stop(proc):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+# ==================== LOAD ====================
+def _post(url, logs):
+    body = json.dumps({"logs": [{"source": s, "log_message": m} for s, m in logs]}).encode()
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+    return time.perf_counter() - t0
+
+
+def wait_ready(base_url, workers, proc, timeout):
+    """Poll /readyz until enough consecutive 200s that every worker has answered ready."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < 4 * workers:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Server not ready after {timeout:.0f}s")
+        try:
+            with urllib.request.urlopen(f"{base_url}/readyz", timeout=10):
+                streak += 1
+        except (urllib.error.URLError, ConnectionError):
+            streak = 0
+            time.sleep(0.5)
+
+
+def drive(base_url, logs, requests, batch, concurrency, seed=0):
+    """Send `requests` requests of `batch` logs, `concurrency` at a time."""
+    rng = random.Random(seed)
+    batches = [[rng.choice(logs) for _ in range(batch)] for _ in range(requests)]
+    url = f"{base_url}/classify-json"
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm every worker's connections and first-call paths before timing
+        list(pool.map(lambda b: _post(url, b), batches[:concurrency]))
+        t0 = time.perf_counter()
+        latencies = list(pool.map(lambda b: _post(url, b), batches))
+        wall = time.perf_counter() - t0
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "requests": requests,
+        "logs": requests * batch,
+        "seconds": round(wall, 3),
+        "logs_per_sec": round(requests * batch / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+# ==================== MODES ====================
+def run_mode(mode, args, logs):
+    """Start the server (and sidecar) for one mode, load it, measure it, stop it."""
+    env = {**os.environ, **BENCH_ENV}
+    env.pop("INFERENCE_SIDECAR_SOCKET", None)
+    started = []
+    with tempfile.TemporaryDirectory(prefix="bench-sidecar-") as tmp:
+        try:
+            sidecar = None
+            if mode == "sidecar":
+                env["INFERENCE_SIDECAR_SOCKET"] = str(Path(tmp) / "bert.sock")
+                env["INFERENCE_SIDECAR_PROCESSES"] = str(args.sidecar_processes)
+                sidecar = subprocess.Popen(
+                    [sys.executable, "training/inference_sidecar.py"], cwd=PROJECT_ROOT, env=env
+                )
+                started.append(sidecar)
+            port = _free_port()
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+                 # Loading the model can keep a worker from answering uvicorn's 5 s health check
+                 "--timeout-worker-healthcheck", "120"],
+                cwd=PROJECT_ROOT, env=env,
+            )
+            started.append(server)
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(base_url, args.workers, server, args.startup_timeout)
+
+            result = {"mode": mode, "workers": args.workers, **drive(
+                base_url, logs, args.requests, args.batch, args.concurrency
+            )}
+            processes = [{"role": "server", "pid": pid, **memory(pid)} for pid in process_tree(server.pid)]
+            if sidecar is not None:
+                result["sidecar_processes"] = args.sidecar_processes
+                processes += [{"role": "sidecar", "pid": pid, **memory(pid)} for pid in process_tree(sidecar.pid)]
+            pss = [p["pss_mb"] for p in processes]
+            result.update({
+                "processes": processes,
+                "total_rss_mb": round(sum(p["rss_mb"] for p in processes), 1),
+                "total_pss_mb": round(sum(pss), 1) if None not in pss else None,
+            })
+            return result
+        finally:
+            for proc in reversed(started):
+                _stop(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory and throughput with and without the inference sidecar")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--sidecar-processes", type=int, default=1, help="Model processes in sidecar mode")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--requests", type=int, default=300, help="Timed requests per mode")
+    parser.add_argument("--batch", type=int, default=32, help="Logs per request")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight")
+    parser.add_argument("--startup-timeout", type=float, default=600, help="Seconds to wait for /readyz")
+    parser.add_argument("--json", type=Path, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {sorted(unknown)}")
+
+    logs = load_logs()
+    results = []
+    for mode in modes:
+        t0 = time.perf_counter()
+        results.append(run_mode(mode, args, logs))
+        print(f"{mode}: {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    for r in results:
+        print(f"{r['mode']:<10} {r['logs_per_sec']:>10} logs/s  p50 {r['p50_ms']:>9} ms  p95 {r['p95_ms']:>9} ms  "
+              f"RSS {r['total_rss_mb']:>8} MB  PSS {r['total_pss_mb']} MB  ({len(r['processes'])} processes)")
+    by_mode = {r["mode"]: r for r in results}
+    if len(by_mode) == 2:
+        inproc, side = by_mode["inprocess"], by_mode["sidecar"]
+        key = "total_pss_mb" if inproc["total_pss_mb"] and side["total_pss_mb"] else "total_rss_mb"
+        print(f"sidecar / inprocess: memory ({key}) x{side[key] / inproc[key]:.2f}, "
+              f"throughput x{side['logs_per_sec'] / inproc['logs_per_sec']:.2f}")
+
+    if args.json:
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "encoder_backend": os.getenv("ENCODER_BACKEND", "torch"),
+                "batch": args.batch,
+                "concurrency": args.concurrency,
+            },
+            "results": results,
+        }
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
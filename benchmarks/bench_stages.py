@@ -0,0 +1,298 @@
+"""
+Per-stage throughput / latency benchmark for the classification pipeline.
+
+Drives the stages with messages from synthetic_logs.csv and
+resources/test.csv and reports logs/sec and p50/p95/p99 latency for:
+
+  regex  - classify_with_regex, one call per message
+  bert   - classify_with_bert (one message per call) and
+           classify_with_bert_batch swept over batch sizes
+  llm    - classify_with_llm and classify_with_llm_batch against the local
+           stub server (training/llm_stub_server.py), never the real API
+  e2e    - classify.classify_batch swept over input and batch sizes, with
+           the result / template caches cleared before every call
+
+Results are written as JSON. With a baseline file, every measurement is
+compared to the baseline entry with the same stage / mode / sizes, and the
+run fails if throughput dropped or p95 latency grew by more than the allowed
+fraction (--max-regression, or a per-stage value under "thresholds" in the
+baseline file). Baselines are hardware specific: record one per machine
+with --update-baseline.
+
+Usage:
+  python benchmarks/bench_stages.py [--stages regex,bert,llm,e2e] [--quick]
+      [--json results.json] [--baseline benchmarks/baseline.json]
+      [--update-baseline] [--max-regression 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = PROJECT_ROOT / "benchmarks" / "baseline.json"
+STAGES = ("regex", "bert", "llm", "e2e")
+
+# Benchmarks measure the stages, not the caches in front of them
+os.environ["EMBEDDING_STORE_INFERENCE"] = "off"
+sys.path.insert(0, str(PROJECT_ROOT / "training"))
+
+
+# ==================== DATA ====================
+def load_messages():
+    """(source, log_message) pairs from the repo's sample data."""
+    frames = []
+    for path in (PROJECT_ROOT / "synthetic_logs.csv", PROJECT_ROOT / "resources" / "test.csv"):
+        if path.exists():
+            frames.append(pd.read_csv(path, usecols=["source", "log_message"]))
+    if not frames:
+        raise FileNotFoundError("Neither synthetic_logs.csv nor resources/test.csv was found")
+    df = pd.concat(frames, ignore_index=True).dropna()
+    return list(zip(df["source"], df["log_message"].astype(str)))
+
+
+def sample(logs, n, seed=0):
+    """n logs drawn (with replacement once the pool is exhausted) from logs."""
+    rng = random.Random(seed)
+    if n <= len(logs):
+        return rng.sample(logs, n)
+    return [rng.choice(logs) for _ in range(n)]
+
+
+# ==================== MEASUREMENT ====================
+def _summary(stage, mode, latencies, logs, **params):
+    """One result row: throughput over all calls, latency percentiles per call."""
+    latencies_ms = np.asarray(latencies) * 1000
+    total = float(np.sum(latencies))
+    return {
+        "stage": stage,
+        "mode": mode,
+        **params,
+        "calls": len(latencies),
+        "logs": logs,
+        "logs_per_sec": round(logs / total, 2) if total else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def time_calls(fn, inputs):
+    """Call fn on each input, return the per-call wall times in seconds."""
+    latencies = []
+    for item in inputs:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def time_batches(fn, logs, batch_size, repeats):
+    """Call fn on consecutive slices of batch_size, `repeats` times over the input."""
+    batches = [logs[i:i + batch_size] for i in range(0, len(logs), batch_size)]
+    return time_calls(fn, batches * repeats)
+
+
+# ==================== STAGES ====================
+def bench_regex(logs, sizes):
+    from processor_regex import classify_with_regex
+
+    messages = [m for _, m in sample(logs, max(sizes["inputs"]))]
+    classify_with_regex(messages[0])
+    return [_summary("regex", "single", time_calls(classify_with_regex, messages), len(messages))]
+
+
+def bench_bert(logs, sizes):
+    import processor_bert
+
+    processor_bert.get_encoder()
+    processor_bert.get_classifier()
+    messages = [m for _, m in sample(logs, sizes["bert_inputs"])]
+    processor_bert.classify_with_bert_batch(messages[:8])  # first-call overhead
+
+    results = [_summary(
+        "bert", "single",
+        time_calls(processor_bert.classify_with_bert, messages[:sizes["single_calls"]]),
+        min(len(messages), sizes["single_calls"]),
+    )]
+    for batch_size in sizes["batch_sizes"]:
+        latencies = time_batches(
+            lambda batch: processor_bert.classify_with_bert_batch(batch, batch_size=batch_size),
+            messages, batch_size, sizes["repeats"],
+        )
+        results.append(_summary(
+            "bert", "batch", latencies, len(messages) * sizes["repeats"], batch_size=batch_size
+        ))
+    return results
+
+
+def bench_llm(logs, sizes, latency_ms):
+    from llm_stub_server import start_stub_server
+
+    server, base_url = start_stub_server(latency_ms=latency_ms)
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["GROQ_API_KEY"] = "stub"
+    try:
+        import processor_llm
+
+        messages = [m for _, m in sample(logs, sizes["llm_inputs"])]
+        results = [_summary(
+            "llm", "single",
+            time_calls(processor_llm.classify_with_llm, messages[:sizes["single_calls"]]),
+            min(len(messages), sizes["single_calls"]),
+            stub_latency_ms=latency_ms,
+        )]
+        for batch_size in sizes["batch_sizes"]:
+            latencies = time_batches(processor_llm.classify_with_llm_batch, messages, batch_size, 1)
+            results.append(_summary(
+                "llm", "batch", latencies, len(messages), batch_size=batch_size, stub_latency_ms=latency_ms
+            ))
+        return results
+    finally:
+        server.shutdown()
+
+
+def bench_e2e(logs, sizes):
+    import classify
+
+    classify.warmup()
+    # No LegacyCRM rows: those are the LLM stage, measured against the stub above
+    pool = [log for log in logs if log[0] != "LegacyCRM"]
+    results = []
+    for input_size in sizes["inputs"]:
+        batch = sample(pool, input_size, seed=input_size)
+        for batch_size in sizes["batch_sizes"]:
+            latencies = []
+            for _ in range(sizes["repeats"]):
+                classify.result_cache.clear()
+                classify.template_cache.clear()
+                t0 = time.perf_counter()
+                classify.classify_batch(batch, batch_size=batch_size)
+                latencies.append(time.perf_counter() - t0)
+            results.append(_summary(
+                "e2e", "classify_batch", latencies, input_size * sizes["repeats"],
+                input_size=input_size, batch_size=batch_size,
+            ))
+    return results
+
+
+# ==================== BASELINE ====================
+def _key(result):
+    return (result["stage"], result["mode"], result.get("batch_size"), result.get("input_size"))
+
+
+def compare(results, baseline, max_regression):
+    """
+    Compare against a baseline run.
+
+    Returns:
+        list: Human-readable regression messages (empty when within thresholds)
+    """
+    thresholds = baseline.get("thresholds", {})
+    reference = {_key(r): r for r in baseline.get("results", [])}
+    failures = []
+    for result in results:
+        base = reference.get(_key(result))
+        if base is None:
+            continue
+        allowed = thresholds.get(result["stage"], max_regression)
+        name = "/".join(str(part) for part in _key(result) if part is not None)
+        if base["logs_per_sec"] and result["logs_per_sec"] < base["logs_per_sec"] * (1 - allowed):
+            failures.append(
+                f"{name}: {result['logs_per_sec']} logs/s < baseline {base['logs_per_sec']} (-{allowed:.0%} allowed)"
+            )
+        if result["p95_ms"] > base["p95_ms"] * (1 + allowed):
+            failures.append(
+                f"{name}: p95 {result['p95_ms']} ms > baseline {base['p95_ms']} ms (+{allowed:.0%} allowed)"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the classification pipeline stage by stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma-separated subset of regex,bert,llm,e2e")
+    parser.add_argument("--quick", action="store_true", help="Small input sizes (smoke run)")
+    parser.add_argument("--batch-sizes", default="8,32,64,128")
+    parser.add_argument("--input-sizes", default="100,1000,5000")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="Latency injected by the LLM stub")
+    parser.add_argument("--json", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed throughput drop / p95 growth vs. the baseline (fraction)")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {sorted(unknown)}")
+
+    input_sizes = [int(x) for x in args.input_sizes.split(",")]
+    sizes = {
+        "inputs": [100, 500] if args.quick else input_sizes,
+        "batch_sizes": [8, 64] if args.quick else [int(x) for x in args.batch_sizes.split(",")],
+        "repeats": 1 if args.quick else args.repeats,
+        "bert_inputs": 256 if args.quick else 2048,
+        "llm_inputs": 32 if args.quick else 256,
+        "single_calls": 20 if args.quick else 100,
+    }
+
+    logs = load_messages()
+    results = []
+    for stage in stages:
+        t0 = time.perf_counter()
+        if stage == "regex":
+            results += bench_regex(logs, sizes)
+        elif stage == "bert":
+            results += bench_bert(logs, sizes)
+        elif stage == "llm":
+            results += bench_llm(logs, sizes, args.llm_latency_ms)
+        else:
+            results += bench_e2e(logs, sizes)
+        print(f"{stage}: {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "encoder_backend": os.getenv("ENCODER_BACKEND", "torch"),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    for r in results:
+        params = " ".join(f"{k}={r[k]}" for k in ("batch_size", "input_size") if k in r)
+        print(f"{r['stage']:<6} {r['mode']:<15} {params:<28} {r['logs_per_sec']:>12} logs/s  "
+              f"p50 {r['p50_ms']:>9} ms  p95 {r['p95_ms']:>9} ms  p99 {r['p99_ms']:>9} ms")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        thresholds = {}
+        if args.baseline.exists():
+            thresholds = json.loads(args.baseline.read_text()).get("thresholds", {})
+        args.baseline.write_text(json.dumps({**report, "thresholds": thresholds}, indent=2))
+        print(f"Baseline written to {args.baseline}")
+        return
+    if args.baseline.exists():
+        failures = compare(results, json.loads(args.baseline.read_text()), args.max_regression)
+        for failure in failures:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,79 +3,282 @@ FastAPI server for the log classification system.
 
 Endpoints:
 - GET  /              : Frontend (paste logs or upload CSV, see results table).
-- POST /classify      : Upload CSV → returns classified CSV.
-- GET  /classify      : Download last classified CSV.
+- POST /classify      : Upload CSV (plain, .gz, .zst), Parquet or Arrow → returns it classified, in the same
+                        format or ?output_format=... (?stream=true streams CSV back chunk by chunk).
+- POST /classify/jobs : Upload a large file (same formats) → background job, classified in chunks; GET /classify/jobs[/{id}] for progress.
+- GET  /classify/jobs/{id}/result : Download a finished job's classified CSV; DELETE /classify/jobs/{id} cancels or deletes.
 - POST /classify-json : JSON body { "logs": [{ "source", "log_message" }] } → { "results": [...] }.
-- GET  /metrics       : Label counts and request latency stats.
-- POST /retrain       : Upload CSV (source, log_message, target_label) to add data and retrain BERT model.
+- POST /classify-ndjson : NDJSON stream of { "source", "log_message" } → NDJSON with target_label, incrementally.
+- GET  /metrics       : Label counts, request latency, cache stats and per-stage pipeline metrics.
+- GET  /metrics/prometheus : The pipeline metrics in Prometheus text format.
+- GET  /debug/traces/{id} : Per-stage timing of a request sent with X-Debug-Timing (or a slow one).
+- POST /retrain       : Upload CSV (source, log_message, target_label) → starts a background retrain job
+                       (?mode=batch|streaming, ?warm_start=true continues from the deployed model).
+- GET  /retrain/jobs[/{id}] : Retrain job status, progress and training metrics.
+- GET  /models        : Registered model versions; POST /models/{version}/activate, POST /models/rollback.
+- POST /regex-rules/reload : Re-read the regex rules file without restarting.
+- GET  /healthz       : Liveness (the process is serving requests).
+- GET  /readyz        : Readiness (models loaded and warmed up); 503 until then.
 """
 
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
+import os
 import sys
+import tempfile
 import time
-from collections import defaultdict
+from collections import Counter
 
 import pandas as pd
-from fastapi import FastAPI, UploadFile, HTTPException, Body
-from fastapi.responses import FileResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, HTTPException, Body, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 
 # Allow importing from the training module without a Python package
 BASE_DIR = Path(__file__).resolve().parent
 sys.path.append(str(BASE_DIR / "training"))
-from classify import classify_batch  # type: ignore
+from classify import template_cache, result_cache, deferred_queue  # type: ignore
+import workers  # type: ignore
+import metrics  # type: ignore
+import processor_regex  # type: ignore
+from batcher import MicroBatcher  # type: ignore
+import processor_llm  # type: ignore
+import processor_lexical  # type: ignore
+import processor_bert  # type: ignore
+import inference_sidecar  # type: ignore
+import model_registry  # type: ignore
+import retrain_jobs  # type: ignore
+import classify_jobs  # type: ignore
+import tracing  # type: ignore
+import table_io  # type: ignore
+import ndjson_stream  # type: ignore
+from config import (  # type: ignore
+    CSV_CHUNK_SIZE,
+    MICROBATCH_MAX_SIZE,
+    MICROBATCH_MAX_WAIT_MS,
+    NDJSON_BATCH_SIZE,
+    NDJSON_MAX_WAIT_MS,
+    WARMUP_ON_STARTUP,
+    CLASSIFY_JOB_TTL_SECONDS,
+    RETRAIN_MODE,
+    RETRAIN_WARM_START,
+    RETRAIN_STREAMING_EPOCHS,
+    LLM_FALLBACK,
+)
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Classification runs on worker pools (training/workers.py) so the event loop stays free.
+    # Models load lazily; warmup loads them in the background so /readyz turns green
+    # without blocking startup and the first real request isn't slow.
+    workers.start(warmup=WARMUP_ON_STARTUP)
+    # Classification jobs left by a previous process; expired ones are swept periodically
+    classify_jobs.recover()
+    sweeper = asyncio.create_task(_sweep_classify_jobs())
+    yield
+    sweeper.cancel()
+    with suppress(asyncio.CancelledError):
+        await sweeper
+    workers.shutdown()
+
+
+async def _sweep_classify_jobs():
+    interval = min(3600.0, max(1.0, CLASSIFY_JOB_TTL_SECONDS / 10))
+    while True:
+        await asyncio.sleep(interval)
+        await workers.run_blocking(classify_jobs.cleanup)
+
+
+app = FastAPI(title="Log Classification API", lifespan=lifespan)
+
+# Coalesces small /classify-json requests into shared encoder batches
+_batcher = MicroBatcher(workers.classify_batch_async, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+
+# ---------- Metrics (training/metrics.py; thread-safe, merged from worker processes) ----------
+def _record_labels(labels):
+    """Count labels returned to clients (list or Counter)."""
+    for label, count in Counter(labels).items():
+        metrics.LABELS.inc(count, label=label)
+
+
+def _record_metrics(endpoint: str, labels, latency_ms: float):
+    """Record one request: its latency and the labels it returned (list or Counter)."""
+    metrics.REQUEST_SECONDS.observe(latency_ms / 1000, endpoint=endpoint)
+    _record_labels(labels)
+
+
+# ---------- Inference sidecar (training/inference_sidecar.py) ----------
+@app.exception_handler(inference_sidecar.SidecarError)
+async def sidecar_error(request: Request, exc: Exception):
+    """The BERT stage runs in a sidecar that is down or failing: 503, so clients retry."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+# ---------- Debug timing (training/tracing.py) ----------
+def _wants_timing(request: Request, debug_timing: bool) -> bool:
+    """Timing breakdown requested with ?debug_timing=true or an X-Debug-Timing: 1 header."""
+    header = request.headers.get("x-debug-timing", "").strip().lower()
+    return debug_timing or header in ("1", "true", "yes", "on")
+
+
+def _timing_headers(trace, full: bool = True) -> dict:
+    """X-Trace-Id, plus the compact breakdown in X-Classify-Timing when the trace is complete."""
+    if not trace.debug:
+        return {}
+    headers = {"X-Trace-Id": trace.id}
+    if full:
+        headers["X-Classify-Timing"] = trace.header_value()
+    return headers
+
+
+# ---------- Upload formats (training/table_io.py) ----------
+def _upload_formats(filename: str, output_format: str | None) -> tuple:
+    """(input format from the file name, output format) or a 400 / 501 error."""
+    try:
+        fmt = table_io.check_format(table_io.detect_format(filename))
+        return fmt, table_io.check_format(output_format or fmt)
+    except table_io.UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except table_io.FormatUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
 
-app = FastAPI(title="Log Classification API")
 
-# ---------- Metrics (in-memory) ----------
-_metrics = {
-    "by_label": defaultdict(int),
-    "total_requests": 0,
-    "total_latency_ms": 0.0,
-}
+def _stream_classified_csv(file: UploadFile, chunks, trace):
+    """
+    Classify an upload chunk by chunk and yield CSV text as each chunk is done.
+    Only one chunk of rows is held in memory at a time; the upload is closed at the end.
+    """
+    try:
+        t0 = time.perf_counter()
+        label_counts = Counter()
+        rows = 0
+        for i, chunk in enumerate(chunks):
+            with trace.step("chunk", chunk=i, rows=len(chunk)):
+                results = workers.classify_batch_parallel(
+                    list(zip(chunk["source"], chunk["log_message"])), trace=trace, chunk=i
+                )
+            chunk_labels = [label for _, _, label in results]
+            chunk["target_label"] = chunk_labels
+            label_counts.update(chunk_labels)
+            rows += len(chunk)
+            yield chunk.to_csv(index=False, header=(i == 0))
+        _record_metrics("classify_stream", label_counts, (time.perf_counter() - t0) * 1000)
+        tracing.finish(trace, rows)
+    finally:
+        file.file.close()
 
 
-def _record_metrics(labels: list, latency_ms: float):
-    _metrics["total_requests"] += 1
-    _metrics["total_latency_ms"] += latency_ms
-    for label in labels:
-        _metrics["by_label"][label] += 1
+async def _classify_streaming(file: UploadFile, fmt: str, chunk_size: int, trace):
+    """
+    Start a chunked CSV response for POST /classify?stream=true (any input format).
+    The first chunk is read up front so a bad upload still gets a proper 400.
+    Headers are sent before any chunk is classified, so a debug trace only
+    carries X-Trace-Id; the breakdown is at GET /debug/traces/{id} once the
+    body has been read.
+    """
+    try:
+        reader = (chunk for chunk, _ in table_io.iter_tables(file.file, fmt, chunk_size))
+        with trace.step("read_first_chunk"):
+            first = await workers.run_blocking(next, reader, None)
+        if first is None:
+            raise HTTPException(status_code=400, detail="The upload contains no rows")
+    except HTTPException:
+        file.file.close()
+        raise
+    except Exception as e:
+        file.file.close()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def chunks():
+        yield first
+        yield from reader
+
+    return StreamingResponse(
+        _stream_classified_csv(file, chunks(), trace),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": 'attachment; filename="classified_logs.csv"',
+            **_timing_headers(trace, full=False),
+        },
+    )
 
 
 @app.post("/classify")
-async def classify_logs(file: UploadFile):
+async def classify_logs(
+    request: Request,
+    file: UploadFile,
+    stream: bool = False,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    debug_timing: bool = False,
+    output_format: str | None = None,
+):
     """
-    Accept a CSV file, classify logs, and return the resulting CSV.
+    Accept a file of logs, classify them, and return the classified file.
+
+    The format follows the file name: .csv, .csv.gz, .csv.zst, .parquet or
+    .arrow / .feather (Arrow IPC). Only the source and log_message columns
+    are read. The result (source, log_message, target_label) comes back in
+    the same format, or in ?output_format=csv|csv.gz|csv.zst|parquet|arrow.
+
+    With ?stream=true the upload is read and classified chunk_size rows at a
+    time and classified rows are streamed back as each chunk finishes, so
+    memory is bounded by the chunk size; streamed output is always CSV. Files
+    too large for one request belong in POST /classify/jobs.
+
+    With ?debug_timing=true (or an X-Debug-Timing: 1 header) the per-step,
+    per-stage and per-worker-part timing is returned as compact JSON in the
+    X-Classify-Timing header.
     """
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(status_code=400, detail="File must be a CSV file")
+    fmt, output_format = _upload_formats(file.filename, output_format or ("csv" if stream else None))
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be at least 1")
+    if stream and output_format != "csv":
+        raise HTTPException(status_code=400, detail="stream=true returns CSV; use output_format=csv or omit it")
+
+    trace = tracing.RequestTrace(
+        "classify_stream" if stream else "classify", debug=_wants_timing(request, debug_timing)
+    )
+    if stream:
+        return await _classify_streaming(file, fmt, chunk_size, trace)
 
     try:
-        df = pd.read_csv(file.file)
-
-        if "source" not in df.columns or "log_message" not in df.columns:
-            raise HTTPException(
-                status_code=400,
-                detail="CSV must contain 'source' and 'log_message' columns",
-            )
+        with trace.step("read_input", format=fmt):
+            try:
+                df = await workers.run_blocking(table_io.read_table, file.file, fmt)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
         logs = list(zip(df["source"], df["log_message"]))
         t0 = time.perf_counter()
-        results = classify_batch(logs)
+        with trace.step("classify"):
+            results = await workers.classify_batch_async(logs, trace=trace)
         latency_ms = (time.perf_counter() - t0) * 1000
         labels = [label for _, _, label in results]
-        _record_metrics(labels, latency_ms)  # Update in-memory metrics for /metrics endpoint
+        _record_metrics("classify", labels, latency_ms)  # Update in-memory metrics for /metrics endpoint
 
         df["target_label"] = labels
 
-        output_path = BASE_DIR / "resources" / "output.csv"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        df.to_csv(output_path, index=False)  # Persist so GET /classify can serve this file
+        # Each request gets its own file, deleted once it has been sent
+        fd, output_path = tempfile.mkstemp(prefix="classified-", suffix=table_io.suffix(output_format))
+        os.close(fd)
+        try:
+            with trace.step("write_output", format=output_format):
+                await workers.run_blocking(table_io.write_table, df, output_path, output_format)
+        except BaseException:
+            os.unlink(output_path)
+            raise
+        tracing.finish(trace, len(logs))
 
         return FileResponse(
-            path=str(output_path),
-            media_type="text/csv",
-            filename="classified_logs.csv",
+            path=output_path,
+            media_type=table_io.media_type(output_format),
+            filename=f"classified_logs{table_io.suffix(output_format)}",
+            headers=_timing_headers(trace),
+            background=BackgroundTask(os.unlink, output_path),
         )
     except HTTPException:
         raise
@@ -88,28 +291,109 @@ async def classify_logs(file: UploadFile):
 @app.get("/classify")
 async def get_classifications():
     """
-    Return the last classified CSV from resources/output.csv.
+    Removed: this served one shared output file that every request overwrote.
     """
-    output_path = BASE_DIR / "resources" / "output.csv"
+    raise HTTPException(
+        status_code=410,
+        detail="POST /classify returns its CSV directly; for large files use POST /classify/jobs "
+        "and GET /classify/jobs/{job_id}/result.",
+    )
 
-    if not output_path.exists():
-        raise HTTPException(
-            status_code=404,
-            detail="No classified output found. POST a CSV to /classify first.",
-        )
 
-    return FileResponse(
-        path=str(output_path),
-        media_type="text/csv",
-        filename="classified_logs.csv",
+@app.post("/classify/jobs", status_code=202)
+async def submit_classify_job(file: UploadFile, output_format: str | None = None):
+    """
+    Upload a file of logs (source, log_message) of any size and classify it
+    in the background. Formats are those of POST /classify; the result is in
+    the upload's format unless output_format says otherwise. The upload is
+    spooled to disk and classified in chunks on the worker pools; poll
+    GET /classify/jobs/{job_id} for progress and download
+    GET /classify/jobs/{job_id}/result once it succeeded.
+    """
+    _upload_formats(file.filename, output_format)
+    try:
+        return await workers.run_blocking(classify_jobs.submit, file.file, file.filename, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        file.file.close()
+
+
+@app.get("/classify/jobs")
+async def list_classify_jobs():
+    """
+    List classification jobs that have not expired, newest first.
+    """
+    return {"jobs": await workers.run_blocking(classify_jobs.list_jobs)}
+
+
+@app.get("/classify/jobs/{job_id}")
+async def get_classify_job(job_id: str):
+    """
+    Status, progress (fraction of the input read), rows and chunks classified, and expiry of a job.
+    """
+    job = await workers.run_blocking(classify_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown classification job: {job_id}")
+    return job
+
+
+@app.get("/classify/jobs/{job_id}/result")
+async def get_classify_job_result(job_id: str):
+    """
+    Download a succeeded job's classified file (409 while it is still running or if it failed).
+    """
+    try:
+        path, filename, media_type = await workers.run_blocking(classify_jobs.result_file, job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except classify_jobs.JobNotFinished as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return FileResponse(path=str(path), media_type=media_type, filename=filename)
+
+
+@app.delete("/classify/jobs/{job_id}")
+async def delete_classify_job(job_id: str):
+    """
+    Cancel a queued or running job, or delete a finished one; its files are removed.
+    """
+    try:
+        await workers.run_blocking(classify_jobs.cancel, job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"id": job_id, "deleted": True}
+
+
+async def _classify_coalesced(logs: list) -> list:
+    """
+    Classify /classify-json logs through the micro-batcher. LegacyCRM rows skip it:
+    they go to the LLM and would only hold up everyone else's batch.
+    """
+    if MICROBATCH_MAX_WAIT_MS <= 0:
+        return await workers.classify_batch_async(logs)
+
+    legacy_rows = [i for i, (source, _) in enumerate(logs) if source == "LegacyCRM"]
+    other_rows = [i for i, (source, _) in enumerate(logs) if source != "LegacyCRM"]
+    legacy_results, other_results = await asyncio.gather(
+        workers.classify_batch_async([logs[i] for i in legacy_rows]),
+        _batcher.submit([logs[i] for i in other_rows]),
     )
+    results = [None] * len(logs)
+    for i, result in zip(legacy_rows + other_rows, legacy_results + other_results):
+        results[i] = result
+    return results
 
 
 @app.post("/classify-json")
-async def classify_json(body: dict = Body(...)):
+async def classify_json(request: Request, body: dict = Body(...), debug_timing: bool = False):
     """
     Accept JSON: { "logs": [ { "source": "...", "log_message": "..." }, ... ] }.
     Returns { "results": [ { "source", "log_message", "target_label" }, ... ] }.
+    Logs from concurrent requests are coalesced into shared batches (see batcher.py).
+
+    With ?debug_timing=true (or an X-Debug-Timing: 1 header) the response also
+    has a "timing" field. Such requests skip the micro-batcher, so the stage
+    timings are their own and not those of a batch shared with other requests.
     """
     logs_in = body.get("logs")
     if not isinstance(logs_in, list) or len(logs_in) == 0:
@@ -127,51 +411,169 @@ async def classify_json(body: dict = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    trace = tracing.RequestTrace("classify_json", debug=_wants_timing(request, debug_timing))
     t0 = time.perf_counter()
-    results = classify_batch(logs)
+    with trace.step("classify"):
+        if trace.debug:
+            results = await workers.classify_batch_async(logs, trace=trace)
+        else:
+            results = await _classify_coalesced(logs)
     latency_ms = (time.perf_counter() - t0) * 1000
     labels = [label for _, _, label in results]
-    _record_metrics(labels, latency_ms)
+    _record_metrics("classify_json", labels, latency_ms)
+    tracing.finish(trace, len(logs))
 
     out = [
         {"source": s, "log_message": m, "target_label": label}
         for (s, m), (_, _, label) in zip(logs, results)
     ]
+    if trace.debug:
+        return {"results": out, "timing": trace.to_dict()}
     return {"results": out}
 
 
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body is produced while the request body is still
+    being read. The stock class (on servers older than ASGI 2.4) listens for
+    disconnects on receive() concurrently, which would swallow the request
+    body; here request.stream() is the only reader and reports a disconnect itself.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def _request_lines(request: Request):
+    """Decoded lines of a request body, as the chunks arrive."""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+
+async def _stream_classified_ndjson(request: Request, batch_size: int, max_wait_ms: float):
+    """Classify NDJSON records batch by batch and yield labeled NDJSON as each batch is done."""
+    t0 = time.perf_counter()
+    async for batch in ndjson_stream.amicro_batches(_request_lines(request), batch_size, max_wait_ms):
+        logs = [ndjson_stream.to_log(record) for _, record, _ in batch if record is not None]
+        results = await workers.classify_batch_async(logs) if logs else []
+        labels = [label for _, _, label in results]
+        # Counted per batch: a live stream may never end
+        _record_labels(labels)
+        yield "".join(ndjson_stream.dumps(r) for r in ndjson_stream.label_batch(batch, labels))
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="classify_ndjson")
+
+
+@app.post("/classify-ndjson")
+async def classify_ndjson(
+    request: Request,
+    batch_size: int = NDJSON_BATCH_SIZE,
+    max_wait_ms: float = NDJSON_MAX_WAIT_MS,
+):
+    """
+    Accept newline-delimited JSON, one { "source": "...", "log_message": "..." }
+    object per line, and stream back the same objects with "target_label" added,
+    in input order. Records are classified in batches of up to batch_size as the
+    body arrives; a partial batch is flushed after max_wait_ms, so a slow
+    producer gets labels while it is still sending. A line that is not a valid
+    record comes back as { "line": n, "error": "..." }.
+    """
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+    if max_wait_ms < 0:
+        raise HTTPException(status_code=400, detail="max_wait_ms must not be negative")
+    return _DuplexStreamingResponse(
+        _stream_classified_ndjson(request, batch_size, max_wait_ms),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.get("/metrics")
 async def get_metrics():
     """
-    Return classification metrics: counts per label and average latency.
+    Return classification metrics: counts per label, average latency, result
+    cache hit rates per stage, template cache hit/miss counters, lexical
+    stage coverage and agreement with BERT, encoder padding saved by length
+    bucketing and truncated messages, LLM circuit breaker state, unanswered
+    and deferred LegacyCRM logs, micro-batching queue depth / batch fill, and the pipeline histograms and
+    counters (per-stage latency percentiles, routing, Unclassified, batch sizes).
     """
-    by_label = dict(_metrics["by_label"])
-    total = _metrics["total_requests"]
-    total_ms = _metrics["total_latency_ms"]
+    requests = metrics.REQUEST_SECONDS.totals().values()
+    total = sum(count for count, _ in requests)
+    total_ms = sum(seconds for _, seconds in requests) * 1000
     return {
-        "by_label": by_label,
+        "by_label": metrics.LABELS.values(),
         "total_requests": total,
         "avg_latency_ms": round(total_ms / total, 2) if total else 0,
+        # With CLASSIFY_EXECUTOR=process, summed over the server and every worker process
+        "result_cache": workers.cache_stats("result_cache", result_cache.stats()),
+        "template_cache": workers.cache_stats("template_cache", template_cache.stats()),
+        # May load the lexical model (joblib) on first use: off the event loop
+        "lexical": await workers.run_blocking(processor_lexical.stats),
+        "encoder": processor_bert.length_stats(),
+        # Opens the response cache on first use and reads its row counts: off the event loop
+        "llm": {
+            **await workers.run_blocking(processor_llm.stats),
+            "fallback": LLM_FALLBACK,
+            "deferred": deferred_queue.stats(),
+        },
+        "microbatch": _batcher.stats(),
+        "pipeline": metrics.REGISTRY.to_dict(),
     }
 
 
-@app.post("/retrain")
-async def retrain_model(file: UploadFile):
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_metrics_prometheus():
     """
-    Upload a CSV with columns source, log_message, target_label.
-    New rows are merged with existing dataset/labeled_logs.csv (or synthetic_logs.csv
-    if labeled_logs does not exist), then the BERT classifier is retrained and saved.
+    The pipeline metrics in the Prometheus text exposition format.
     """
+    return PlainTextResponse(
+        metrics.REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """
+    Timing breakdown of a recent request that asked for it (X-Trace-Id) or was
+    slower than SLOW_REQUEST_MS.
+    """
+    trace = tracing.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Unknown trace: {trace_id}")
+    return trace
+
+
+@app.post("/retrain", status_code=202)
+async def retrain_model(
+    file: UploadFile, mode: str | None = None, warm_start: bool | None = None, epochs: int | None = None
+):
+    """
+    Upload a CSV with columns source, log_message, target_label and start a
+    background retrain job. New rows are appended to the deduplicated training
+    store (seeded from dataset/labeled_logs.csv or synthetic_logs.csv), the BERT
+    classifier is retrained and registered as a new version, and the new model
+    is swapped in without a restart. Poll GET /retrain/jobs/{job_id} for progress.
+
+    mode ("batch" or "streaming"), warm_start (streaming only: continue from
+    the deployed model) and epochs (streaming only: passes over the data, at
+    least 1) default to RETRAIN_MODE, RETRAIN_WARM_START and RETRAIN_STREAMING_EPOCHS.
+    """
+    mode = (mode or RETRAIN_MODE).strip().lower()
+    warm_start = RETRAIN_WARM_START if warm_start is None else warm_start
+    epochs = RETRAIN_STREAMING_EPOCHS if epochs is None else epochs
     if not file.filename.endswith(".csv"):
         raise HTTPException(status_code=400, detail="File must be a CSV file")
 
-    dataset_dir = BASE_DIR / "dataset"
-    dataset_dir.mkdir(parents=True, exist_ok=True)
-    labeled_path = dataset_dir / "labeled_logs.csv"
-    synthetic_path = BASE_DIR / "synthetic_logs.csv"
-
     try:
-        new_df = pd.read_csv(file.file)
+        new_df = await workers.run_blocking(pd.read_csv, file.file)
         for col in ["source", "log_message", "target_label"]:
             if col not in new_df.columns:
                 raise HTTPException(
@@ -183,39 +585,99 @@ async def retrain_model(file: UploadFile):
     finally:
         file.file.close()
 
-    # Keep only needed columns
-    new_df = new_df[["source", "log_message", "target_label"]].dropna(subset=["log_message", "target_label"])
-
-    # Merge with existing data: prefer labeled_logs.csv, else seed from synthetic_logs.csv
-    # so the first retrain has a base dataset if synthetic_logs.csv is present
-    if labeled_path.exists():
-        existing = pd.read_csv(labeled_path)
-        for c in ["source", "log_message", "target_label"]:
-            if c not in existing.columns:
-                raise HTTPException(status_code=500, detail=f"Existing dataset missing column: {c}")
-        combined = pd.concat([existing[["source", "log_message", "target_label"]], new_df], ignore_index=True)
-    elif synthetic_path.exists():
-        syn = pd.read_csv(synthetic_path)
-        if "target_label" not in syn.columns:
-            raise HTTPException(status_code=400, detail="synthetic_logs.csv must have target_label")
-        cols = ["source", "log_message", "target_label"]
-        for c in cols:
-            if c not in syn.columns:
-                raise HTTPException(status_code=500, detail=f"synthetic_logs.csv missing: {c}")
-        combined = pd.concat([syn[cols], new_df], ignore_index=True)
-    else:
-        combined = new_df
-
-    combined.to_csv(labeled_path, index=False)
+    try:
+        return retrain_jobs.submit(new_df[["source", "log_message", "target_label"]], mode, warm_start, epochs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/retrain/jobs")
+async def list_retrain_jobs():
+    """
+    List known retrain jobs, newest first.
+    """
+    return {"jobs": retrain_jobs.list_jobs()}
+
 
+@app.get("/retrain/jobs/{job_id}")
+async def get_retrain_job(job_id: str):
+    """
+    Status, stage and progress of a retrain job; version and training metrics once it succeeded.
+    """
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown retrain job: {job_id}")
+    return job
+
+
+@app.get("/models")
+async def list_models():
+    """
+    Registered classifier versions with their training metrics, and the active one.
+    """
+    return await workers.run_blocking(model_registry.list_versions)
+
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str):
+    """
+    Serve a registered classifier version; in-flight batches finish on the old one.
+    """
     try:
-        sys.path.insert(0, str(BASE_DIR / "training"))
-        import retrain  # type: ignore
-        msg = retrain.run_retrain(labeled_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Retrain failed: {e}")
+        await workers.run_blocking(model_registry.activate, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"status": "ok", "active": version}
+
+
+@app.post("/models/rollback")
+async def rollback_model(version: str | None = None):
+    """
+    Go back to the previously active classifier version (or to ?version=...).
+    """
+    try:
+        active = await workers.run_blocking(model_registry.rollback, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return {"status": "ok", "active": active}
+
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: the process is up and the event loop is responsive.
+    """
+    return {"status": "alive"}
+
 
-    return {"status": "ok", "message": msg, "training_rows": len(combined)}
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 once the encoder and classifier are loaded and warmed up, 503 before.
+    """
+    # Asks the inference sidecar, if any: a socket round trip, kept off the event loop
+    worker_status = await workers.run_blocking(workers.status)
+    body = {
+        "status": "ready" if worker_status["models_loaded"] else "loading",
+        **worker_status,
+        "llm_configured": processor_llm.is_configured(),
+        # Informational: with the breaker open LegacyCRM logs get the fallback, the server stays ready
+        "llm_breaker": processor_llm.breaker.state,
+    }
+    return JSONResponse(status_code=200 if worker_status["models_loaded"] else 503, content=body)
+
+
+@app.post("/regex-rules/reload")
+async def reload_regex_rules():
+    """
+    Re-read the regex rules file (REGEX_RULES_PATH) and swap in the new rule set.
+    The previous rules stay active if the file is invalid.
+    """
+    try:
+        count = processor_regex.reload_rules()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid regex rules: {e}")
+    return {"status": "ok", "rules": count}
 
 
 # ---------- Frontend: serve static and index at / ----------
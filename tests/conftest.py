@@ -0,0 +1,15 @@
+"""
+Pytest setup: the pipeline modules live in training/ and import each other
+by name, so put that directory on sys.path (as server.py does), and the
+repository root for server.py itself.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "training"))
+sys.path.insert(1, str(ROOT))
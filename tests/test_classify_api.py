@@ -0,0 +1,273 @@
+"""
+Classification API: POST /classify with CSV and Parquet uploads, the
+NDJSON stream, the removed GET /classify, and the lifecycle of background
+classification jobs (submit, poll, download, cancel, expiry and recovery of
+jobs left by a dead server process).
+
+The pipeline itself is replaced by the regex stage (anything else is
+"Unclassified"), so these tests need neither the BERT model nor Groq.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import classify_jobs
+import server
+import workers
+from processor_regex import classify_with_regex
+
+LOGS = pd.DataFrame({
+    "source": ["ModernCRM", "BillingSystem", "AnalyticsEngine", "ModernHR", "ModernCRM", "ThirdPartyAPI"],
+    "log_message": [
+        "User User123 logged in.",
+        "Backup completed successfully.",
+        "Disk I/O latency above threshold",
+        "System reboot initiated by user 42.",
+        "Email service experiencing issues with sending",
+        "Account with ID 7 created by admin.",
+    ],
+})
+EXPECTED = [
+    "User Action", "System Notification", "Unclassified",
+    "System Notification", "Unclassified", "User Action",
+]
+
+
+class Pipeline:
+    """Stand-in for the worker pools; chunks wait while `gate` is cleared."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def classify(self, logs, batch_size=None, trace=None, **trace_info):
+        self.gate.wait(10)
+        return [(source, msg, classify_with_regex(msg) or "Unclassified") for source, msg in logs]
+
+    async def classify_async(self, logs, batch_size=None, trace=None):
+        return self.classify(logs)
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    fake = Pipeline()
+    monkeypatch.setattr(workers, "classify_batch_parallel", fake.classify)
+    monkeypatch.setattr(workers, "classify_batch_async", fake.classify_async)
+    yield fake
+    fake.gate.set()
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    root = tmp_path / "jobs"
+    monkeypatch.setattr(classify_jobs, "CLASSIFY_JOBS_DIR", str(root))
+    monkeypatch.setattr(classify_jobs, "CLASSIFY_JOB_CHUNK_SIZE", 2)
+    monkeypatch.setattr(classify_jobs, "_jobs", OrderedDict())
+    monkeypatch.setattr(classify_jobs, "_inflight", {})
+    return root
+
+
+@pytest.fixture
+def client(pipeline):
+    # No lifespan: models are never loaded
+    return TestClient(server.app)
+
+
+def csv_upload(name="logs.csv"):
+    return {"file": (name, LOGS.to_csv(index=False).encode(), "text/csv")}
+
+
+def wait_for_job(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/classify/jobs/{job_id}").json()
+        if job["status"] in classify_jobs.FINISHED:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish: {job}")
+
+
+# ==================== POST /classify ====================
+def test_classify_csv(client):
+    response = client.post("/classify", files=csv_upload())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    result = pd.read_csv(io.BytesIO(response.content))
+    assert result["log_message"].tolist() == LOGS["log_message"].tolist()
+    assert result["target_label"].tolist() == EXPECTED
+
+
+def test_classify_csv_streamed(client):
+    response = client.post("/classify", params={"stream": "true", "chunk_size": 2}, files=csv_upload())
+    assert response.status_code == 200
+    result = pd.read_csv(io.StringIO(response.text))
+    assert result["target_label"].tolist() == EXPECTED
+
+
+def test_classify_parquet(client):
+    pytest.importorskip("pyarrow")
+    buffer = io.BytesIO()
+    LOGS.to_parquet(buffer, index=False)
+    response = client.post(
+        "/classify", files={"file": ("logs.parquet", buffer.getvalue(), "application/octet-stream")}
+    )
+    assert response.status_code == 200
+    result = pd.read_parquet(io.BytesIO(response.content))
+    assert result["target_label"].tolist() == EXPECTED
+
+    response = client.post(
+        "/classify", params={"output_format": "csv"},
+        files={"file": ("logs.parquet", buffer.getvalue(), "application/octet-stream")},
+    )
+    assert pd.read_csv(io.BytesIO(response.content))["target_label"].tolist() == EXPECTED
+
+
+def test_classify_rejects_bad_uploads(client):
+    assert client.post("/classify", files={"file": ("logs.txt", b"x", "text/plain")}).status_code == 400
+    no_message = pd.DataFrame({"source": ["a"]}).to_csv(index=False).encode()
+    assert client.post("/classify", files={"file": ("logs.csv", no_message, "text/csv")}).status_code == 400
+    assert client.post("/classify", params={"chunk_size": 0}, files=csv_upload()).status_code == 400
+
+
+def test_get_classify_is_gone(client):
+    response = client.get("/classify")
+    assert response.status_code == 410
+    assert "/classify/jobs" in response.json()["detail"]
+
+
+# ==================== POST /classify-ndjson ====================
+def test_classify_ndjson(client):
+    lines = [json.dumps({"source": s, "log_message": m}) for s, m in zip(LOGS["source"], LOGS["log_message"])]
+    lines.insert(2, "{not json")
+    body = "\n".join(lines) + "\n"
+    response = client.post(
+        "/classify-ndjson", params={"batch_size": 4}, content=body,
+        headers={"content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[2]["line"] == 3 and "error" in records[2]
+    del records[2]
+    assert [r["target_label"] for r in records] == EXPECTED
+    assert [r["log_message"] for r in records] == LOGS["log_message"].tolist()
+
+
+# ==================== CLASSIFICATION JOBS ====================
+def test_job_lifecycle(client, jobs_dir):
+    response = client.post("/classify/jobs", files=csv_upload())
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued" and job["owner_pid"] == os.getpid()
+
+    job = wait_for_job(client, job["id"])
+    assert job["status"] == "succeeded", job
+    assert (job["rows"], job["chunks"], job["progress"]) == (len(LOGS), 3, 1.0)
+    assert job["expires_at"] > job["finished_at"]
+    assert [j["id"] for j in client.get("/classify/jobs").json()["jobs"]] == [job["id"]]
+
+    result = client.get(f"/classify/jobs/{job['id']}/result")
+    assert result.status_code == 200
+    assert "classified_logs.csv" in result.headers["content-disposition"]
+    assert pd.read_csv(io.BytesIO(result.content))["target_label"].tolist() == EXPECTED
+
+    assert client.delete(f"/classify/jobs/{job['id']}").json() == {"id": job["id"], "deleted": True}
+    assert client.get(f"/classify/jobs/{job['id']}").status_code == 404
+    assert not (jobs_dir / job["id"]).exists()
+
+
+def test_job_output_format(client, jobs_dir):
+    pytest.importorskip("pyarrow")
+    job = client.post("/classify/jobs", params={"output_format": "parquet"}, files=csv_upload()).json()
+    assert wait_for_job(client, job["id"])["status"] == "succeeded"
+    result = client.get(f"/classify/jobs/{job['id']}/result")
+    assert pd.read_parquet(io.BytesIO(result.content))["target_label"].tolist() == EXPECTED
+
+
+def test_job_rejects_bad_upload(client, jobs_dir):
+    no_message = pd.DataFrame({"source": ["a"]}).to_csv(index=False).encode()
+    assert client.post("/classify/jobs", files={"file": ("logs.csv", no_message, "text/csv")}).status_code == 400
+    assert client.post("/classify/jobs", files={"file": ("logs.txt", b"x", "text/plain")}).status_code == 400
+    assert not jobs_dir.exists() or not any(jobs_dir.iterdir())
+
+
+def test_cancel_running_job(client, jobs_dir, pipeline):
+    pipeline.gate.clear()
+    job = client.post("/classify/jobs", files=csv_upload()).json()
+    deadline = time.monotonic() + 10
+    while client.get(f"/classify/jobs/{job['id']}").json()["status"] != "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert client.get(f"/classify/jobs/{job['id']}/result").status_code == 409
+
+    assert client.delete(f"/classify/jobs/{job['id']}").status_code == 200
+    pipeline.gate.set()
+    deadline = time.monotonic() + 10
+    while (jobs_dir / job["id"]).exists():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert client.get(f"/classify/jobs/{job['id']}").status_code == 404
+
+
+def test_unknown_job(client, jobs_dir):
+    assert client.get("/classify/jobs/cjob-00001-deadbeef").status_code == 404
+    assert client.delete("/classify/jobs/cjob-00001-deadbeef").status_code == 404
+
+
+def test_finished_jobs_expire(client, jobs_dir, monkeypatch):
+    monkeypatch.setattr(classify_jobs, "CLASSIFY_JOB_TTL_SECONDS", 0.2)
+    job = client.post("/classify/jobs", files=csv_upload()).json()
+    assert wait_for_job(client, job["id"])["status"] == "succeeded"
+    time.sleep(0.3)
+    assert client.get(f"/classify/jobs/{job['id']}").status_code == 404
+    assert not (jobs_dir / job["id"]).exists()
+
+
+def write_job(jobs_dir, job_id, status, owner_pid, **fields):
+    job_dir = jobs_dir / job_id
+    job_dir.mkdir(parents=True)
+    job = {
+        "id": job_id, "status": status, "filename": "logs.csv", "format": "csv", "output_format": "csv",
+        "progress": 0.5, "rows": 2, "chunks": 1, "created_at": time.time(), "owner_pid": owner_pid,
+        "started_at": time.time(), "finished_at": None, "expires_at": None, "error": None, **fields,
+    }
+    (job_dir / "job.json").write_text(json.dumps(job))
+    return job
+
+
+def test_recover_jobs_of_dead_processes(client, jobs_dir, monkeypatch):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    write_job(jobs_dir, "cjob-00001-0000dead", "running", dead.pid)
+    write_job(jobs_dir, "cjob-00002-0000a11e", "running", os.getppid())
+    write_job(jobs_dir, "cjob-00003-00000ee0", "succeeded", dead.pid, finished_at=1.0, expires_at=2.0)
+    monkeypatch.setattr(classify_jobs, "_last_sweep", 0.0)
+
+    classify_jobs.recover()
+
+    recovered = client.get("/classify/jobs/cjob-00001-0000dead").json()
+    assert recovered["status"] == "failed"
+    assert recovered["error"] == "Interrupted by a server restart"
+    assert json.loads((jobs_dir / "cjob-00001-0000dead" / "job.json").read_text())["status"] == "failed"
+    # Another live process's job is left to it
+    assert client.get("/classify/jobs/cjob-00002-0000a11e").json()["status"] == "running"
+    # Expired on disk: swept
+    assert not (jobs_dir / "cjob-00003-00000ee0").exists()
+
+    # Cancelling a live process's job leaves a marker for it instead of deleting its files
+    assert client.delete("/classify/jobs/cjob-00002-0000a11e").status_code == 200
+    assert (jobs_dir / "cjob-00002-0000a11e" / classify_jobs.CANCEL_MARKER).exists()
@@ -0,0 +1,101 @@
+"""
+Encoder truncation: by default the pipeline's token-id path (length
+bucketing, encode_ids) must give the same vectors as the encoder's own
+SentenceTransformer.encode - the vectors the deployed classifier was
+trained on - for short and over-long messages alike; head + tail cuts only
+apply when ENCODER_MAX_TOKENS is set.
+
+Runs on a tiny randomly initialised BERT built in a temporary directory, so
+no model download is needed.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import string
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import processor_bert  # noqa: E402
+from processor_bert import TorchEncoder, encode_bucketed, truncate_head_tail, truncation_limits  # noqa: E402
+
+MAX_SEQ_LENGTH = 32
+MESSAGES = [
+    "User User123 logged in.",
+    "Backup completed successfully.",
+    "nova.compute.manager " + " ".join(f"instance {i} status: ok" for i in range(20)) + " ERROR: disk full",
+    "GET /v2/servers/detail HTTP/1.1 status: 200 len: 1893 time: 0.2675118",
+    "x" * 300,
+]
+
+
+@pytest.fixture(scope="module")
+def encoder(tmp_path_factory):
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    root = tmp_path_factory.mktemp("tiny_encoder")
+    characters = string.ascii_lowercase + string.digits
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *characters, *string.punctuation]
+    vocab += [f"##{c}" for c in characters]
+    (root / "vocab.txt").write_text("\n".join(vocab))
+    tokenizer = BertTokenizerFast(str(root / "vocab.txt"))
+    bert_dir = root / "bert"
+    tokenizer.save_pretrained(bert_dir)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=64,
+    )
+    BertModel(config).save_pretrained(bert_dir)
+    transformer = models.Transformer(str(bert_dir), max_seq_length=MAX_SEQ_LENGTH)
+    model = SentenceTransformer(
+        modules=[transformer, models.Pooling(32, "mean"), models.Normalize()], device="cpu"
+    )
+    model.save(str(root / "sentence_transformer"))
+    return TorchEncoder(str(root / "sentence_transformer"))
+
+
+def test_default_matches_encoder_own_truncation(encoder, monkeypatch):
+    monkeypatch.setattr(processor_bert, "ENCODER_MAX_TOKENS", 0)
+    max_tokens, tail = truncation_limits(encoder)
+    assert (max_tokens, tail) == (MAX_SEQ_LENGTH - 2, 0)
+    _, truncated = truncate_head_tail(encoder.tokenizer, MESSAGES, max_tokens, tail)
+    assert truncated >= 2
+
+    reference = encoder.encode(MESSAGES, batch_size=2)
+    for batch_size in (1, 2, len(MESSAGES)):
+        np.testing.assert_allclose(encode_bucketed(encoder, MESSAGES, batch_size), reference, atol=1e-5)
+
+
+def test_default_encoder_id_unchanged(monkeypatch):
+    monkeypatch.setattr(processor_bert, "ENCODER_MAX_TOKENS", 0)
+    assert processor_bert.encoder_id() == f"{processor_bert.ENCODER_BACKEND}:{processor_bert.ENCODER_MODEL_NAME}"
+    monkeypatch.setattr(processor_bert, "ENCODER_MAX_TOKENS", 16)
+    assert processor_bert.encoder_id().endswith(f":trunc-ids16/{processor_bert.ENCODER_TRUNCATE_TAIL_TOKENS}")
+
+
+def test_head_tail_when_configured(encoder, monkeypatch):
+    monkeypatch.setattr(processor_bert, "ENCODER_MAX_TOKENS", 16)
+    monkeypatch.setattr(processor_bert, "ENCODER_TRUNCATE_TAIL_TOKENS", 4)
+    assert truncation_limits(encoder) == (16, 4)
+
+    full = encoder.tokenizer(MESSAGES[2], add_special_tokens=False)["input_ids"]
+    (ids,), truncated = truncate_head_tail(encoder.tokenizer, [MESSAGES[2]], *truncation_limits(encoder))
+    assert truncated == 1
+    assert ids == full[:12] + full[-4:]
+
+    all_ids, _ = truncate_head_tail(encoder.tokenizer, MESSAGES, *truncation_limits(encoder))
+    vectors = encode_bucketed(encoder, MESSAGES, 2)
+    np.testing.assert_allclose(vectors, encoder.encode_ids(all_ids, batch_size=1), atol=1e-5)
+    # Unlike the default, this is not what the classifier was trained on
+    assert not np.allclose(vectors[2], encoder.encode([MESSAGES[2]])[0], atol=1e-3)
+
+
+def test_limit_capped_by_model(encoder, monkeypatch):
+    monkeypatch.setattr(processor_bert, "ENCODER_MAX_TOKENS", 10_000)
+    assert truncation_limits(encoder)[0] == MAX_SEQ_LENGTH - 2
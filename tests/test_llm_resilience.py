@@ -0,0 +1,187 @@
+"""
+LLM stage resilience against the local stub server: per-request timeouts,
+the circuit breaker's closed -> open -> half_open -> closed cycle, the local
+fallback while the breaker is open, and deferred logs resolved once the
+"API" recovers.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import time
+import weakref
+
+import pytest
+
+import classify
+import processor_llm
+from llm_deferred import DeferredQueue
+from llm_stub_server import start_stub_server, set_faults, stub_label
+
+FAILURES = 2
+RESET_SECONDS = 0.5
+# Short timeouts, no retries, no persistent cache. Set on the module (which read
+# them from config at import), not in os.environ, so other test modules don't see them
+LLM_SETTINGS = {
+    "LLM_REQUEST_TIMEOUT": 0.3,
+    "LLM_BATCH_TIMEOUT": 5.0,
+    "LLM_MAX_RETRIES": 0,
+    "LLM_PACK_SIZE": 1,
+    "LLM_CACHE_ENABLED": False,
+    "LLM_REQUESTS_PER_SECOND": 1000.0,
+}
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server, base_url = start_stub_server()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("GROQ_API_KEY", "stub")
+        patch.setenv("GROQ_BASE_URL", base_url)
+        for name, value in LLM_SETTINGS.items():
+            patch.setattr(processor_llm, name, value)
+        patch.setattr(classify, "LLM_FALLBACK", "local")
+        # The shared AsyncGroq client takes the key, base URL and timeout when it is
+        # created: start from none, and drop the stub's when the module is done
+        patch.setattr(processor_llm, "_shared", weakref.WeakKeyDictionary())
+        patch.setattr(processor_llm, "_cache", None)
+        yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def breaker(stub, monkeypatch):
+    """A fresh breaker per test, with the stub healthy and fast."""
+    set_faults(stub, latency_ms=0, error_rate=0.0, error_status=503)
+    fresh = processor_llm.CircuitBreaker(FAILURES, RESET_SECONDS)
+    monkeypatch.setattr(processor_llm, "breaker", fresh)
+    return fresh
+
+
+def _wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def test_answers_through_stub(breaker):
+    messages = ["Workflow failed at step 3", "API v1 is deprecated", "Hello there"]
+    assert processor_llm.classify_with_llm_batch(messages) == [stub_label(m) for m in messages]
+    assert breaker.stats()["state"] == "closed"
+
+
+def test_request_timeout(stub, breaker):
+    set_faults(stub, latency_ms=2000)
+    errors = processor_llm.UNANSWERED.values().get("error", 0)
+    t0 = time.perf_counter()
+    labels = processor_llm.classify_with_llm_batch(["Escalation failed for case 42"])
+    assert time.perf_counter() - t0 < 1.5
+    assert labels == [None]
+    assert processor_llm.UNANSWERED.values()["error"] == errors + 1
+    assert breaker.stats()["consecutive_failures"] == 1
+
+
+def test_breaker_cycle(stub, breaker):
+    set_faults(stub, error_rate=1.0)
+    for i in range(FAILURES):
+        assert processor_llm.classify_with_llm_batch([f"Workflow failed {i}"]) == [None]
+    assert breaker.state == "open"
+    assert breaker.is_open()
+
+    # Refused without a request while open
+    refused = processor_llm.UNANSWERED.values().get("breaker_open", 0)
+    assert processor_llm.classify_with_llm_batch(["Workflow failed again"]) == [None]
+    assert processor_llm.UNANSWERED.values()["breaker_open"] == refused + 1
+
+    # After the reset period one probe is let through; a failing probe opens it again
+    time.sleep(RESET_SECONDS + 0.1)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # A successful probe closes it
+    time.sleep(RESET_SECONDS + 0.1)
+    set_faults(stub, error_rate=0.0)
+    assert processor_llm.classify_with_llm_batch(["Workflow failed once more"]) == ["Workflow Error"]
+    assert breaker.stats() == {
+        "enabled": True, "state": "closed", "consecutive_failures": 0, "retry_in_seconds": None,
+    }
+
+
+def test_client_errors_do_not_open_breaker(stub, breaker):
+    set_faults(stub, error_rate=1.0, error_status=400)
+    for i in range(FAILURES + 1):
+        assert processor_llm.classify_with_llm_batch([f"Bad request {i}"]) == [None]
+    assert breaker.state == "closed"
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_single_message_unanswered(stub, breaker, monkeypatch):
+    assert processor_llm.classify_with_llm("Workflow failed at step 3") == "Workflow Error"
+
+    def unanswered(reason):
+        return processor_llm.UNANSWERED.values().get(reason, 0)
+
+    errors = unanswered("error")
+    set_faults(stub, error_rate=1.0)
+    assert processor_llm.classify_with_llm("Workflow failed at step 4") == "Unclassified"
+    assert unanswered("error") == errors + 1
+
+    refused = unanswered("breaker_open")
+    for _ in range(FAILURES):
+        breaker.record_failure()
+    assert processor_llm.classify_with_llm("Workflow failed at step 5") == "Unclassified"
+    assert unanswered("breaker_open") == refused + 1
+
+    not_configured = unanswered("not_configured")
+    monkeypatch.delenv("GROQ_API_KEY")
+    assert processor_llm.classify_with_llm("Workflow failed at step 6") == "Unclassified"
+    assert unanswered("not_configured") == not_configured + 1
+
+
+def test_local_fallback_while_open(breaker):
+    for _ in range(FAILURES):
+        breaker.record_failure()
+    assert breaker.is_open()
+    classify.result_cache.clear()
+    # LegacyCRM row the LLM can't answer: the local regex stage labels it
+    results = classify.classify_batch([("LegacyCRM", "User User123 logged in.")])
+    assert results == [("LegacyCRM", "User User123 logged in.", "User Action")]
+
+
+def test_deferred_requeued_then_resolved(stub, breaker):
+    set_faults(stub, error_rate=1.0)
+    resolved = {}
+    queue = DeferredQueue(
+        100, lambda source, msg, label: resolved.__setitem__(msg, label), retry_seconds=0.1, max_attempts=1000
+    )
+    messages = [f"Case {i} escalation failed" for i in range(5)] + ["Legacy API is deprecated"]
+    queue.add([("LegacyCRM", msg) for msg in messages])
+
+    # Unanswered logs stay queued with their attempts counted until the breaker opens
+    assert _wait_for(breaker.is_open)
+    assert queue.stats()["pending"] == len(messages)
+    assert resolved == {}
+    assert all(attempts >= 1 for attempts in queue._pending.values())
+
+    set_faults(stub, error_rate=0.0)
+    assert _wait_for(lambda: len(resolved) == len(messages))
+    assert resolved == {msg: stub_label(msg) for msg in messages}
+    assert queue.stats()["pending"] == 0
+
+
+def test_deferred_dropped_after_max_attempts(stub, breaker):
+    set_faults(stub, error_rate=1.0)
+    breaker.failure_threshold = 0  # keep sending, so every round is an attempt
+    queue = DeferredQueue(100, lambda *args: None, retry_seconds=0.05, max_attempts=2)
+    dropped = queue.stats().get("dropped", 0)
+    queue.add([("LegacyCRM", "Workflow failed for good")])
+    assert _wait_for(lambda: queue.stats()["pending"] == 0)
+    assert queue.stats()["dropped"] == dropped + 1
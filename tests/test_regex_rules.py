@@ -0,0 +1,130 @@
+"""
+Regex stage: the combined single-pass engine keeps the rule list's
+first-match-wins semantics, rejects patterns that can't share one compiled
+alternation, and the rules file is picked up again when it changes.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import processor_regex
+from processor_regex import RegexRuleEngine, load_rules
+
+DATASET = Path(__file__).resolve().parent.parent / "synthetic_logs.csv"
+
+
+def sequential_match(rules, log_message):
+    """Reference semantics: try every rule in order, the first one that matches wins."""
+    for pattern, label in rules:
+        if re.search(pattern, log_message, re.IGNORECASE):
+            return label
+    return None
+
+
+def write_rules(path, rules):
+    path.write_text(json.dumps([{"pattern": p, "label": label} for p, label in rules]))
+
+
+def test_matches_sequential_search_on_dataset():
+    rules = load_rules()
+    engine = RegexRuleEngine(rules)
+    messages = pd.read_csv(DATASET)["log_message"].astype(str).tolist()
+
+    labels = [engine.match(message) for message in messages]
+    assert labels == [sequential_match(rules, message) for message in messages]
+    assert any(label is not None for label in labels)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("alpha beta gamma", "G"),  # each leftmost match belongs to a later rule
+    ("alpha beta", "B"),
+    ("alpha", "A"),
+    ("delta", None),
+])
+def test_first_rule_wins_over_leftmost_match(message, expected):
+    rules = [("gamma", "G"), ("beta", "B"), ("alpha", "A")]
+    assert RegexRuleEngine(rules).match(message) == expected
+    assert sequential_match(rules, message) == expected
+
+
+def test_same_position_prefers_earlier_rule():
+    engine = RegexRuleEngine([("disk cleanup", "Cleanup"), ("disk", "Disk")])
+    assert engine.match("Disk cleanup completed") == "Cleanup"
+    assert engine.match("Disk full") == "Disk"
+
+
+def test_empty_rules():
+    assert RegexRuleEngine([]).match("anything") is None
+
+
+@pytest.mark.parametrize("pattern", [
+    r"(?P<user>\w+) logged in",
+    r"(\w+) and \1",
+    r"(?P<x>a)(?P=x)",
+    r"(a)?(?(1)b|c)",
+])
+def test_rejects_named_groups_and_references(pattern):
+    with pytest.raises(ValueError):
+        RegexRuleEngine([("backup", "System Notification"), (pattern, "User Action")])
+
+
+def test_plain_groups_allowed():
+    engine = RegexRuleEngine([(r"User User\d+ logged (in|out)\.", "User Action"), (r"(?:a|b)c", "X")])
+    assert engine.match("User User7 logged out.") == "User Action"
+
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    """Point the module at a temporary rules file; every global it swaps is restored afterwards."""
+    for name in ("_engine", "_rules_path", "_rules_signature", "_rules_version", "_rejected_signature", "_checked_at"):
+        monkeypatch.setattr(processor_regex, name, getattr(processor_regex, name))
+    path = tmp_path / "regex_rules.json"
+    write_rules(path, [("backup", "System Notification")])
+    processor_regex.reload_rules(path)
+    return path
+
+
+def force_check(monkeypatch):
+    """Let the next reload_if_changed() look at the file instead of being throttled."""
+    monkeypatch.setattr(processor_regex, "_checked_at", 0.0)
+
+
+def test_reload_if_changed(rules_file, monkeypatch):
+    version = processor_regex.rules_version()
+    force_check(monkeypatch)
+    assert processor_regex.reload_if_changed() is False
+
+    write_rules(rules_file, [("reboot", "Maintenance"), ("backup", "Backup")])
+    # Checked at most once a second
+    assert processor_regex.reload_if_changed() is False
+    force_check(monkeypatch)
+    assert processor_regex.reload_if_changed() is True
+    assert processor_regex.rules_version() == version + 1
+    assert processor_regex.classify_with_regex("Backup started") == "Backup"
+    assert processor_regex.classify_with_regex("System reboot") == "Maintenance"
+
+
+def test_invalid_rules_file_keeps_current_rules(rules_file, monkeypatch):
+    version = processor_regex.rules_version()
+    write_rules(rules_file, [(r"(\w+) again \1", "Repeat")])
+    force_check(monkeypatch)
+    assert processor_regex.reload_if_changed() is False
+    assert processor_regex.rules_version() == version
+    assert processor_regex.classify_with_regex("backup done") == "System Notification"
+
+    # The rejected file isn't retried until it changes again
+    force_check(monkeypatch)
+    assert processor_regex.reload_if_changed() is False
+    write_rules(rules_file, [("backup", "Backup")])
+    force_check(monkeypatch)
+    assert processor_regex.reload_if_changed() is True
+    assert processor_regex.classify_with_regex("backup done") == "Backup"
@@ -0,0 +1,120 @@
+"""
+Training data store: the latest / first / majority conflict policies, vote
+ties inside one upload, schema migration of older stores, and the
+single-import guarantee of seed_if_empty.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from training_store import COLUMNS, TrainingStore
+
+
+def labels(store):
+    return {row.log_message: row.target_label for chunk in store.iter_chunks() for row in chunk.itertuples()}
+
+
+def batch(*pairs):
+    return pd.DataFrame([("src", message, label) for message, label in pairs], columns=COLUMNS)
+
+
+def test_rejects_unknown_policy(tmp_path):
+    with pytest.raises(ValueError):
+        TrainingStore(tmp_path / "store.sqlite", "newest")
+
+
+def test_duplicates_counted_once(tmp_path):
+    store = TrainingStore(tmp_path / "store.sqlite")
+    store.append(batch(("disk full", "Critical Error")))
+    counts = store.append(batch(("disk full", "Critical Error"), ("login ok", "User Action")))
+
+    assert counts == {"received": 2, "inserted": 1, "duplicates": 1, "conflicts": 0, "relabeled": 0}
+    assert store.count() == 2
+    assert store.stats()["submissions"] == 3
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("latest", "Error"),
+    ("first", "Warning"),
+    ("majority", "Critical Error"),
+])
+def test_conflict_policies(tmp_path, policy, expected):
+    store = TrainingStore(tmp_path / "store.sqlite", policy)
+    store.append(batch(("disk full", "Warning")))
+    store.append(batch(("disk full", "Critical Error")))
+    store.append(batch(("disk full", "Critical Error")))
+    store.append(batch(("disk full", "Error")))
+
+    assert labels(store) == {"disk full": expected}
+    assert store.stats()["conflicting_messages"] == 1
+
+
+def test_majority_tie_goes_to_latest_batch(tmp_path):
+    store = TrainingStore(tmp_path / "store.sqlite", "majority")
+    store.append(batch(("disk full", "Warning")))
+    store.append(batch(("disk full", "Error")))
+    assert labels(store) == {"disk full": "Error"}
+
+    store.append(batch(("disk full", "Warning")))
+    assert labels(store) == {"disk full": "Warning"}
+
+
+@pytest.mark.parametrize("order", [("Error", "Warning"), ("Warning", "Error")])
+def test_majority_tie_within_one_batch_goes_to_later_row(tmp_path, order):
+    store = TrainingStore(tmp_path / "store.sqlite", "majority")
+    store.append(batch(*[("disk full", label) for label in order]))
+    assert labels(store) == {"disk full": order[-1]}
+
+
+def test_majority_count_beats_recency_within_batch(tmp_path):
+    store = TrainingStore(tmp_path / "store.sqlite", "majority")
+    store.append(batch(("disk full", "Warning"), ("disk full", "Error"), ("disk full", "Warning"), ("disk full", "Error"),
+                       ("disk full", "Warning")))
+    assert labels(store) == {"disk full": "Warning"}
+
+
+def test_migrates_votes_without_row_column(tmp_path):
+    path = tmp_path / "store.sqlite"
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE votes (key BLOB NOT NULL, target_label TEXT NOT NULL, count INTEGER NOT NULL, "
+            "last_seq INTEGER NOT NULL, PRIMARY KEY (key, target_label))"
+        )
+    store = TrainingStore(path, "majority")
+    store.append(batch(("disk full", "Warning"), ("disk full", "Error")))
+    assert labels(store) == {"disk full": "Error"}
+
+
+def test_seed_if_empty_imports_once(tmp_path):
+    csv_path = tmp_path / "labeled.csv"
+    rows = batch(*[(f"message {i}", "User Action") for i in range(500)])
+    rows.to_csv(csv_path, index=False)
+    path = tmp_path / "store.sqlite"
+    TrainingStore(path)
+
+    start = threading.Barrier(8)
+
+    def seed():
+        store = TrainingStore(path)
+        start.wait()
+        return store.seed_if_empty(tmp_path / "missing.csv", csv_path)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: seed(), range(8)))
+
+    imported = [r for r in results if r is not None]
+    assert len(imported) == 1
+    assert imported[0]["inserted"] == 500
+    store = TrainingStore(path)
+    assert store.count() == 500
+    assert store.stats()["batches"] == 1
+    assert store.seed_if_empty(csv_path) is None
@@ -0,0 +1,126 @@
+"""
+Process-executor bookkeeping: metrics deltas drained in worker processes and
+merged into the server's registry, and per-worker cache stats summed for
+GET /metrics.
+
+Run with: python -m pytest -q tests
+
+Author: Your Name
+Date: February 2026
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import metrics
+import workers
+from result_cache import ResultCache
+from template_miner import TemplateCache
+
+STAGE = "test_worker_stats"
+MESSAGES = [f"message {i}" for i in range(10)]
+
+# Per worker process, like classify's caches
+_result_cache = ResultCache(100, 1 << 20)
+_template_cache = TemplateCache(50)
+
+
+def _worker_part(n_logs):
+    """Stand-in for workers._classify_part: record metrics and cache traffic, return the same tuple."""
+    metrics.mark_worker_process()
+    metrics.ROUTED_LOGS.inc(n_logs, stage=STAGE)
+    metrics.STAGE_SECONDS.observe(0.01, stage=STAGE)
+    for message in MESSAGES:
+        if _result_cache.get("src", message, "v1") is None:
+            _result_cache.put("src", message, "Label", "bert", "v1")
+        if _template_cache.get(message) is None:
+            _template_cache.put(message, "Label")
+    results = [("src", message, "Label") for message in MESSAGES[:n_logs]]
+    cache_stats = {"pid": os.getpid(), "result_cache": _result_cache.stats(), "template_cache": _template_cache.stats()}
+    return results, metrics.worker_delta(), {}, cache_stats
+
+
+@pytest.fixture
+def worker_stats(monkeypatch):
+    monkeypatch.setattr(workers, "_worker_cache_stats", {})
+    return workers._worker_cache_stats
+
+
+def test_worker_delta_only_in_workers():
+    assert metrics.worker_delta() is None
+
+
+def test_drain_resets_and_merge_adds():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("logs_total", "Logs.", ["stage"])
+    histogram = registry.histogram("seconds", "Seconds.", ["stage"])
+    counter.inc(3, stage="bert")
+    histogram.observe(0.2, stage="bert")
+
+    delta = registry.drain()
+    assert counter.values() == {}
+    assert registry.drain() == {}
+
+    registry.merge(delta)
+    registry.merge(delta)
+    counter.inc(1, stage="regex")
+    assert counter.values() == {"bert": 6, "regex": 1}
+    count, total = histogram.totals()["bert"]
+    assert count == 2 and total == pytest.approx(0.4)
+
+
+def test_process_workers_merged(worker_stats):
+    routed_before = metrics.ROUTED_LOGS.values().get(STAGE, 0)
+    timed_before = metrics.STAGE_SECONDS.totals().get(STAGE, (0, 0.0))[0]
+    sizes = [1, 2, 3, 4, 5, 6, 7, 8]
+
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn")) as pool:
+        part_results = list(pool.map(_worker_part, sizes))
+    logs = [("src", message) for n in sizes for message in MESSAGES[:n]]
+    offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+    parts = [(list(range(start, start + n)), None) for start, n in zip(offsets, sizes)]
+    merged = workers._merge(logs, parts, part_results)
+
+    assert [label for _, _, label in merged] == ["Label"] * len(logs)
+    # Every delta holds only what was recorded since the previous drain
+    assert metrics.ROUTED_LOGS.values()[STAGE] - routed_before == sum(sizes)
+    assert metrics.STAGE_SECONDS.totals()[STAGE][0] - timed_before == len(sizes)
+
+    # The latest snapshot of each worker counts, once
+    latest = {}
+    for _, _, _, stats in part_results:
+        previous = latest.get(stats["pid"])
+        if previous is None or stats["result_cache"]["hits"] > previous["result_cache"]["hits"]:
+            latest[stats["pid"]] = stats
+    assert worker_stats.keys() == latest.keys()
+
+    local = ResultCache(100, 1 << 20)
+    local.get("src", "other", "v1")
+    total = workers.cache_stats("result_cache", local.stats())
+    hits = sum(stats["result_cache"]["hits"] for stats in latest.values())
+    misses = 1 + len(latest) * len(MESSAGES)
+    assert total["processes"] == 1 + len(latest)
+    assert (total["hits"], total["misses"]) == (hits, misses)
+    assert total["size"] == len(latest) * len(MESSAGES)
+    assert total["max_entries"] == 100
+    assert total["hit_rate"] == round(hits / (hits + misses), 4)
+    assert total["by_stage"]["bert"]["computed"] == len(latest) * len(MESSAGES)
+
+    templates = workers.cache_stats("template_cache", TemplateCache(50).stats())
+    assert templates["max_size"] == 50
+    assert templates["hits"] == sum(stats["template_cache"]["hits"] for stats in latest.values())
+
+
+def test_cache_stats_keep_latest_snapshot_per_worker(worker_stats):
+    def snapshot(pid, hits, misses):
+        return {"pid": pid, "result_cache": {"hits": hits, "misses": misses, "hit_rate": 0.0, "max_entries": 100}}
+
+    parts = [([0], None)]
+    for stats in (snapshot(11, 1, 9), snapshot(11, 5, 10), snapshot(12, 0, 10)):
+        workers._merge([("src", "msg")], parts, [([("src", "msg", "Label")], None, {}, stats)])
+
+    total = workers.cache_stats("result_cache", {"hits": 0, "misses": 0, "hit_rate": 0.0, "max_entries": 100})
+    assert total == {"hits": 5, "misses": 20, "hit_rate": 0.2, "max_entries": 100, "processes": 3}
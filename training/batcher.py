@@ -0,0 +1,156 @@
+"""
+Dynamic Micro-Batching Scheduler
+
+Small /classify-json requests (one to ten logs) each paying for their own
+tiny encoder pass waste most of the transformer's throughput. The scheduler
+coalesces logs from concurrent requests into one batch - until it holds
+max_batch_size logs or the oldest waiting log has waited max_wait_ms - runs
+a single batched classification, and fans the labels back to each caller.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import defaultdict
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent classification requests into shared batches.
+
+    Callers await submit(logs); a single background task on the event loop
+    collects pending requests and dispatches each full (or timed-out) batch
+    to `process_fn` while it keeps collecting the next one.
+    """
+
+    def __init__(self, process_fn, max_batch_size, max_wait_ms):
+        """
+        Args:
+            process_fn: Async function taking a list of (source, log_msg) and
+                returning a list of (source, log_msg, label) in the same order
+            max_batch_size (int): Dispatch as soon as this many logs are pending
+            max_wait_ms (float): Dispatch at the latest this long after the first pending log arrived
+        """
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending = []  # (logs, future) in arrival order
+        self._pending_logs = 0
+        self._wakeup = None
+        self._task = None
+        self._inflight = set()  # dispatched batches; referenced so they aren't garbage collected
+        self._lock = threading.Lock()
+        # Metrics
+        self.batches = 0
+        self.requests = 0
+        self.logs = 0
+        self.max_queue_depth = 0
+        self._fill_buckets = defaultdict(int)
+
+    async def submit(self, logs):
+        """
+        Queue logs for the next batch and wait for their results.
+
+        Args:
+            logs (list): List of tuples (source, log_msg)
+
+        Returns:
+            list: List of tuples (source, log_msg, label), same order as logs
+        """
+        if not logs:
+            return []
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+        future = loop.create_future()
+        self._pending.append((list(logs), future))
+        self._pending_logs += len(logs)
+        self.max_queue_depth = max(self.max_queue_depth, self._pending_logs)
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+
+            # Wait for the batch to fill up, but never past the first request's deadline
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while self._pending_logs < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+            batch = self._take_batch()
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            if self._pending:
+                self._wakeup.set()
+
+    def _take_batch(self):
+        """Pop whole requests, in arrival order, up to max_batch_size logs (at least one request)."""
+        batch, size = [], 0
+        while self._pending:
+            logs, _ = self._pending[0]
+            if batch and size + len(logs) > self.max_batch_size:
+                break
+            batch.append(self._pending.pop(0))
+            size += len(logs)
+        self._pending_logs -= size
+        self._record_batch(len(batch), size)
+        return batch
+
+    async def _dispatch(self, batch):
+        all_logs = [log for logs, _ in batch for log in logs]
+        try:
+            results = await self.process_fn(all_logs)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for logs, future in batch:
+            if not future.done():
+                future.set_result(results[offset:offset + len(logs)])
+            offset += len(logs)
+
+    def _record_batch(self, n_requests, n_logs):
+        with self._lock:
+            self.batches += 1
+            self.requests += n_requests
+            self.logs += n_logs
+            fill = min(n_logs / self.max_batch_size, 1.0)
+            # Fill ratio histogram in 10% buckets: "0.1" means <= 10% full, ..., "1.0" means full
+            bucket = max(1, math.ceil(round(fill * 100) / 10)) / 10
+            self._fill_buckets[f"{bucket:.1f}"] += 1
+
+    def stats(self):
+        """Return queue depth, batch counts and the batch fill distribution."""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queue_depth": self._pending_logs,
+                "max_queue_depth": self.max_queue_depth,
+                "batches": self.batches,
+                "requests": self.requests,
+                "logs": self.logs,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0,
+                "avg_batch_fill": round(self.logs / (self.batches * self.max_batch_size), 4) if self.batches else 0,
+                "batch_fill_histogram": dict(sorted(self._fill_buckets.items())),
+            }
@@ -3,17 +3,72 @@ Multi-stage Log Classification Orchestrator
 
 This module coordinates the classification pipeline using multiple methods:
 1. Regex-based classification (fast, pattern-matching)
-2. BERT-based classification (ML-based, for complex patterns)
-3. LLM-based classification (for legacy systems - TODO)
+2. Lexical classification (hashed bag-of-words, for lexically obvious logs)
+3. BERT-based classification (ML-based, for complex patterns)
+4. LLM-based classification (for legacy systems), with a local or deferred
+   fallback while the LLM is failing (LLM_FALLBACK)
 
 Author: Your Name
 Date: February 2026
 """
+import random
+import time
+
 import pandas as pd
+import processor_regex
 from processor_regex import classify_with_regex
-from processor_bert import classify_with_bert
+import inference_sidecar
+import processor_bert
+from processor_bert import classify_with_bert_batch, model_signature
+import processor_lexical
+from processor_lexical import classify_with_lexical_batch
+
+from processor_llm import classify_with_llm_batch
+from llm_deferred import DeferredQueue, DEFERRED_LABEL
+from template_miner import TemplateCache, extract_template
+from result_cache import ResultCache
+import metrics
+from config import (
+    WARMUP_BATCH_SIZE,
+    LEXICAL_SHADOW_RATE,
+    TEMPLATE_CACHE_SIZE,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_TTL_SECONDS,
+    LLM_FALLBACK,
+    LLM_DEFERRED_MAX_PENDING,
+)
+
+# Template -> BERT label cache shared by classify_logs and classify_batch
+template_cache = TemplateCache(TEMPLATE_CACHE_SIZE)
+
+# (source, log_message) -> final label, in front of the whole pipeline
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL_SECONDS)
+
+# Stand-ins for an LLM answer: never cached, so the log reaches the LLM again once it is back
+FALLBACK_STAGES = ("llm_fallback", "deferred")
+
+
+def _store_deferred(source, log_msg, label):
+    """Re-classified Deferred log: the next request for it is answered from the result cache."""
+    result_cache.put(source, log_msg, label, "llm", None)
+
+
+# LegacyCRM logs labeled Deferred, re-classified in the background (LLM_FALLBACK=deferred)
+deferred_queue = DeferredQueue(LLM_DEFERRED_MAX_PENDING, _store_deferred)
+
+
+def pipeline_signature():
+    """
+    Version of everything a non-LLM label depends on: the regex rules and the
+    trained classifiers. Cached results computed under another signature are stale.
+    
+    Also picks up a changed rules file (see processor_regex.reload_if_changed),
+    so every process follows a rules reload.
+    """
+    processor_regex.reload_if_changed()
+    return (processor_regex.rules_version(), model_signature(), processor_lexical.model_signature())
 
-from processor_llm import classify_with_llm
 
 # ==================== CLASSIFICATION PIPELINE ====================
 def classify_logs(source, log_msg):
@@ -21,9 +76,14 @@ def classify_logs(source, log_msg):
     Classify a log message using a multi-stage pipeline.
     
     Classification strategy:
-    1. If source is "LegacyCRM": Use LLM-based classification (TODO)
+    0. Return the cached label if this exact (source, log_msg) was seen recently
+    1. If source is "LegacyCRM": Use LLM-based classification; if the LLM
+       gives no answer, use steps 2-5 or label it Deferred (LLM_FALLBACK)
     2. Try regex-based classification first (fast)
-    3. If regex fails, fall back to BERT-based classification
+    3. If regex fails, answer with the lexical model when it is confident
+    4. Otherwise answer from the template cache when the message's
+       template was already labeled by BERT
+    5. Otherwise fall back to BERT-based classification
     
     Args:
         source (str): The source system of the log (e.g., "ModernCRM", "LegacyCRM")
@@ -32,49 +92,236 @@ def classify_logs(source, log_msg):
     Returns:
         str: The classification label
     """
-    # LegacyCRM logs use the LLM for semantic understanding (workflow/deprecation edge cases)
-    if source == "LegacyCRM":
-        label = classify_with_llm(log_msg)
-    else:
-        # Fast path: try regex first; if no match, use BERT embeddings + Logistic Regression
-        label = classify_with_regex(log_msg)
-        if label is None:
-            label = classify_with_bert(log_msg)
-    return label
-
-
-def classify_batch(logs):
+    return classify_batch([(source, log_msg)])[0][2]
+
+
+def _classify_with_templates(log_msgs, batch_size=None, uncached_msgs=()):
+    """
+    BERT stage fronted by the template cache.
+    
+    Each message is reduced to its template; known templates are answered
+    from the cache and only one representative per unknown template is
+    encoded, with its label shared by every message of that template.
+    uncached_msgs bypass the template cache (no lookup, no counters, nothing
+    stored) and are only added to the same encoder call.
+    
+    Returns:
+        tuple: (labels, stages, uncached_labels) where each stage is "template" or "bert"
+    """
+    log_msgs, uncached_msgs = list(log_msgs), list(uncached_msgs)
+    if not template_cache.enabled:
+        labels = classify_with_bert_batch(log_msgs + uncached_msgs, batch_size=batch_size)
+        return labels[:len(log_msgs)], ["bert"] * len(log_msgs), labels[len(log_msgs):]
+    
+    template_cache.check_model(model_signature())
+    labels = [None] * len(log_msgs)
+    stages = ["template"] * len(log_msgs)
+    pending = {}  # template -> indexes of messages waiting for its label
+    t0 = time.perf_counter()
+    for i, log_msg in enumerate(log_msgs):
+        template = extract_template(log_msg)
+        if template in pending:
+            pending[template].append(i)
+            template_cache.record_hit()
+            continue
+        labels[i] = template_cache.get(template)
+        if labels[i] is None:
+            pending[template] = [i]
+    if log_msgs:
+        metrics.observe_stage("template", time.perf_counter() - t0, len(log_msgs))
+        metrics.STAGE_BATCH_LOGS.observe(len(log_msgs), stage="template")
+    
+    templates = list(pending)
+    bert_labels = classify_with_bert_batch(
+        [log_msgs[pending[t][0]] for t in templates] + uncached_msgs, batch_size=batch_size
+    )
+    for template, label in zip(templates, bert_labels):
+        template_cache.put(template, label)
+        for i in pending[template]:
+            labels[i] = label
+        stages[pending[template][0]] = "bert"
+    return labels, stages, bert_labels[len(templates):]
+
+
+def _route(logs, batch_size=None):
+    """
+    Run the regex -> lexical -> template -> BERT / LLM stages over a batch.
+    
+    Returns:
+        tuple: (labels, stages) - one label and the name of the stage that produced
+        it per log ("llm_fallback" / "deferred" for LLM rows left unanswered)
+    """
+    labels = [None] * len(logs)
+    stages = [None] * len(logs)
+    llm_rows = []
+    bert_rows = []
+    fallback_rows = []
+    
+    t0 = time.perf_counter()
+    for i, (source, log_msg) in enumerate(logs):
+        if source == "LegacyCRM":
+            llm_rows.append(i)
+            stages[i] = "llm"
+        else:
+            labels[i] = classify_with_regex(log_msg)
+            if labels[i] is None:
+                bert_rows.append(i)
+            else:
+                stages[i] = "regex"
+    if len(logs) > len(llm_rows):
+        metrics.observe_stage("regex", time.perf_counter() - t0, len(logs) - len(llm_rows))
+        metrics.STAGE_BATCH_LOGS.observe(len(logs) - len(llm_rows), stage="regex")
+    
+    # LegacyCRM logs: concurrent, rate-limited Groq requests for the whole batch
+    if llm_rows:
+        with metrics.time_stage("llm", len(llm_rows)):
+            llm_labels = classify_with_llm_batch([logs[i][1] for i in llm_rows])
+        metrics.STAGE_BATCH_LOGS.observe(len(llm_rows), stage="llm")
+        for i, label in zip(llm_rows, llm_labels):
+            if label is not None:
+                labels[i] = label
+            elif LLM_FALLBACK == "deferred":
+                labels[i] = DEFERRED_LABEL
+                stages[i] = "deferred"
+            else:
+                fallback_rows.append(i)
+        if LLM_FALLBACK == "deferred":
+            deferred_queue.add([logs[i] for i in llm_rows if stages[i] == "deferred"])
+    
+    # Unanswered LLM rows degrade to the local regex -> lexical -> template -> BERT path
+    for i in fallback_rows:
+        labels[i] = classify_with_regex(logs[i][1])
+        if labels[i] is None:
+            bert_rows.append(i)
+    
+    # Lexically obvious regex misses skip the encoder; a sample of them is
+    # still sent to BERT (shadow_rows) to measure how often the two agree.
+    # They go to the encoder itself, not through the template cache, so the
+    # agreement is with BERT and the cache's hits and entries only reflect real traffic
+    shadow_rows = []
+    if bert_rows:
+        lexical_labels = classify_with_lexical_batch([logs[i][1] for i in bert_rows])
+        remaining = []
+        for i, label in zip(bert_rows, lexical_labels):
+            if label is None:
+                remaining.append(i)
+                continue
+            labels[i] = label
+            stages[i] = "lexical"
+            if random.random() < LEXICAL_SHADOW_RATE:
+                shadow_rows.append(i)
+        bert_rows = remaining
+    
+    # One chunked encode + predict_proba for every remaining miss the template cache can't answer
+    bert_labels, bert_stages, shadow_labels = _classify_with_templates(
+        [logs[i][1] for i in bert_rows], batch_size=batch_size, uncached_msgs=[logs[i][1] for i in shadow_rows]
+    )
+    if shadow_rows:
+        processor_lexical.record_shadow([labels[i] for i in shadow_rows], shadow_labels)
+    for i, label, stage in zip(bert_rows, bert_labels, bert_stages):
+        labels[i] = label
+        stages[i] = stage
+    for i in fallback_rows:
+        stages[i] = "llm_fallback"
+    
+    return labels, stages
+
+
+def _count_routed(stage, label, n):
+    metrics.ROUTED_LOGS.inc(n, stage=stage)
+    if label == "Unclassified":
+        metrics.UNCLASSIFIED_LOGS.inc(n, stage=stage)
+
+
+def classify_batch(logs, batch_size=None):
     """
     Classify multiple logs in batch.
     
+    Same routing as classify_logs, but vectorized per stage:
+    0. Logs found in the result cache are answered directly
+    1. LegacyCRM logs go to the LLM as concurrent requests (within the
+       LLM_BATCH_TIMEOUT budget); unanswered ones get the LLM_FALLBACK
+    2. Regex runs over every remaining log
+    3. Regex misses go through one lexical predict_proba; confident answers are kept
+    4. The rest are answered from the template cache where possible
+    5. The rest go through a single batched BERT call (one message per template)
+    
     Args:
         logs (list): List of tuples (source, log_msg)
+        batch_size (int): Encoder batch size for the BERT stage (default: BERT_BATCH_SIZE)
         
     Returns:
         list: List of tuples (source, log_msg, label)
     """
-    results = []
-    for source, log_msg in logs:
-        label = classify_logs(source, log_msg)
-        results.append((source, log_msg, label))
-    return results
+    labels = [None] * len(logs)
+    signature = pipeline_signature()
+    
+    todo = {}  # (source, log_msg) -> indexes; repeats within the batch are classified once
+    for i, log in enumerate(logs):
+        log = tuple(log)
+        if log in todo:
+            todo[log].append(i)
+            continue
+        cached = result_cache.get(log[0], log[1], signature) if result_cache.enabled else None
+        if cached is None:
+            todo[log] = [i]
+        else:
+            labels[i] = cached[0]
+            _count_routed("result_cache", cached[0], 1)
+    
+    todo_logs = list(todo)
+    todo_labels, todo_stages = _route(todo_logs, batch_size=batch_size)
+    for log, label, stage in zip(todo_logs, todo_labels, todo_stages):
+        for i in todo[log]:
+            labels[i] = label
+        if stage not in FALLBACK_STAGES:
+            result_cache.put(log[0], log[1], label, stage, signature)
+        _count_routed(stage, label, len(todo[log]))
+    if logs:
+        metrics.BATCH_LOGS.observe(len(logs))
+    
+    return [(source, log_msg, label) for (source, log_msg), label in zip(logs, labels)]
+
+
+def warmup():
+    """
+    Load the models and push a dummy batch through regex and BERT so the first
+    real request doesn't pay for model loading or first-call overhead.
+    Bypasses the result and template caches so they stay empty.
+    
+    Returns:
+        float: Seconds spent warming up
+    """
+    t0 = time.perf_counter()
+    if not inference_sidecar.enabled():
+        # With a sidecar the models load there; the dummy batch below waits for it
+        processor_bert.get_encoder()
+        processor_bert.get_classifier()
+    processor_lexical.get_model()
+    dummy = [f"Warmup request {i} completed with status 200" for i in range(WARMUP_BATCH_SIZE)]
+    for log_msg in dummy:
+        classify_with_regex(log_msg)
+    classify_with_bert_batch(dummy)
+    return time.perf_counter() - t0
 
 
-def classify_csv(input_file):
+def classify_csv(input_file, output_file="resources/output.csv"):
     """
     Classify logs from a CSV file and save results.
     
     Args:
         input_file (str): Path to input CSV file with columns 'source' and 'log_message'
+        output_file (str): Where to write the CSV with the added target_label column
+            (relative paths resolve against the working directory)
     """
     df = pd.read_csv(input_file)
     logs = list(zip(df["source"], df["log_message"]))
     results = classify_batch(logs)
     df["target_label"] = [label for _, _, label in results]
-    # Write from project root; path is relative when run from training/
-    output_file = "resources/output.csv"
     df.to_csv(output_file, index=False)
     print(f"Classification complete. Results saved to {output_file}")
+
+
 # ==================== TESTING ====================
 if __name__ == "__main__":
     print("=" * 100)
@@ -0,0 +1,426 @@
+"""
+Background Classification Jobs
+
+Multi-hundred-MB uploads time out against the synchronous POST /classify.
+A job instead spools the upload (any format table_io reads) to its own
+directory under CLASSIFY_JOBS_DIR and returns at once; a background thread
+reads the file CLASSIFY_JOB_CHUNK_SIZE rows at a time and keeps up to
+CLASSIFY_JOB_PARALLEL_CHUNKS chunks in flight on the worker pools. Each
+finished chunk is spilled to a part file, so memory is bounded by the
+chunks in flight; at the end the parts are joined into the job's own
+result file, in the upload's format unless another one was asked for.
+Progress is reported as the fraction of the input read.
+
+Finished jobs (and their files) expire CLASSIFY_JOB_TTL_SECONDS after they
+finish. job.json in each job directory is rewritten on every update and is
+the state other server workers see: a job this process doesn't hold is read
+from disk, and cancelling one another worker runs leaves a marker file that
+worker picks up at its next chunk. Finished jobs survive a server restart;
+at startup, jobs whose owning process no longer exists are marked failed.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import metrics
+import table_io
+import workers
+from config import (
+    CLASSIFY_JOBS_DIR,
+    CLASSIFY_JOB_CHUNK_SIZE,
+    CLASSIFY_JOB_PARALLEL_CHUNKS,
+    CLASSIFY_JOB_CONCURRENCY,
+    CLASSIFY_JOB_TTL_SECONDS,
+)
+
+FINISHED = ("succeeded", "failed", "cancelled")
+# Dropped into a job's directory to cancel it from another server worker
+CANCEL_MARKER = "cancel"
+_JOB_ID = re.compile(r"^cjob-\d+-[0-9a-f]{8}$")
+# How often cleanup() also sweeps jobs only on disk (other workers' / earlier runs')
+_DISK_SWEEP_SECONDS = 60
+
+_executor = ThreadPoolExecutor(max_workers=CLASSIFY_JOB_CONCURRENCY, thread_name_prefix="classify-job")
+# Chunk tasks of all running jobs; each one fans its chunk out over the worker pools
+_chunk_pool = ThreadPoolExecutor(
+    max_workers=CLASSIFY_JOB_CONCURRENCY * CLASSIFY_JOB_PARALLEL_CHUNKS, thread_name_prefix="classify-chunk"
+)
+_jobs = OrderedDict()  # job_id -> job dict, for the jobs this process runs (or recovered)
+_inflight = {}  # job_id -> set of its chunk futures
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_last_sweep = 0.0
+
+
+class JobNotFinished(Exception):
+    """The job's result was requested before the job succeeded."""
+
+
+# ==================== JOB STATE ====================
+def _job_dir(job_id):
+    return Path(CLASSIFY_JOBS_DIR) / job_id
+
+
+def _save(job):
+    """Rewrite job.json atomically (called with _lock held)."""
+    path = _job_dir(job["id"]) / "job.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(job, indent=2))
+    os.replace(tmp, path)
+
+
+def _update(job_id, **fields):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        if fields.get("status") in FINISHED:
+            job["finished_at"] = time.time()
+            job["expires_at"] = job["finished_at"] + CLASSIFY_JOB_TTL_SECONDS
+        _save(job)
+
+
+def _cancelled(job_id):
+    """True once the job was cancelled, here or (by marker file) from another server worker."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["status"] == "cancelled":
+            return True
+        if not (_job_dir(job_id) / CANCEL_MARKER).exists():
+            return False
+        job["status"] = "cancelled"
+        _save(job)
+        del _jobs[job_id]
+        for future in _inflight.get(job_id, ()):
+            future.cancel()
+        return True
+
+
+def _expired(job, now):
+    return job["status"] in FINISHED and job.get("expires_at") is not None and job["expires_at"] <= now
+
+
+def _owner_alive(job):
+    """
+    True if the server process running the job still exists. Used for jobs
+    this process doesn't hold, so its own pid means a previous process's.
+    """
+    pid = job.get("owner_pid")
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+def _load(job_id):
+    """A job this process doesn't hold, read from its job.json; None if unknown or expired."""
+    if not _JOB_ID.match(job_id):
+        return None
+    try:
+        job = json.loads((_job_dir(job_id) / "job.json").read_text())
+    except (OSError, ValueError):
+        return None
+    return None if _expired(job, time.time()) else job
+
+
+# ==================== RUNNER ====================
+def _classify_chunk(job_id, index, chunk):
+    """Classify one chunk and spill it to its part file. Returns (rows, label counts)."""
+    results = workers.classify_batch_parallel(list(zip(chunk["source"], chunk["log_message"])))
+    chunk["target_label"] = [label for _, _, label in results]
+    chunk.to_csv(_job_dir(job_id) / f"part-{index:06d}.csv", index=False, header=index == 0)
+    return len(chunk), chunk["target_label"].value_counts().to_dict()
+
+
+def _result_path(job):
+    return _job_dir(job["id"]) / f"result{table_io.suffix(job['output_format'])}"
+
+
+def _join_parts(job, n_parts):
+    """Join the part files, in order, into the result file."""
+    parts = [_job_dir(job["id"]) / f"part-{index:06d}.csv" for index in range(n_parts)]
+    path = _result_path(job)
+    tmp = path.with_name(path.name + ".tmp")
+    table_io.join_csv_parts(parts, tmp, job["output_format"])
+    os.replace(tmp, path)
+    for part in parts:
+        part.unlink()
+
+
+def _run(job_id):
+    job_dir = _job_dir(job_id)
+    if _cancelled(job_id):
+        # Cancelled while queued
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return
+    job = get(job_id)
+    input_path = job_dir / f"input{table_io.suffix(job['format'])}"
+    _update(job_id, status="running", started_at=time.time())
+    t0 = time.perf_counter()
+    inflight = set()  # changed under _lock only, so cancel() can cancel its futures
+    with _lock:
+        _inflight[job_id] = inflight
+    try:
+        rows = 0
+        chunks_done = 0
+        progress = 0.0
+        with open(input_path, "rb") as f:
+            n_parts = 0
+            for index, (chunk, fraction) in enumerate(table_io.iter_tables(f, job["format"], CLASSIFY_JOB_CHUNK_SIZE)):
+                if _cancelled(job_id):
+                    return
+                future = _chunk_pool.submit(_classify_chunk, job_id, index, chunk)
+                with _lock:
+                    inflight.add(future)
+                n_parts = index + 1
+                if fraction is not None:
+                    progress = round(min(fraction, 0.99), 4)
+                # Bounded memory: wait for a chunk to finish before reading past the limit
+                while len(inflight) >= CLASSIFY_JOB_PARALLEL_CHUNKS:
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    with _lock:
+                        inflight -= done
+                    if _cancelled(job_id):
+                        return
+                    rows, chunks_done = _collect(done, rows, chunks_done)
+                    _update(job_id, rows=rows, chunks=chunks_done, progress=progress)
+            done, _ = wait(inflight)
+            with _lock:
+                inflight -= done
+            if _cancelled(job_id):
+                return
+            rows, chunks_done = _collect(done, rows, chunks_done)
+        _join_parts(job, n_parts)
+        input_path.unlink()
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint="classify_job")
+        _update(job_id, status="succeeded", rows=rows, chunks=chunks_done, progress=1.0)
+    except Exception as e:
+        _update(job_id, status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        with _lock:
+            _inflight.pop(job_id, None)
+            pending = list(inflight)
+        for future in pending:
+            future.cancel()
+        # Chunks already running finish before their directory is removed
+        wait(pending)
+        if _cancelled(job_id):
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def _collect(done, rows, chunks_done):
+    """Add finished chunk tasks to the job totals (re-raises a chunk's error)."""
+    for future in done:
+        if future.cancelled():
+            continue
+        chunk_rows, label_counts = future.result()
+        rows += chunk_rows
+        chunks_done += 1
+        for label, count in label_counts.items():
+            metrics.LABELS.inc(count, label=label)
+    return rows, chunks_done
+
+
+# ==================== PUBLIC API ====================
+def submit(upload, filename, output_format=None):
+    """
+    Spool an upload to a new job directory and queue the job.
+
+    Args:
+        upload: Binary file object with the input
+        filename (str): Original file name; its suffix selects the input format
+        output_format (str): Result format (see table_io.FORMATS); None = the input's
+
+    Returns:
+        dict: The new job (status "queued")
+
+    Raises:
+        ValueError: If the format is not supported or the input lacks the
+            source / log_message columns
+        table_io.FormatUnavailable: If a format's optional dependency is missing
+    """
+    fmt = table_io.check_format(table_io.detect_format(filename))
+    output_format = table_io.check_format(output_format or fmt)
+    cleanup()
+    job_id = f"cjob-{next(_ids):05d}-{uuid.uuid4().hex[:8]}"
+    job_dir = _job_dir(job_id)
+    job_dir.mkdir(parents=True)
+    input_path = job_dir / f"input{table_io.suffix(fmt)}"
+    try:
+        with open(input_path, "wb") as out:
+            shutil.copyfileobj(upload, out, 1024 * 1024)
+        table_io.check_columns(input_path, fmt)
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    with _lock:
+        _jobs[job_id] = job = {
+            "id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "format": fmt,
+            "output_format": output_format,
+            "input_bytes": input_path.stat().st_size,
+            "progress": 0.0,
+            "rows": 0,
+            "chunks": 0,
+            "created_at": time.time(),
+            "owner_pid": os.getpid(),
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "error": None,
+        }
+        _save(job)
+        job = dict(job)
+    _executor.submit(_run, job_id)
+    return job
+
+
+def get(job_id):
+    """Return a copy of one job (read from disk if another server worker runs it), or None if it is unknown or expired."""
+    cleanup()
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            return dict(job)
+    return _load(job_id)
+
+
+def list_jobs():
+    """Return all known jobs, of every server worker, newest first."""
+    cleanup()
+    with _lock:
+        jobs = {job_id: dict(job) for job_id, job in _jobs.items()}
+    root = Path(CLASSIFY_JOBS_DIR)
+    if root.exists():
+        for path in root.glob("*/job.json"):
+            if path.parent.name not in jobs:
+                job = _load(path.parent.name)
+                if job is not None:
+                    jobs[job["id"]] = job
+    return sorted(jobs.values(), key=lambda job: job["created_at"], reverse=True)
+
+
+def result_file(job_id):
+    """
+    A succeeded job's classified file.
+
+    Returns:
+        tuple: (path, download file name, media type)
+
+    Raises:
+        KeyError: If the job is unknown or expired
+        JobNotFinished: If the job has not succeeded (yet)
+    """
+    job = get(job_id)
+    if job is None:
+        raise KeyError(f"Unknown classification job: {job_id}")
+    if job["status"] != "succeeded":
+        raise JobNotFinished(f"Job {job_id} is {job['status']}")
+    fmt = job["output_format"]
+    filename = f"classified_{Path(table_io.stem(job['filename'])).name}{table_io.suffix(fmt)}"
+    return _result_path(job), filename, table_io.media_type(fmt)
+
+
+def cancel(job_id):
+    """
+    Cancel a queued or running job, or delete a finished one, with its files.
+
+    Chunks of a running job that have not started are cancelled at once; the
+    runner stops after the running ones and removes the directory. A job
+    another server worker runs is cancelled through a marker file.
+
+    Raises:
+        KeyError: If the job is unknown or expired
+    """
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            running = job["status"] in ("queued", "running")
+            if running:
+                job["status"] = "cancelled"
+                _save(job)
+                for future in _inflight.get(job_id, ()):
+                    future.cancel()
+            del _jobs[job_id]
+    if job is None:
+        job = _load(job_id)
+        if job is None:
+            raise KeyError(f"Unknown classification job: {job_id}")
+        running = job["status"] in ("queued", "running") and _owner_alive(job)
+        if running:
+            (_job_dir(job_id) / CANCEL_MARKER).touch()
+    if not running:
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+
+
+def cleanup():
+    """
+    Delete finished jobs past their expiry time, with their files. Jobs only
+    on disk are swept at most every _DISK_SWEEP_SECONDS.
+    """
+    global _last_sweep
+    now = time.time()
+    with _lock:
+        expired = [job_id for job_id, job in _jobs.items() if _expired(job, now)]
+        for job_id in expired:
+            del _jobs[job_id]
+        sweep = now - _last_sweep >= _DISK_SWEEP_SECONDS
+        if sweep:
+            _last_sweep = now
+    root = Path(CLASSIFY_JOBS_DIR)
+    if sweep and root.exists():
+        for path in root.glob("*/job.json"):
+            try:
+                job = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if _expired(job, now) and job.get("id") not in expired:
+                expired.append(job["id"])
+    for job_id in expired:
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    return len(expired)
+
+
+def recover():
+    """
+    Take over the jobs left in CLASSIFY_JOBS_DIR by server processes that no
+    longer exist (called at startup). Their unfinished jobs are marked
+    failed; jobs of live server workers are left to them.
+    """
+    root = Path(CLASSIFY_JOBS_DIR)
+    if not root.exists():
+        return
+    for path in sorted(root.glob("*/job.json")):
+        try:
+            job = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if job["status"] in FINISHED or _owner_alive(job):
+            continue  # read from disk on access
+        job.update(status="failed", error="Interrupted by a server restart", finished_at=time.time())
+        job["expires_at"] = job["finished_at"] + CLASSIFY_JOB_TTL_SECONDS
+        with _lock:
+            _jobs[job["id"]] = job
+            _save(job)
+    cleanup()
@@ -0,0 +1,229 @@
+"""
+Runtime configuration for the log classification pipeline.
+
+All settings are read from environment variables (or training/.env) so the
+server, the CLI scripts and the retrain job share the same knobs.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Same .env file that processor_llm reads for GROQ_API_KEY
+load_dotenv(dotenv_path=Path(__file__).parent / '.env')
+
+
+def _env_int(name, default):
+    """Read an integer setting, falling back to default when unset or empty."""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    """Read a boolean setting ("1", "true", "yes", "on" are true)."""
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_float(name, default):
+    """Read a float setting, falling back to default when unset or empty."""
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+# ==================== REGEX STAGE ====================
+# Ordered JSON list of {"pattern", "label"} rules; reloadable at runtime
+REGEX_RULES_PATH = Path(os.getenv("REGEX_RULES_PATH") or Path(__file__).parent / "regex_rules.json")
+
+
+# ==================== BERT STAGE ====================
+# Sentence encoder used for inference and retraining
+ENCODER_MODEL_NAME = os.getenv("ENCODER_MODEL_NAME", "all-MiniLM-L6-v2")
+# Encoder backend: "torch" (SentenceTransformer) or "onnx" (ONNX Runtime export)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch").strip().lower()
+# ONNX backend: export directory (see export_onnx.py), int8 variant and thread count
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR") or Path(__file__).parent.parent / "models" / "onnx")
+ONNX_QUANTIZED = _env_bool("ONNX_QUANTIZED", False)
+ONNX_INTRA_OP_THREADS = _env_int("ONNX_INTRA_OP_THREADS", 0)
+# Number of messages per SentenceTransformer forward pass in batch mode
+BERT_BATCH_SIZE = _env_int("BERT_BATCH_SIZE", 64)
+# Group messages of similar token counts into the same forward pass, so short lines aren't padded to long ones
+ENCODER_LENGTH_BUCKETING = _env_bool("ENCODER_LENGTH_BUCKETING", True)
+# Longer messages are cut to this many tokens (capped by the model's limit), keeping head and tail...
+# 0: cut at the model's limit, keeping the head, like the encoder itself - the vectors the
+# deployed classifier was trained on. Retrain after setting it.
+ENCODER_MAX_TOKENS = _env_int("ENCODER_MAX_TOKENS", 0)
+# ...of which this many come from the end of the message
+ENCODER_TRUNCATE_TAIL_TOKENS = _env_int("ENCODER_TRUNCATE_TAIL_TOKENS", 64)
+
+
+# ==================== LEXICAL STAGE ====================
+# Hashed bag-of-words model between regex and BERT, trained by retrain.py
+LEXICAL_ENABLED = _env_bool("LEXICAL_ENABLED", True)
+LEXICAL_N_FEATURES = _env_int("LEXICAL_N_FEATURES", 2 ** 18)
+# Its threshold is the lowest confidence at which held-out answers are this precise...
+LEXICAL_TARGET_PRECISION = _env_float("LEXICAL_TARGET_PRECISION", 0.98)
+# ...but never lower than this (also used when retraining without a holdout)
+LEXICAL_MIN_CONFIDENCE = _env_float("LEXICAL_MIN_CONFIDENCE", 0.8)
+# Fraction of lexically answered logs also sent to BERT to measure agreement
+LEXICAL_SHADOW_RATE = _env_float("LEXICAL_SHADOW_RATE", 0.02)
+
+
+# ==================== EMBEDDING STORE ====================
+# On-disk message -> embedding store shared by retraining and inference
+EMBEDDING_STORE_DIR = Path(os.getenv("EMBEDDING_STORE_DIR") or Path(__file__).parent.parent / "models" / "embeddings")
+# Stored precision: "float32" (exact) or "float16" (half the disk / page cache)
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32").strip().lower()
+# Retraining reuses stored vectors and stores the ones it encodes
+EMBEDDING_STORE_RETRAIN = _env_bool("EMBEDDING_STORE_RETRAIN", True)
+# Inference: "off", "read" (reuse stored vectors) or "readwrite" (also store new messages)
+EMBEDDING_STORE_INFERENCE = os.getenv("EMBEDDING_STORE_INFERENCE", "read").strip().lower()
+
+
+# ==================== RETRAINING ====================
+# Deduplicated, append-only store of labeled examples (SQLite)
+TRAINING_STORE_PATH = Path(os.getenv("TRAINING_STORE_PATH") or Path(__file__).parent.parent / "dataset" / "training_store.sqlite")
+# Label kept when a message is submitted again with another label: "latest", "first" or "majority"
+TRAINING_CONFLICT_POLICY = os.getenv("TRAINING_CONFLICT_POLICY", "latest").strip().lower()
+# Examples per chunk when retraining streams from the store
+TRAINING_READ_CHUNK_SIZE = _env_int("TRAINING_READ_CHUNK_SIZE", 10000)
+# Fraction of rows held out to report validation accuracy (0 skips the extra fit)
+RETRAIN_HOLDOUT_FRACTION = _env_float("RETRAIN_HOLDOUT_FRACTION", 0.2)
+# "batch" fits LogisticRegression on every embedding at once; "streaming" reads, encodes
+# and fits chunk by chunk (SGDClassifier.partial_fit), so memory does not grow with the data
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "batch").strip().lower()
+# Streaming mode: passes over the training data...
+RETRAIN_STREAMING_EPOCHS = _env_int("RETRAIN_STREAMING_EPOCHS", 3)
+# ...whether to continue from the deployed model instead of starting from scratch...
+RETRAIN_WARM_START = _env_bool("RETRAIN_WARM_START", False)
+# ...and held-out rows kept to calibrate the lexical threshold (accuracy counts them all)
+RETRAIN_CALIBRATION_ROWS = _env_int("RETRAIN_CALIBRATION_ROWS", 100000)
+# Finished retrain jobs kept in memory for GET /retrain/jobs
+RETRAIN_JOB_HISTORY = _env_int("RETRAIN_JOB_HISTORY", 50)
+
+
+# ==================== TEMPLATE CACHE ====================
+# Max templates remembered by the template -> label cache (0 disables it)
+TEMPLATE_CACHE_SIZE = _env_int("TEMPLATE_CACHE_SIZE", 10000)
+
+
+# ==================== RESULT CACHE ====================
+# LRU cache of final labels keyed on (source, log_message); 0 entries disables it
+RESULT_CACHE_SIZE = _env_int("RESULT_CACHE_SIZE", 50000)
+RESULT_CACHE_MAX_BYTES = _env_int("RESULT_CACHE_MAX_MB", 64) * 1024 * 1024
+# Entry lifetime in seconds; 0 keeps entries until evicted or invalidated
+RESULT_CACHE_TTL_SECONDS = _env_float("RESULT_CACHE_TTL_SECONDS", 0)
+
+
+# ==================== LLM STAGE ====================
+# Groq model name; see https://console.groq.com/docs/models
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+# Maximum concurrent chat-completion requests per process (shared by all batches)
+LLM_CONCURRENCY = _env_int("LLM_CONCURRENCY", 8)
+# Client-side rate limit in requests per second (0 = unlimited)
+LLM_REQUESTS_PER_SECOND = _env_float("LLM_REQUESTS_PER_SECOND", 10)
+# Retries per request on rate limits, timeouts, connection errors and 5xx
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 3)
+# Log messages packed into one prompt (1 = one prompt per message)
+LLM_PACK_SIZE = _env_int("LLM_PACK_SIZE", 1)
+# Seconds before one chat-completion request is abandoned (the Groq SDK waits 60)
+LLM_REQUEST_TIMEOUT = _env_float("LLM_REQUEST_TIMEOUT", 10)
+# Latency budget of the whole LLM stage of one classify_batch call, retries
+# included (0 = none); logs still waiting when it runs out get the fallback
+LLM_BATCH_TIMEOUT = _env_float("LLM_BATCH_TIMEOUT", 30)
+# Circuit breaker: consecutive failed requests that open it (0 disables it) and
+# seconds it stays open before one probe request may close it again
+LLM_BREAKER_FAILURES = _env_int("LLM_BREAKER_FAILURES", 5)
+LLM_BREAKER_RESET_SECONDS = _env_float("LLM_BREAKER_RESET_SECONDS", 30)
+# LegacyCRM logs the LLM did not answer: "local" (regex -> lexical -> BERT) or
+# "deferred" (labeled Deferred now, re-classified in the background)
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "local").strip().lower()
+# Deferred logs waiting for the re-classifier (the oldest are dropped beyond it)
+LLM_DEFERRED_MAX_PENDING = _env_int("LLM_DEFERRED_MAX_PENDING", 10000)
+# Seconds between re-classification attempts while the LLM is unavailable
+LLM_DEFERRED_RETRY_SECONDS = _env_float("LLM_DEFERRED_RETRY_SECONDS", 15)
+# Re-classification attempts per deferred log before it is dropped
+LLM_DEFERRED_MAX_ATTEMPTS = _env_int("LLM_DEFERRED_MAX_ATTEMPTS", 5)
+# Persistent LLM response cache (SQLite), shared across restarts and server workers
+LLM_CACHE_ENABLED = _env_bool("LLM_CACHE_ENABLED", True)
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH") or Path(__file__).parent.parent / "models" / "llm_cache.sqlite")
+# Rows kept on disk (least recently used evicted beyond it) and in memory (loaded at startup)
+LLM_CACHE_MAX_ENTRIES = _env_int("LLM_CACHE_MAX_ENTRIES", 200000)
+LLM_CACHE_MEMORY_ENTRIES = _env_int("LLM_CACHE_MEMORY_ENTRIES", 20000)
+# Message normalization of the cache key: "whitespace" or "template" (IDs / numbers masked)
+LLM_CACHE_NORMALIZE = os.getenv("LLM_CACHE_NORMALIZE", "whitespace").strip().lower()
+
+
+# ==================== SERVER ====================
+# Where non-LegacyCRM classification runs: "thread" (in-process) or "process"
+# (a pool of worker processes, each with its own preloaded model)
+CLASSIFY_EXECUTOR = os.getenv("CLASSIFY_EXECUTOR", "thread").strip().lower()
+CLASSIFY_WORKERS = _env_int("CLASSIFY_WORKERS", min(4, os.cpu_count() or 1))
+# Threads for Groq I/O and other blocking calls (uploads, retraining)
+IO_WORKERS = _env_int("IO_WORKERS", 8)
+# Load models and run a dummy batch of this many logs in the background at startup
+WARMUP_ON_STARTUP = _env_bool("WARMUP_ON_STARTUP", True)
+WARMUP_BATCH_SIZE = _env_int("WARMUP_BATCH_SIZE", 8)
+# Rows per chunk when POST /classify?stream=true reads and classifies an upload
+CSV_CHUNK_SIZE = _env_int("CSV_CHUNK_SIZE", 5000)
+
+
+# ==================== INFERENCE SIDECAR ====================
+# Unix socket of the model-serving sidecar (training/inference_sidecar.py). When set,
+# encoding and BERT classification run there instead of in every server worker,
+# which then never load the models; empty keeps them in-process
+INFERENCE_SIDECAR_SOCKET = os.getenv("INFERENCE_SIDECAR_SOCKET", "").strip()
+# Model processes the sidecar runs; with more than one, process i listens on <socket>.<i>
+INFERENCE_SIDECAR_PROCESSES = _env_int("INFERENCE_SIDECAR_PROCESSES", 1)
+# Shared secret checked on connect (requests and replies are pickled). Empty: the
+# sidecar generates one on first start, in the socket's directory (see inference_sidecar.py)
+INFERENCE_SIDECAR_AUTHKEY = os.getenv("INFERENCE_SIDECAR_AUTHKEY", "").encode()
+# How long a worker keeps retrying to reach a sidecar that is not up yet...
+INFERENCE_SIDECAR_CONNECT_TIMEOUT = _env_float("INFERENCE_SIDECAR_CONNECT_TIMEOUT", 30)
+# ...and how long it waits for a reply
+INFERENCE_SIDECAR_REQUEST_TIMEOUT = _env_float("INFERENCE_SIDECAR_REQUEST_TIMEOUT", 300)
+
+
+# ==================== MICRO-BATCHING ====================
+# /classify-json requests are coalesced into shared batches of up to this many logs...
+MICROBATCH_MAX_SIZE = _env_int("MICROBATCH_MAX_SIZE", BERT_BATCH_SIZE)
+# ...waiting at most this long for a batch to fill (0 disables coalescing)
+MICROBATCH_MAX_WAIT_MS = _env_float("MICROBATCH_MAX_WAIT_MS", 5)
+
+
+# ==================== NDJSON STREAMING ====================
+# POST /classify-ndjson and ndjson_stream.py classify up to this many records per batch...
+NDJSON_BATCH_SIZE = _env_int("NDJSON_BATCH_SIZE", 256)
+# ...and flush a partial batch once its oldest record has waited this long
+NDJSON_MAX_WAIT_MS = _env_float("NDJSON_MAX_WAIT_MS", 200)
+
+
+# ==================== CLASSIFY JOBS ====================
+# POST /classify/jobs: each job's upload, spilled parts and result live under this directory
+CLASSIFY_JOBS_DIR = Path(os.getenv("CLASSIFY_JOBS_DIR") or Path(__file__).parent.parent / "jobs")
+# Rows read and classified per chunk...
+CLASSIFY_JOB_CHUNK_SIZE = _env_int("CLASSIFY_JOB_CHUNK_SIZE", 20000)
+# ...and chunks of one job classified at the same time (bounds a job's memory)
+CLASSIFY_JOB_PARALLEL_CHUNKS = _env_int("CLASSIFY_JOB_PARALLEL_CHUNKS", 2)
+# Jobs running at the same time; further jobs wait in the queue
+CLASSIFY_JOB_CONCURRENCY = _env_int("CLASSIFY_JOB_CONCURRENCY", 2)
+# Finished jobs and their result files are deleted this long after they finish
+CLASSIFY_JOB_TTL_SECONDS = _env_float("CLASSIFY_JOB_TTL_SECONDS", 24 * 3600)
+
+# ==================== REQUEST TRACING ====================
+# Requests slower than this are written to the slow-request log (0 disables it)
+SLOW_REQUEST_MS = _env_float("SLOW_REQUEST_MS", 5000)
+# Rotating JSON-lines log of slow requests with their per-stage timing
+SLOW_REQUEST_LOG_PATH = Path(os.getenv("SLOW_REQUEST_LOG_PATH") or Path(__file__).parent.parent / "logs" / "slow_requests.log")
+SLOW_REQUEST_LOG_MAX_BYTES = _env_int("SLOW_REQUEST_LOG_MAX_MB", 10) * 1024 * 1024
+SLOW_REQUEST_LOG_BACKUPS = _env_int("SLOW_REQUEST_LOG_BACKUPS", 5)
+# Run every request's classification under cProfile and keep the profile of slow ones
+SLOW_REQUEST_PROFILE = _env_bool("SLOW_REQUEST_PROFILE", False)
+# Traced (debug timing or slow) requests kept in memory for GET /debug/traces/{id}
+TRACE_HISTORY = _env_int("TRACE_HISTORY", 100)
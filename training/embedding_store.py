@@ -0,0 +1,340 @@
+"""
+Persistent Embedding Store
+
+On-disk cache of sentence embeddings keyed by a hash of the log message, so
+retraining only encodes rows it has never seen and inference can reuse
+vectors for messages that were already encoded.
+
+Layout (one directory):
+    meta.json       - encoder id, dimension and dtype the vectors were made
+                      with, and the data directory currently in use
+    vN/keys.bin     - appended 16-byte BLAKE2b digests of the messages
+    vN/vectors.bin  - appended float32/float16 rows, memory-mapped for reading
+
+Rows are only ever appended (vectors first, then the key), so a crash can at
+worst leave a trailing partial row that is ignored on the next open. A reset
+(the encoder changed, so the stored vectors are stale) or a compaction writes
+a new data directory and then swaps meta.json in one os.replace; files other
+processes may have memory-mapped are never truncated or rewritten, and each
+process moves to the new directory on its next lookup. Writes take an
+exclusive file lock, so the retrain job and inference workers in other
+processes can share one store.
+
+Usage:
+  python training/embedding_store.py stats
+  python training/embedding_store.py compact [--keep exported_training.csv]
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+KEY_BYTES = 16
+
+
+def message_key(log_message):
+    """Stable 16-byte key of a log message."""
+    return hashlib.blake2b(str(log_message).encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only, memory-mapped message -> embedding store.
+    """
+
+    def __init__(self, path, encoder_id, dim=None, dtype="float32"):
+        """
+        Args:
+            path (str or Path): Store directory (created if missing)
+            encoder_id (str): Identifies the encoder; a different id invalidates stored vectors
+            dim (int): Embedding dimension (None: taken from the store or the first add)
+            dtype (str): On-disk dtype, "float32" or "float16"
+        """
+        self.path = Path(path)
+        self.encoder_id = encoder_id
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._meta_path = self.path / "meta.json"
+        self._lock = threading.Lock()
+        self._meta_inode = None  # meta.json last read
+        self._data = None  # data directory in use, None while the store has no vectors of this encoder
+        self._index = {}
+        self._vectors = None
+        self.reset_reason = None
+        self.hits = 0
+        self.misses = 0
+
+        with self._lock:
+            self._refresh()
+
+    # ---------- file handling ----------
+    @contextmanager
+    def _file_lock(self):
+        with open(self.path / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _meta(self):
+        return {"encoder": self.encoder_id, "dim": self.dim, "dtype": self.dtype.name}
+
+    def _read_meta(self):
+        """Stored meta and the inode it was read from, or (None, None) for a new store."""
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f), os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return None, None
+
+    def _matches(self, stored):
+        """True if the stored vectors were made by this encoder, in this format."""
+        return (stored["encoder"], stored["dtype"]) == (self.encoder_id, self.dtype.name) and (
+            self.dim is None or stored["dim"] == self.dim
+        )
+
+    def _refresh(self):
+        """Pick up rows appended, and new data directories written, since the last refresh (by any process)."""
+        try:
+            inode = self._meta_path.stat().st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._meta_inode:
+            stored, self._meta_inode = self._read_meta()
+            # Stores written before versioned directories keep their files next to meta.json
+            data = stored.get("data", ".") if stored is not None and self._matches(stored) else None
+            if data is not None:
+                self.dim = stored["dim"]
+            if data != self._data:
+                # Reset or compacted: row numbers changed
+                self._data, self._index, self._vectors = data, {}, None
+        if self._data is None:
+            return
+        data_dir = self.path / self._data
+        row_bytes = self.dim * self.dtype.itemsize
+        try:
+            count = min(
+                (data_dir / "keys.bin").stat().st_size // KEY_BYTES,
+                (data_dir / "vectors.bin").stat().st_size // row_bytes,
+            )
+            if count < len(self._index):
+                self._index = {}
+            known = len(self._index)
+            if count > known:
+                with open(data_dir / "keys.bin", "rb") as f:
+                    f.seek(known * KEY_BYTES)
+                    data = f.read((count - known) * KEY_BYTES)
+                for row in range(count - known):
+                    self._index[data[row * KEY_BYTES:(row + 1) * KEY_BYTES]] = known + row
+            if count == 0:
+                self._vectors = None
+            elif self._vectors is None or len(self._vectors) != count or known == 0:
+                self._vectors = np.memmap(data_dir / "vectors.bin", dtype=self.dtype, mode="r", shape=(count, self.dim))
+        except FileNotFoundError:
+            # Replaced by a newer directory since meta.json was read: keep the
+            # current view (its memory map stays valid) until the next refresh
+            pass
+
+    def _new_version(self, chunks=()):
+        """
+        Write a new data directory and make it current. Called under both locks.
+
+        The previous directories are removed only after meta.json points at the
+        new one; a process still mapping their files keeps reading valid data.
+
+        Args:
+            chunks: Iterable of (key bytes, vector rows) to write, in row order
+        """
+        versions = [int(p.name[1:]) for p in self.path.glob("v*") if p.is_dir() and p.name[1:].isdigit()]
+        name = f"v{max(versions, default=0) + 1}"
+        data_dir = self.path / name
+        data_dir.mkdir()
+        with open(data_dir / "vectors.bin", "wb") as vectors_file, open(data_dir / "keys.bin", "wb") as keys_file:
+            for keys, rows in chunks:
+                vectors_file.write(np.asarray(rows, dtype=self.dtype).tobytes())
+                keys_file.write(keys)
+            for f in (vectors_file, keys_file):
+                f.flush()
+                os.fsync(f.fileno())
+        tmp_meta = self._meta_path.with_suffix(".json.tmp")
+        tmp_meta.write_text(json.dumps({**self._meta(), "data": name}, indent=2))
+        os.replace(tmp_meta, self._meta_path)
+        for p in self.path.glob("v*"):
+            if p.is_dir() and p.name != name:
+                shutil.rmtree(p, ignore_errors=True)
+        for legacy in ("keys.bin", "vectors.bin"):
+            (self.path / legacy).unlink(missing_ok=True)
+        self._refresh()
+
+    # ---------- public API ----------
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, log_messages):
+        """
+        Find stored embeddings.
+
+        Rows are looked up and read from the memory map under one lock, so a
+        compaction or reset picked up by another thread can't renumber them
+        in between.
+
+        Returns:
+            tuple: (found, vectors, missing) - indexes of the messages in the
+            store, their float32 vectors in the same order, and the indexes of
+            the messages not in the store
+        """
+        with self._lock:
+            self._refresh()
+            rows = np.array([self._index.get(message_key(m), -1) for m in log_messages], dtype=np.int64)
+            found = np.flatnonzero(rows >= 0)
+            if len(found):
+                vectors = np.asarray(self._vectors[rows[found]], dtype=np.float32)
+            else:
+                vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+            missing = np.flatnonzero(rows < 0).tolist()
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, vectors, missing
+
+    def add(self, log_messages, embeddings):
+        """
+        Append embeddings for messages not yet stored.
+
+        Args:
+            log_messages (list): Messages
+            embeddings (ndarray): (n, dim) embeddings, same order
+        """
+        embeddings = np.asarray(embeddings).reshape(len(log_messages), -1)
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._data is None:
+                # First vectors of a new store, or the stored ones came from another encoder
+                stored, _ = self._read_meta()
+                if stored is not None:
+                    self.reset_reason = f"encoder changed: {stored} -> {self._meta()}"
+                if self.dim is None:
+                    self.dim = embeddings.shape[1]
+                self._new_version()
+            new_keys, new_rows, seen = [], [], set()
+            for message, vector in zip(log_messages, embeddings):
+                key = message_key(message)
+                if key in self._index or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return 0
+            data_dir = self.path / self._data
+            # Vectors before keys: a key on disk always has its vector
+            with open(data_dir / "vectors.bin", "ab") as f:
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(data_dir / "keys.bin", "ab") as f:
+                f.write(b"".join(new_keys))
+            self._refresh()
+            return len(new_keys)
+
+    def encode(self, log_messages, encode_fn, batch_size=None, write=True):
+        """
+        Return embeddings for all messages, encoding only the ones not in the store.
+
+        Args:
+            log_messages (list): Messages to embed
+            encode_fn: Function (messages, batch_size) -> (n, dim) embeddings
+            batch_size (int): Passed to encode_fn
+            write (bool): Store the newly encoded embeddings
+
+        Returns:
+            ndarray: (n, dim) float32 embeddings in input order
+        """
+        log_messages = list(log_messages)
+        found, vectors, missing = self.lookup(log_messages)
+        if len(missing) == len(log_messages):
+            result = np.asarray(encode_fn(log_messages, batch_size), dtype=np.float32)
+            if write and log_messages:
+                self.add(log_messages, result)
+            return result
+
+        result = np.empty((len(log_messages), vectors.shape[1]), dtype=np.float32)
+        result[found] = vectors
+        if missing:
+            fresh = np.asarray(encode_fn([log_messages[i] for i in missing], batch_size), dtype=np.float32)
+            result[missing] = fresh
+            if write:
+                self.add([log_messages[i] for i in missing], fresh)
+        return result
+
+    def compact(self, keep_messages=None):
+        """
+        Rewrite the store, dropping trailing partial rows and, if keep_messages
+        is given, every vector whose message is not in it.
+
+        Returns:
+            tuple: (rows before, rows after)
+        """
+        keep = None if keep_messages is None else {message_key(m) for m in keep_messages}
+        with self._lock, self._file_lock():
+            self._refresh()
+            before = len(self._index)
+            if self._data is None:
+                return 0, 0
+            ordered = sorted(self._index.items(), key=lambda item: item[1])
+            kept = [(key, row) for key, row in ordered if keep is None or key in keep]
+            vectors = self._vectors
+            self._new_version(
+                (b"".join(key for key, _ in part), vectors[[row for _, row in part]])
+                for part in (kept[start:start + 10000] for start in range(0, len(kept), 10000))
+            )
+            return before, len(self._index)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, rows = self.hits, self.misses, len(self._index)
+        lookups = hits + misses
+        return {
+            "path": str(self.path),
+            "data": self._data,
+            "encoder": self.encoder_id,
+            "dtype": self.dtype.name,
+            "dim": self.dim,
+            "rows": rows,
+            "bytes": rows * ((self.dim or 0) * self.dtype.itemsize + KEY_BYTES),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import pandas as pd
+    from processor_bert import encoder_id
+    from config import EMBEDDING_STORE_DIR, EMBEDDING_STORE_DTYPE
+
+    parser = argparse.ArgumentParser(description="Inspect or compact the embedding store")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--keep", type=Path, help="CSV whose log_message column lists the messages to keep")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(EMBEDDING_STORE_DIR, encoder_id(), dtype=EMBEDDING_STORE_DTYPE)
+    if args.command == "compact":
+        keep = pd.read_csv(args.keep)["log_message"].dropna().tolist() if args.keep else None
+        before, after = store.compact(keep)
+        print(f"Compacted {store.path}: {before} -> {after} rows")
+    print(json.dumps(store.stats(), indent=2))
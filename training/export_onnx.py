@@ -0,0 +1,104 @@
+"""
+Export the sentence encoder to ONNX for the ONNX Runtime backend.
+
+Writes model.onnx (fp32) and, with --quantize, model_int8.onnx (dynamic int8
+quantization of the weights) plus the tokenizer files into the output
+directory that processor_bert.OnnxEncoder loads (ONNX_MODEL_DIR).
+
+Usage:
+  python training/export_onnx.py [--output models/onnx] [--quantize]
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from config import ENCODER_MODEL_NAME, ONNX_MODEL_DIR  # noqa: E402
+
+
+class _TokenEmbeddings(torch.nn.Module):
+    """Positional-argument wrapper returning the transformer's last hidden state."""
+
+    def __init__(self, transformer, input_names):
+        super().__init__()
+        self.transformer = transformer
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.transformer(**dict(zip(self.input_names, inputs)))[0]
+
+
+def export_onnx(output_dir=ONNX_MODEL_DIR, model_name=ENCODER_MODEL_NAME, quantize=False):
+    """
+    Export the transformer of a SentenceTransformer model to ONNX.
+
+    Only the transformer is exported (outputs token embeddings); pooling and
+    normalization are done in numpy by OnnxEncoder, exactly as
+    SentenceTransformer does them.
+
+    Args:
+        output_dir (Path): Where to write the model and tokenizer files
+        model_name (str): SentenceTransformer model to export
+        quantize (bool): Also write a dynamically int8-quantized copy
+
+    Returns:
+        list: Paths of the written .onnx files
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    sample = tokenizer(["export sample log line"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer, input_names),
+            tuple(sample[name] for name in input_names),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    tokenizer.save_pretrained(str(output_dir))
+    (output_dir / "encoder_config.json").write_text(json.dumps({
+        "model_name": model_name,
+        "max_seq_length": st_model.max_seq_length,
+    }, indent=2))
+    written = [fp32_path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = output_dir / "model_int8.onnx"
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+        written.append(int8_path)
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the sentence encoder to ONNX")
+    parser.add_argument("--output", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--model", default=ENCODER_MODEL_NAME)
+    parser.add_argument("--quantize", action="store_true", help="Also write model_int8.onnx")
+    args = parser.parse_args()
+
+    for path in export_onnx(args.output, args.model, args.quantize):
+        print(f"Wrote {path}")
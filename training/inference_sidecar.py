@@ -0,0 +1,389 @@
+"""
+Inference Sidecar
+
+With `uvicorn server:app --workers N`, every worker imports processor_bert
+and loads its own SentenceTransformer, classifier and torch runtime, so
+memory grows with the worker count. In sidecar mode the models live in one
+model-owning process (or a small fixed pool of them, INFERENCE_SIDECAR_PROCESSES)
+instead, and the server workers stay thin: they run regex, the lexical stage,
+the caches and the LLM calls themselves and send encoding and BERT
+classification to the sidecar over a local Unix socket
+(multiprocessing.connection). The socket lives in a directory only its
+owner can enter (created 0700; an existing one with wider permissions is
+refused), and connections are authenticated with INFERENCE_SIDECAR_AUTHKEY
+or, when that is unset, with a random key the sidecar generates on its first
+start and keeps in that directory (`authkey`, mode 0600).
+
+Start the sidecar before the server, with the same environment:
+
+    INFERENCE_SIDECAR_SOCKET=/run/logcls/bert.sock python training/inference_sidecar.py
+    INFERENCE_SIDECAR_SOCKET=/run/logcls/bert.sock uvicorn server:app --workers 4
+
+processor_bert hands its work to the sidecar whenever INFERENCE_SIDECAR_SOCKET
+is set, so every caller (classification, retraining, warmup) goes through it
+unchanged. Each reply carries the sidecar's metrics delta and stage timing,
+which the caller merges, so GET /metrics and request traces look the same as
+in-process. The embedding store and the classifier hot-reload happen in the
+sidecar.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import metrics
+import tracing
+from config import (
+    INFERENCE_SIDECAR_SOCKET,
+    INFERENCE_SIDECAR_PROCESSES,
+    INFERENCE_SIDECAR_AUTHKEY,
+    INFERENCE_SIDECAR_CONNECT_TIMEOUT,
+    INFERENCE_SIDECAR_REQUEST_TIMEOUT,
+    WARMUP_BATCH_SIZE,
+)
+
+_serving = False  # True inside a sidecar process: processor_bert runs locally there
+_client = None
+_client_lock = threading.Lock()
+
+
+class SidecarError(RuntimeError):
+    """The sidecar could not be reached, timed out or failed the request."""
+
+
+def enabled():
+    """True when processor_bert should send its work to the sidecar."""
+    return bool(INFERENCE_SIDECAR_SOCKET) and not _serving
+
+
+def addresses(socket_path=INFERENCE_SIDECAR_SOCKET, processes=INFERENCE_SIDECAR_PROCESSES):
+    """Socket path of every sidecar process."""
+    if processes <= 1:
+        return [socket_path]
+    return [f"{socket_path}.{i}" for i in range(processes)]
+
+
+def _socket_dir(address):
+    return os.path.dirname(os.path.abspath(address))
+
+
+def _authkey(address):
+    """
+    Shared secret for a socket: INFERENCE_SIDECAR_AUTHKEY, or the key file next to it.
+
+    Raises:
+        FileNotFoundError: If no key is configured and the sidecar has not generated one yet
+    """
+    if INFERENCE_SIDECAR_AUTHKEY:
+        return INFERENCE_SIDECAR_AUTHKEY
+    with open(os.path.join(_socket_dir(address), "authkey"), "rb") as f:
+        return f.read().strip()
+
+
+def _prepare_socket_dir(address):
+    """
+    Create the socket's directory (0700) and, without INFERENCE_SIDECAR_AUTHKEY,
+    its key file; refuse a directory other users can reach the socket through.
+    """
+    directory = _socket_dir(address)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise SidecarError(
+            f"Socket directory {directory} must be owned by this user and not accessible to others (mode 0700)"
+        )
+    key_path = os.path.join(directory, "authkey")
+    if INFERENCE_SIDECAR_AUTHKEY or os.path.exists(key_path):
+        return
+    tmp_path = f"{key_path}.{os.getpid()}.tmp"
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(secrets.token_hex(32))
+    os.replace(tmp_path, key_path)
+
+
+def _rss_bytes():
+    """Resident memory of this process, or None where /proc is not available."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# ==================== SIDECAR SIDE ====================
+def _handle(op, args):
+    import processor_bert
+
+    if op == "classify":
+        log_msgs, batch_size = args
+        return processor_bert.classify_with_bert_batch(log_msgs, batch_size)
+    if op == "encode":
+        log_msgs, batch_size, store_mode = args
+        return processor_bert.encode_messages(log_msgs, batch_size, store_mode)
+    if op == "status":
+        return {"pid": os.getpid(), "loaded": processor_bert.is_loaded(), "rss_bytes": _rss_bytes()}
+    raise ValueError(f"Unknown sidecar request: {op!r}")
+
+
+def _serve_connection(conn):
+    """Answer one worker connection's requests until it closes."""
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            with tracing.collect() as timing:
+                try:
+                    reply = ("ok", _handle(op, args))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+            try:
+                conn.send((*reply, metrics.worker_delta(), timing["stages"]))
+            except (EOFError, OSError):
+                return
+
+
+def _remove_stale_socket(address):
+    """Delete a socket file left by a sidecar that died; refuse to start next to a live one."""
+    if not os.path.exists(address):
+        return
+    try:
+        Client(address, family="AF_UNIX", authkey=_authkey(address)).close()
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(address)
+        return
+    except AuthenticationError:
+        pass
+    raise SidecarError(f"Another sidecar is already serving on {address}")
+
+
+def serve(address, warmup=True):
+    """
+    Load the models and answer worker requests on a Unix socket until stopped.
+    Each connection gets its own thread; they share the one copy of the models.
+
+    Args:
+        address (str): Socket path
+        warmup (bool): Load the models and run a dummy batch before accepting
+    """
+    global _serving
+    _serving = True
+    # Like a process-pool worker: metrics are drained and shipped back with each reply
+    metrics.mark_worker_process()
+    import processor_bert
+
+    if warmup:
+        processor_bert.get_encoder()
+        processor_bert.get_classifier()
+        processor_bert.classify_with_bert_batch(
+            [f"Warmup request {i} completed with status 200" for i in range(WARMUP_BATCH_SIZE)]
+        )
+        metrics.REGISTRY.drain()
+
+    _prepare_socket_dir(address)
+    _remove_stale_socket(address)
+    # Created inside the 0700 directory: never reachable by other users, not even briefly
+    listener = Listener(address, family="AF_UNIX", authkey=_authkey(address))
+    print(f"Inference sidecar {os.getpid()} serving on {address}", flush=True)
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError) as e:
+                print(f"Rejected sidecar connection: {e}", file=sys.stderr, flush=True)
+                continue
+            threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+    finally:
+        listener.close()
+
+
+def _exit_on_sigterm():
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+def _serve_child(address):
+    _exit_on_sigterm()
+    try:
+        serve(address)
+    except KeyboardInterrupt:
+        pass
+
+
+def run(socket_path=INFERENCE_SIDECAR_SOCKET, processes=INFERENCE_SIDECAR_PROCESSES):
+    """
+    Run the sidecar: one model process serving socket_path, or `processes` of
+    them (spawned, each with its own models) serving socket_path.0, .1, ...
+    """
+    if not socket_path:
+        raise SidecarError("Set INFERENCE_SIDECAR_SOCKET (or pass --socket) to run the sidecar")
+    _exit_on_sigterm()
+    if processes <= 1:
+        serve(socket_path)
+        return
+    # Before spawning, so the processes share one generated key
+    _prepare_socket_dir(socket_path)
+    # spawn, not fork, like the process executor in workers.py
+    context = multiprocessing.get_context("spawn")
+    children = [
+        context.Process(target=_serve_child, args=(address,), name=f"sidecar-{i}")
+        for i, address in enumerate(addresses(socket_path, processes))
+    ]
+    for child in children:
+        child.start()
+    try:
+        # A pool with a dead member would leave part of the traffic failing: stop it all
+        while all(child.is_alive() for child in children):
+            time.sleep(1.0)
+    finally:
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join()
+
+
+# ==================== WORKER SIDE ====================
+class SidecarClient:
+    """
+    Connection pool to the sidecar processes, shared by all threads of a
+    server worker. Requests go round-robin over the sidecar processes; a
+    connection serves one request at a time.
+    """
+
+    def __init__(self, socket_addresses, authkey=None):
+        self.addresses = list(socket_addresses)
+        self._authkey = authkey
+        self._idle = {address: [] for address in self.addresses}
+        self._next = itertools.cycle(self.addresses)
+        self._lock = threading.Lock()
+
+    def _connect(self, address, timeout):
+        # The sidecar may still be starting (or restarting): retry until the timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                # Without a configured key, the sidecar writes one before it listens
+                return Client(address, family="AF_UNIX", authkey=self._authkey or _authkey(address))
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() >= deadline:
+                    raise SidecarError(f"Inference sidecar not reachable on {address}: {e}") from e
+                time.sleep(0.2)
+            except AuthenticationError as e:
+                raise SidecarError(f"Inference sidecar on {address} rejected the authkey") from e
+
+    def _acquire(self, address, connect_timeout):
+        with self._lock:
+            if self._idle[address]:
+                return self._idle[address].pop()
+        return self._connect(address, connect_timeout)
+
+    def _exchange(self, conn, op, args, timeout):
+        conn.send((op, args))
+        if not conn.poll(timeout):
+            raise TimeoutError(f"no reply within {timeout:g}s")
+        return conn.recv()
+
+    def call(
+        self, op, *args, address=None,
+        connect_timeout=INFERENCE_SIDECAR_CONNECT_TIMEOUT, timeout=INFERENCE_SIDECAR_REQUEST_TIMEOUT,
+    ):
+        """
+        Send one request and return its result.
+
+        A broken pooled connection (sidecar restarted) is retried once on a
+        new connection, to the next sidecar process when there are several.
+
+        Raises:
+            SidecarError: If no sidecar answered, or the request failed there
+        """
+        with self._lock:
+            target = address or next(self._next)
+        for attempt in range(2):
+            conn = self._acquire(target, connect_timeout)
+            try:
+                status, result, delta, stages = self._exchange(conn, op, args, timeout)
+                break
+            except (EOFError, OSError, TimeoutError) as e:
+                conn.close()
+                if attempt or isinstance(e, TimeoutError):
+                    raise SidecarError(f"Inference sidecar on {target} failed: {e}") from e
+                if address is None:
+                    with self._lock:
+                        target = next(self._next)
+        with self._lock:
+            self._idle[target].append(conn)
+
+        metrics.REGISTRY.merge(delta)
+        for stage, entry in stages.items():
+            tracing.record(stage, entry["ms"] / 1000, entry["logs"])
+        if status == "error":
+            raise SidecarError(f"Inference sidecar: {result}")
+        return result
+
+
+def client():
+    """The server worker's SidecarClient, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SidecarClient(addresses())
+    return _client
+
+
+def classify_with_bert_batch(log_msgs, batch_size=None):
+    """processor_bert.classify_with_bert_batch, run in the sidecar."""
+    return client().call("classify", list(log_msgs), batch_size)
+
+
+def encode_messages(log_msgs, batch_size, store_mode):
+    """processor_bert.encode_messages, run in the sidecar."""
+    return client().call("encode", list(log_msgs), batch_size, store_mode)
+
+
+def status():
+    """
+    Ask every sidecar process for its status, without waiting for one that is down.
+
+    Returns:
+        dict: ready (every process answered with its models loaded) and, per
+        process, its socket and pid, loaded flag and RSS or the error
+    """
+    processes = []
+    for address in client().addresses:
+        try:
+            # Called from GET /readyz: never block it for long
+            info = client().call("status", address=address, connect_timeout=0, timeout=5)
+            processes.append({"socket": address, **info})
+        except SidecarError as e:
+            processes.append({"socket": address, "loaded": False, "error": str(e)})
+    return {"ready": all(p["loaded"] for p in processes), "processes": processes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the BERT stage to the API workers over a Unix socket")
+    parser.add_argument("--socket", default=INFERENCE_SIDECAR_SOCKET, help="Socket path (INFERENCE_SIDECAR_SOCKET)")
+    parser.add_argument(
+        "--processes", type=int, default=INFERENCE_SIDECAR_PROCESSES,
+        help="Model processes (INFERENCE_SIDECAR_PROCESSES); workers must use the same value",
+    )
+    args = parser.parse_args()
+    # Through the imported module, not __main__: processor_bert checks that module's _serving flag
+    import inference_sidecar
+    try:
+        inference_sidecar.run(args.socket, args.processes)
+    except KeyboardInterrupt:
+        pass
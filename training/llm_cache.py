@@ -0,0 +1,327 @@
+"""
+Persistent LLM Response Cache
+
+LegacyCRM traffic repeats heavily, and the in-memory result cache is lost on
+restart and keyed on the exact (source, log_message). This cache keeps the
+LLM's answers in a SQLite file (LLM_CACHE_PATH) so a message is sent to Groq
+once per model and prompt, across restarts and across server worker
+processes sharing the file.
+
+Entries are keyed on a BLAKE2b hash of the model name, the prompt version
+(processor_llm.PROMPT_VERSION, derived from the prompt templates, so editing
+a prompt starts a fresh set of entries) and the normalized message:
+
+    whitespace - runs of whitespace collapsed (default)
+    template   - the template_miner template, so messages differing only in
+                 IDs, numbers or IPs share one answer
+
+Only answers that name one of processor_llm.LLM_LABELS are stored (an
+unparseable completion is not). The most recently used
+LLM_CACHE_MEMORY_ENTRIES entries are also kept in memory and loaded at
+startup (warm); beyond LLM_CACHE_MAX_ENTRIES rows the least recently used
+are evicted. Hits update last_used in memory first; the buffer is written in
+one statement when it fills up, every _TOUCH_FLUSH_SECONDS, and before an
+eviction, so a hit doesn't cost a write transaction.
+
+Usage:
+  python training/llm_cache.py stats
+  python training/llm_cache.py clear
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import atexit
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+
+import metrics
+
+NORMALIZE_MODES = ("whitespace", "template")
+# SQLite limits the number of host parameters per statement
+_SQL_BATCH = 500
+# Buffered last_used updates are written at this many entries or after this long
+_TOUCH_FLUSH_ENTRIES = 1000
+_TOUCH_FLUSH_SECONDS = 30.0
+# Disk row counts in stats() need a table scan: refreshed at most this often
+_STATS_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key            BLOB PRIMARY KEY,
+    label          TEXT NOT NULL,
+    model          TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    created_at     REAL NOT NULL,
+    last_used      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+LOOKUPS = metrics.REGISTRY.counter(
+    "llm_cache_lookups_total",
+    "LLM response cache lookups, by result (memory, disk, miss).",
+    ["result"],
+)
+EVICTIONS = metrics.REGISTRY.counter(
+    "llm_cache_evictions_total",
+    "LLM response cache rows evicted to stay within LLM_CACHE_MAX_ENTRIES.",
+)
+
+
+def normalize_message(log_message, mode="whitespace"):
+    """Message text the cache key is computed from (see NORMALIZE_MODES)."""
+    if mode == "template":
+        from template_miner import extract_template
+        return extract_template(str(log_message))
+    return " ".join(str(log_message).split())
+
+
+class LLMCache:
+    """
+    SQLite-backed LLM answers with a bounded in-memory LRU in front.
+    """
+
+    def __init__(self, path, max_entries, memory_entries, normalize="whitespace"):
+        """
+        Args:
+            path (str or Path): SQLite database file (created if missing)
+            max_entries (int): Rows kept on disk; the least recently used are evicted beyond it
+            memory_entries (int): Entries also kept in memory (0 = disk only)
+            normalize (str): Message normalization, "whitespace" or "template"
+        """
+        if normalize not in NORMALIZE_MODES:
+            raise ValueError(f"LLM cache normalization must be one of {NORMALIZE_MODES}, got {normalize!r}")
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.normalize = normalize
+        self._memory = OrderedDict()  # key -> label, least recently used first
+        self._touched = {}  # key -> last_used not yet written
+        self._flushed_at = time.monotonic()
+        self._disk_stats = None  # (rows, rows per model / prompt version), see stats()
+        self._disk_stats_at = 0.0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._rows = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _connect(self):
+        # One connection per call: lookups come from several LLM batches' threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def key(self, log_message, model, prompt_version):
+        """Cache key of a message for one model and prompt version."""
+        text = f"{model}\0{prompt_version}\0{normalize_message(log_message, self.normalize)}"
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    # ---------- memory ----------
+    def _remember(self, key, label):
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = label
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def warm(self):
+        """
+        Load the most recently used entries into memory.
+
+        Returns:
+            int: Entries loaded
+        """
+        if self.memory_entries <= 0:
+            return 0
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT key, label FROM responses ORDER BY last_used DESC LIMIT ?", (self.memory_entries,)
+            ).fetchall()
+        with self._lock:
+            # Oldest first, so the LRU order matches last_used
+            for key, label in reversed(rows):
+                self._memory.setdefault(key, label)
+        return len(rows)
+
+    # ---------- reads / writes ----------
+    def get_many(self, keys):
+        """
+        Look up several keys: memory first, then one disk query for the rest.
+        Hits are marked used (buffered, see flush), so eviction keeps them.
+
+        Returns:
+            dict: key -> label for the keys found
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                label = self._memory.get(key)
+                if label is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = label
+        LOOKUPS.inc(len(found), result="memory")
+        missing = list({key for key in keys if key not in found})
+        on_disk = {}
+        if missing:
+            with closing(self._connect()) as conn:
+                for start in range(0, len(missing), _SQL_BATCH):
+                    part = missing[start:start + _SQL_BATCH]
+                    on_disk.update(conn.execute(
+                        f"SELECT key, label FROM responses WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall())
+        for key, label in on_disk.items():
+            self._remember(key, label)
+        found.update(on_disk)
+        LOOKUPS.inc(len(on_disk), result="disk")
+        LOOKUPS.inc(len(missing) - len(on_disk), result="miss")
+        if found:
+            self._touch(found)
+        return found
+
+    def _touch(self, keys):
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                self._touched[key] = now
+            due = (
+                len(self._touched) >= _TOUCH_FLUSH_ENTRIES
+                or time.monotonic() - self._flushed_at >= _TOUCH_FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self, conn=None):
+        """
+        Write the buffered last_used updates of cache hits.
+
+        Args:
+            conn: Open connection to write with, inside its transaction (default: a new one)
+        """
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._flushed_at = time.monotonic()
+        if not touched:
+            return
+        updates = [(last_used, key) for key, last_used in touched.items()]
+        if conn is not None:
+            conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?", updates)
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("UPDATE responses SET last_used = ? WHERE key = ?", updates)
+
+    def put_many(self, entries, model, prompt_version):
+        """
+        Store answers and evict the least recently used rows beyond max_entries.
+
+        Args:
+            entries (list): (key, label) pairs; labels already normalized
+            model (str): LLM model name, stored for inspection
+            prompt_version (str): Prompt version, stored for inspection
+        """
+        if not entries:
+            return
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT INTO responses (key, label, model, prompt_version, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "label = excluded.label, last_used = excluded.last_used",
+                [(key, label, model, prompt_version, now, now) for key, label in entries],
+            )
+            # Counted per process, so other workers' inserts are only seen at the exact recount below
+            self._rows += conn.total_changes - before
+            if self._rows > self.max_entries:
+                self._rows = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if self._rows > self.max_entries:
+                # Recent hits must count before picking the least recently used
+                self.flush(conn)
+                # Evict down to 90% so the next few inserts don't each trigger a delete
+                excess = self._rows - int(self.max_entries * 0.9)
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._rows -= excess
+                EVICTIONS.inc(excess)
+        for key, label in entries:
+            self._remember(key, label)
+
+    def clear(self):
+        """Delete every entry, on disk and in memory."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM responses")
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            self._disk_stats = None
+        self._rows = 0
+
+    def stats(self):
+        """
+        Rows on disk and in memory, bounds, lookups by result and the hit ratio.
+        The disk row counts are refreshed at most every _STATS_SECONDS.
+        """
+        now = time.monotonic()
+        with self._lock:
+            disk = self._disk_stats if now - self._disk_stats_at < _STATS_SECONDS else None
+        if disk is None:
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                by_version = conn.execute(
+                    "SELECT model, prompt_version, COUNT(*) FROM responses GROUP BY 1, 2 ORDER BY 3 DESC"
+                ).fetchall()
+            disk = (rows, by_version)
+            with self._lock:
+                self._disk_stats, self._disk_stats_at = disk, now
+        rows, by_version = disk
+        with self._lock:
+            in_memory = len(self._memory)
+        lookups = LOOKUPS.values()
+        total = sum(lookups.values())
+        hits = lookups.get("memory", 0) + lookups.get("disk", 0)
+        return {
+            "path": str(self.path),
+            "normalize": self.normalize,
+            "rows": rows,
+            "max_entries": self.max_entries,
+            "memory_rows": in_memory,
+            "memory_entries": self.memory_entries,
+            "by_model": [{"model": m, "prompt_version": v, "rows": n} for m, v, n in by_version],
+            "lookups": lookups,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "evictions": sum(EVICTIONS.values().values()),
+        }
+
+
+def get_cache():
+    """The cache configured by LLM_CACHE_*."""
+    from config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_NORMALIZE
+    cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_NORMALIZE)
+    # Buffered last_used updates are not lost on a clean shutdown
+    atexit.register(cache.flush)
+    return cache
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    parser = argparse.ArgumentParser(description="Inspect or clear the persistent LLM response cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    cache = get_cache()
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {cache.path}")
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,146 @@
+"""
+Deferred LLM Re-classification
+
+With LLM_FALLBACK=deferred, LegacyCRM logs the LLM could not answer (breaker
+open, request failed, batch budget spent) are returned with the label
+"Deferred" instead of a local guess. They are queued here, and a background
+thread sends them to the LLM again once the circuit breaker lets requests
+through; each answer is handed to a callback (classify.py stores it in the
+result cache, so the next request for that log gets the real label).
+
+The queue is in memory, deduplicated and bounded (LLM_DEFERRED_MAX_PENDING,
+oldest dropped first). A log the LLM leaves unanswered goes back to the tail,
+so it can't hold up the logs behind it, and is dropped after
+LLM_DEFERRED_MAX_ATTEMPTS attempts.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+import processor_llm
+from config import LLM_DEFERRED_RETRY_SECONDS, LLM_DEFERRED_MAX_ATTEMPTS, LLM_CONCURRENCY, LLM_PACK_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_LABEL = "Deferred"
+
+DEFERRED = metrics.REGISTRY.counter(
+    "llm_deferred_logs_total",
+    "Deferred LegacyCRM logs, by outcome (queued, resolved, dropped).",
+    ["outcome"],
+)
+
+
+class DeferredQueue:
+    """
+    Pending (source, log_message) pairs and the thread that re-classifies them.
+    """
+
+    def __init__(
+        self,
+        max_pending,
+        on_resolved,
+        retry_seconds=LLM_DEFERRED_RETRY_SECONDS,
+        max_attempts=LLM_DEFERRED_MAX_ATTEMPTS,
+    ):
+        """
+        Args:
+            max_pending (int): Queue bound; the oldest entries are dropped beyond it
+            on_resolved: Callback on_resolved(source, log_msg, label) for each answer
+            retry_seconds (float): Wait between attempts while the LLM is unavailable
+            max_attempts (int): Attempts per log before it is dropped
+        """
+        self.max_pending = max_pending
+        self.on_resolved = on_resolved
+        self.retry_seconds = retry_seconds
+        self.max_attempts = max_attempts
+        self._pending = OrderedDict()  # (source, log_msg) -> attempts so far, next to try first
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, logs):
+        """Queue (source, log_msg) pairs and start the re-classifier if needed."""
+        dropped = queued = 0
+        with self._lock:
+            for log in logs:
+                if log in self._pending:
+                    continue
+                self._pending[log] = 0
+                queued += 1
+                if len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+                    dropped += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="llm-deferred", daemon=True)
+                self._thread.start()
+        DEFERRED.inc(queued, outcome="queued")
+        DEFERRED.inc(dropped, outcome="dropped")
+        self._wakeup.set()
+
+    def _take(self, n):
+        with self._lock:
+            return list(itertools.islice(self._pending, n))
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.retry_seconds)
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception:
+                # Keep the thread alive; the logs stay queued for the next round
+                logger.exception("Deferred re-classification failed")
+
+    def _drain(self):
+        """
+        Re-classify each queued log once, a batch at a time, until every log has
+        had its turn or the LLM stops answering.
+        """
+        # A few concurrent requests' worth at a time, so new deferrals can interleave
+        size = LLM_CONCURRENCY * max(1, LLM_PACK_SIZE)
+        with self._lock:
+            remaining = len(self._pending)
+        while remaining > 0 and not processor_llm.breaker.is_open():
+            batch = self._take(min(size, remaining))
+            if not batch:
+                return
+            remaining -= len(batch)
+            try:
+                labels = processor_llm.classify_with_llm_batch([msg for _, msg in batch])
+            except Exception:
+                logger.exception("Deferred re-classification of %d logs failed", len(batch))
+                labels = [None] * len(batch)
+            resolved = [(log, label) for log, label in zip(batch, labels) if label is not None]
+            dropped = 0
+            with self._lock:
+                for log, label in zip(batch, labels):
+                    if log not in self._pending:
+                        continue  # already dropped by add() while in flight
+                    if label is not None:
+                        del self._pending[log]
+                    elif self._pending[log] + 1 >= self.max_attempts:
+                        del self._pending[log]
+                        dropped += 1
+                    else:
+                        # To the tail, so the logs behind it get their turn
+                        self._pending[log] += 1
+                        self._pending.move_to_end(log)
+            for (source, log_msg), label in resolved:
+                self.on_resolved(source, log_msg, label)
+            DEFERRED.inc(len(resolved), outcome="resolved")
+            DEFERRED.inc(dropped, outcome="dropped")
+            if not resolved:
+                return  # the LLM is failing again: wait for the next round
+
+    def stats(self):
+        """Pending count and queued / resolved / dropped totals."""
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, **DEFERRED.values()}
@@ -0,0 +1,158 @@
+"""
+Local Chat-Completions Stub Server
+
+A stand-in for the Groq API so the LLM stage can be run offline: it answers
+POST .../chat/completions with a keyword-based label, understands the packed
+multi-message prompt, and can inject latency and failures - also switched
+at runtime with set_faults(), e.g. to take the "API" down and bring it back
+while exercising the LLM stage's timeouts and circuit breaker.
+
+Usage:
+  python training/llm_stub_server.py [--port 8765] [--latency-ms 50] [--error-rate 0.1]
+  GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=stub uvicorn server:app
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_NUMBERED_LINE = re.compile(r"^(\d+)\. (.*)$")
+
+
+def stub_label(log_message):
+    """Keyword heuristic standing in for the model's answer."""
+    text = log_message.lower()
+    if "deprecat" in text:
+        return "Deprecation Warning"
+    if "workflow" in text or "escalation" in text or "failed" in text:
+        return "Workflow Error"
+    return "Unclassified"
+
+
+def stub_completion(prompt):
+    """Answer a single or packed classification prompt the way the LLM is asked to."""
+    if "Log messages:" in prompt:
+        lines = []
+        for line in prompt.split("Log messages:", 1)[1].splitlines():
+            m = _NUMBERED_LINE.match(line.strip())
+            if m:
+                lines.append(f"{m.group(1)}. {stub_label(m.group(2))}")
+        return "\n".join(lines)
+    message = prompt.split("Log message:", 1)[-1].strip()
+    return stub_label(message)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    error_rate = 0.0
+    error_status = 503
+    retry_after = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            self._send(self.error_status, {"error": {"message": "injected failure"}}, headers)
+            return
+
+        prompt = body["messages"][-1]["content"]
+        self._send(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": stub_completion(prompt)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and went away
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark / test output quiet
+
+
+def start_stub_server(port=0, latency_ms=0.0, error_rate=0.0, error_status=503, retry_after=None):
+    """
+    Start the stub in a background thread.
+
+    Args:
+        port (int): Port to bind on 127.0.0.1 (0 picks a free port)
+        latency_ms (float): Delay added to every response
+        error_rate (float): Fraction of requests answered with error_status
+        error_status (int): HTTP status used for injected failures
+        retry_after (float): Retry-After seconds sent with injected failures (None = no header)
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() to stop it
+    """
+    handler = type("StubHandler", (_Handler,), {
+        "latency_ms": latency_ms,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "retry_after": retry_after,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def set_faults(server, latency_ms=None, error_rate=None, error_status=None, retry_after=None):
+    """Change the injected latency / failures of a running stub (None keeps a setting)."""
+    handler = server.RequestHandlerClass
+    if latency_ms is not None:
+        handler.latency_ms = latency_ms
+    if error_rate is not None:
+        handler.error_rate = error_rate
+    if error_status is not None:
+        handler.error_status = error_status
+    if retry_after is not None:
+        handler.retry_after = retry_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local chat-completions stub for the LLM stage")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.port, args.latency_ms, args.error_rate, args.error_status, args.retry_after
+    )
+    print(f"Stub chat-completions server on {base_url} (set GROQ_BASE_URL to this)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
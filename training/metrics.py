@@ -0,0 +1,317 @@
+"""
+Pipeline Metrics
+
+Counters and histograms for the classification pipeline: per-stage latency
+(regex, template lookup, BERT encode, BERT predict, LLM), how many logs each
+stage answered, "Unclassified" results and batch-size distributions.
+
+All updates take one registry lock, so metrics can be recorded from the
+event loop, the thread pools and LLM coroutines alike. Process-pool workers
+record into their own copy of the registry; after every task the worker
+drains it and returns the delta with the results, and the server merges it
+(see workers.py), so /metrics covers all processes. Stage timings also go
+to the current request trace (tracing.py).
+
+Exposed as JSON (to_dict) under GET /metrics and in the Prometheus text
+format (render_prometheus) under GET /metrics/prometheus.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+
+# Seconds: 0.1 ms .. 60 s
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+# Logs per batch
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+class MetricsRegistry:
+    """
+    Holds every metric's values; one lock for all updates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # name -> Counter / Histogram, in registration order
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    # ---------- cross-process merge ----------
+    def drain(self):
+        """
+        Return every value recorded since the last drain and reset them.
+
+        Returns:
+            dict: name -> {label values tuple -> value}; picklable
+        """
+        with self._lock:
+            delta = {}
+            for name, metric in self._metrics.items():
+                if metric._values:
+                    delta[name] = metric._values
+                    metric._values = {}
+            return delta
+
+    def merge(self, delta):
+        """Add a delta produced by drain() in another process."""
+        if not delta:
+            return
+        with self._lock:
+            for name, values in delta.items():
+                metric = self._metrics.get(name)
+                if metric is not None:
+                    for labels, value in values.items():
+                        metric._merge_value(labels, value)
+
+    # ---------- export ----------
+    def to_dict(self):
+        """JSON summary: counter values and histogram count / sum / percentiles per label set."""
+        with self._lock:
+            return {name: metric._summary() for name, metric in self._metrics.items()}
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric._prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+
+def _label_str(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, registry, name, help_text, labelnames):
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _merge_value(self, key, value):
+        self._values[key] = self._values.get(key, 0) + value
+
+    def values(self):
+        """label value (or tuple of values) -> count."""
+        with self._registry._lock:
+            return {k[0] if len(k) == 1 else k: v for k, v in self._values.items()}
+
+    def _summary(self):
+        return {",".join(k) or "total": v for k, v in sorted(self._values.items())}
+
+    def _prometheus_lines(self):
+        return [
+            f"{self.name}{_label_str(self.labelnames, k)} {_format(v)}"
+            for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    """Bucketed distribution (plus sum and count) per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames, buckets):
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts (last = +Inf), sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._registry._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _merge_value(self, key, value):
+        entry = self._values.get(key)
+        if entry is None:
+            self._values[key] = [list(value[0]), value[1], value[2]]
+            return
+        entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+        entry[1] += value[1]
+        entry[2] += value[2]
+
+    def totals(self):
+        """label value (or tuple) -> (count, sum)."""
+        with self._registry._lock:
+            return {k[0] if len(k) == 1 else k: (v[2], v[1]) for k, v in self._values.items()}
+
+    def _quantile(self, counts, total, q):
+        """Estimate a quantile by linear interpolation inside its bucket (like histogram_quantile)."""
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def _summary(self):
+        summary = {}
+        for key, (counts, total_sum, count) in sorted(self._values.items()):
+            summary[",".join(key) or "total"] = {
+                "count": count,
+                "sum": round(total_sum, 6),
+                "mean": round(total_sum / count, 6) if count else 0.0,
+                "p50": round(self._quantile(counts, count, 0.50), 6),
+                "p95": round(self._quantile(counts, count, 0.95), 6),
+                "p99": round(self._quantile(counts, count, 0.99), 6),
+            }
+        return summary
+
+    def _prometheus_lines(self):
+        lines = []
+        for key, (counts, total_sum, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_label_str(self.labelnames, key, [('le', _format(bound))])} {cumulative}"
+                )
+            labels = _label_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format(float(total_sum))}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# ==================== PIPELINE METRICS ====================
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "classify_stage_seconds",
+    "Time per call of a pipeline stage (regex, lexical, template, bert_encode, bert_predict, llm).",
+    ["stage"],
+)
+STAGE_BATCH_LOGS = REGISTRY.histogram(
+    "classify_stage_batch_logs",
+    "Logs handed to a pipeline stage per call.",
+    ["stage"],
+    buckets=SIZE_BUCKETS,
+)
+ROUTED_LOGS = REGISTRY.counter(
+    "classify_routed_logs_total",
+    "Logs answered by each stage (result_cache, regex, lexical, template, bert, llm, llm_fallback, deferred).",
+    ["stage"],
+)
+UNCLASSIFIED_LOGS = REGISTRY.counter(
+    "classify_unclassified_logs_total",
+    "Logs labeled Unclassified, by the stage that gave up.",
+    ["stage"],
+)
+BATCH_LOGS = REGISTRY.histogram(
+    "classify_batch_logs",
+    "Logs per classify_batch call.",
+    buckets=SIZE_BUCKETS,
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds",
+    "Latency of single chat-completion requests, by outcome (ok, retry, error).",
+    ["outcome"],
+)
+LABELS = REGISTRY.counter(
+    "classify_labels_total",
+    "Labels returned to API clients.",
+    ["label"],
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_seconds",
+    "Latency of classification API requests.",
+    ["endpoint"],
+)
+
+
+def observe_stage(stage, seconds, logs=None):
+    """Record one call of a pipeline stage in STAGE_SECONDS and in the current request trace."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    tracing.record(stage, seconds, logs)
+
+
+@contextmanager
+def time_stage(stage, logs=None):
+    """observe_stage() the duration of the with-block."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0, logs)
+
+
+_in_worker_process = False
+
+
+def mark_worker_process():
+    """Called in process-pool workers: their metrics are drained and shipped back with each result."""
+    global _in_worker_process
+    _in_worker_process = True
+
+
+def worker_delta():
+    """Delta to ship back from a process-pool worker, or None when running in the server process."""
+    return REGISTRY.drain() if _in_worker_process else None
@@ -0,0 +1,254 @@
+"""
+Versioned Model Registry
+
+Every trained classifier is kept under models/registry/<version>/ together
+with its training metrics and, when one was trained, the lexical
+pre-classifier (lexical.pkl); registry.json lists the versions and records
+which one is active. Version directories are never modified once written,
+and registry.json is the only switch: activating a version replaces it in
+one os.replace. processor_bert and processor_lexical compare the active
+version id with the one they loaded (served_files) and load both models from
+that version's directory on their next batch, without a restart, so the two
+always come from the same version. Rolling back is activating an older
+version. Before the first registration the shipped
+models/log_classification_model.pkl is served (as version "initial").
+
+Usage:
+  python training/model_registry.py list
+  python training/model_registry.py activate v0002
+  python training/model_registry.py rollback
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import joblib
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+ACTIVE_MODEL_PATH = PROJECT_ROOT / "models" / "log_classification_model.pkl"
+REGISTRY_DIR = PROJECT_ROOT / "models" / "registry"
+
+INITIAL_VERSION = "initial"
+
+_lock = threading.Lock()
+_served = (None, None)  # (registry.json stat, served_files() result) of the last parse
+
+
+# ==================== REGISTRY FILE ====================
+def _index_path():
+    return REGISTRY_DIR / "registry.json"
+
+
+@contextmanager
+def _locked():
+    """
+    Serialize registry changes across threads and processes (several server
+    workers, or the CLI next to the server): version allocation, the version
+    directory and the registry.json update all happen under one exclusive flock.
+    """
+    with _lock:
+        REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+        with open(REGISTRY_DIR / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read():
+    try:
+        return json.loads(_index_path().read_text())
+    except FileNotFoundError:
+        return {"active": None, "previous": None, "versions": []}
+
+
+def _write(registry):
+    """Replace registry.json atomically so readers never see a partial file."""
+    REGISTRY_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = _index_path().with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(registry, indent=2))
+    os.replace(tmp, _index_path())
+
+
+def _next_version(registry):
+    return f"v{len(registry['versions']) + 1:04d}"
+
+
+def _find(registry, version):
+    for entry in registry["versions"]:
+        if entry["version"] == version:
+            return entry
+    raise KeyError(f"Unknown model version: {version}")
+
+
+def _bootstrap(registry):
+    """Register the pre-registry model file as the first version, so it can be rolled back to."""
+    if registry["versions"] or not ACTIVE_MODEL_PATH.exists():
+        return
+    version = _next_version(registry)
+    (REGISTRY_DIR / version).mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(ACTIVE_MODEL_PATH, REGISTRY_DIR / version / "model.pkl")
+    registry["versions"].append({
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": "initial model",
+        "metrics": {},
+    })
+    registry["active"] = version
+
+
+# ==================== PUBLIC API ====================
+def register(clf, metrics=None, source="retrain", activate=True, lexical=None):
+    """
+    Save a trained classifier as a new version.
+
+    Args:
+        clf: Fitted classifier (predict_proba + classes_)
+        metrics (dict): Training metrics stored with the version
+        source (str): Short description of where the model came from
+        activate (bool): Also make it the served model
+        lexical (dict): Lexical pre-classifier trained with it (see processor_lexical.train)
+
+    Returns:
+        str: The new version name (e.g. "v0003")
+    """
+    with _locked():
+        registry = _read()
+        _bootstrap(registry)
+        version = _next_version(registry)
+        version_dir = REGISTRY_DIR / version
+        version_dir.mkdir(parents=True, exist_ok=True)
+        joblib.dump(clf, version_dir / "model.pkl")
+        if lexical is not None:
+            joblib.dump(lexical, version_dir / "lexical.pkl")
+        registry["versions"].append({
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source,
+            "metrics": metrics or {},
+        })
+        _write(registry)
+        if activate:
+            _activate(registry, version)
+        return version
+
+
+def _activate(registry, version):
+    _find(registry, version)
+    if registry["active"] != version:
+        registry["previous"] = registry["active"]
+        registry["active"] = version
+    _write(registry)
+
+
+def activate(version):
+    """
+    Serve a registered version.
+
+    Raises:
+        KeyError: If the version does not exist
+    """
+    with _locked():
+        registry = _read()
+        _activate(registry, version)
+        return version
+
+
+def rollback(version=None):
+    """
+    Go back to `version`, or to the version that was active before the current one.
+
+    Returns:
+        str: The version now active
+    """
+    with _locked():
+        registry = _read()
+        target = version or registry.get("previous")
+        if target is None:
+            raise KeyError("No previous model version to roll back to")
+        _activate(registry, target)
+        return target
+
+
+def active_version():
+    """Name of the served version, or None before the first registered model."""
+    return _read()["active"]
+
+
+def served_files():
+    """
+    The active version and the model files to serve for it.
+
+    Cheap enough to call per batch: registry.json is parsed again only when
+    it was replaced since the last call.
+
+    Returns:
+        tuple: (version, classifier path, lexical model path or None). Before
+        the first registration: (INITIAL_VERSION, the shipped model file,
+        None), or (None, None, None) if that file is missing too
+    """
+    global _served
+    try:
+        stat = _index_path().stat()
+    except FileNotFoundError:
+        return _initial_files()
+    key = (stat.st_ino, stat.st_mtime_ns)
+    cached_key, files = _served
+    if key != cached_key:
+        version = _read()["active"]
+        if version is None:
+            # Only versions registered with activate=False: the shipped model is still served
+            return _initial_files()
+        version_dir = REGISTRY_DIR / version
+        lexical = version_dir / "lexical.pkl"
+        files = (version, version_dir / "model.pkl", lexical if lexical.exists() else None)
+        _served = (key, files)
+    return files
+
+
+def _initial_files():
+    if not ACTIVE_MODEL_PATH.exists():
+        return None, None, None
+    return INITIAL_VERSION, ACTIVE_MODEL_PATH, None
+
+
+def list_versions():
+    """
+    Returns:
+        dict: active and previous version names and every version's metadata
+    """
+    return _read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and switch registered classifier versions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    activate_parser = sub.add_parser("activate")
+    activate_parser.add_argument("version")
+    rollback_parser = sub.add_parser("rollback")
+    rollback_parser.add_argument("version", nargs="?")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "activate":
+            print(f"Active model: {activate(args.version)}")
+        elif args.command == "rollback":
+            print(f"Active model: {rollback(args.version)}")
+        else:
+            print(json.dumps(list_versions(), indent=2))
+    except KeyError as e:
+        print(f"Error: {e.args[0]}", file=sys.stderr)
+        sys.exit(1)
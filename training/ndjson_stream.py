@@ -0,0 +1,300 @@
+"""
+Streaming NDJSON Classification
+
+Log shippers emit newline-delimited JSON continuously, one
+{"source": ..., "log_message": ...} object per line. This module classifies
+such a stream as it arrives instead of waiting for a whole file:
+
+    lines -> parse_record -> micro_batches -> classify_fn -> output records
+
+Records are grouped into batches of up to max_batch_size, and a partial
+batch is flushed once its first record has waited max_wait_ms, so a quiet
+stream still gets its labels promptly. Input is read on a helper thread
+into a bounded queue, so memory stays bounded by a few batches however long
+the stream runs. Output records are the input objects (extra fields kept)
+plus "target_label", in input order; a line that is not a valid record
+yields {"line": n, "error": ...} in its place.
+
+The server's POST /classify-ndjson runs the same batching on the event loop
+(amicro_batches) over the request body; the CLI below reads stdin or follows
+a growing file (like tail -f).
+
+Usage:
+  producer | python training/ndjson_stream.py > labeled.ndjson
+  python training/ndjson_stream.py --follow /var/log/app.ndjson [--from-start] [--output labeled.ndjson]
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+_END = object()  # end of input, queued by the reader thread
+
+
+# ==================== RECORDS ====================
+def parse_record(line):
+    """
+    Parse one NDJSON line.
+
+    Returns:
+        dict or None: The record (None for blank lines)
+
+    Raises:
+        ValueError: If the line is not a JSON object with a log_message
+    """
+    line = line.strip()
+    if not line:
+        return None
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("each line must be a JSON object")
+    if "log_message" not in record:
+        raise ValueError("missing 'log_message'")
+    return record
+
+
+def error_record(line_no, error):
+    """Output record standing in for an input line that could not be parsed."""
+    return {"line": line_no, "error": str(error)}
+
+
+def dumps(record):
+    """One NDJSON output line."""
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def to_log(record):
+    """(source, log_message) tuple the classification pipeline takes."""
+    return str(record.get("source", "")), str(record["log_message"])
+
+
+# ==================== PIPELINE ====================
+def _read_ahead(lines, max_pending):
+    """
+    Read lines on a helper thread into a queue of at most max_pending items,
+    so a fast producer is blocked rather than buffered without limit and the
+    consumer can wait for input with a timeout.
+    """
+    q = queue.Queue(maxsize=max_pending)
+
+    def read():
+        try:
+            for line in lines:
+                q.put(line)
+        except Exception as e:  # surfaced to the consumer
+            q.put(e)
+        q.put(_END)
+
+    threading.Thread(target=read, name="ndjson-reader", daemon=True).start()
+    return q
+
+
+def micro_batches(lines, max_batch_size, max_wait_ms):
+    """
+    Parse lines and group them into batches.
+
+    Yields:
+        list: (line number, record or None, error or None) entries, in input
+        order; at most max_batch_size records each
+    """
+    q = _read_ahead(lines, 2 * max_batch_size)
+    pending = []
+    n_records = 0
+    line_no = 0
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            line = q.get(timeout=timeout)
+        except queue.Empty:
+            # The oldest pending record has waited max_wait_ms
+            yield pending
+            pending, n_records, deadline = [], 0, None
+            continue
+        if line is _END:
+            break
+        if isinstance(line, Exception):
+            raise line
+        line_no += 1
+        try:
+            record = parse_record(line)
+        except ValueError as e:
+            pending.append((line_no, None, e))
+        else:
+            if record is None:
+                continue
+            pending.append((line_no, record, None))
+            n_records += 1
+        if deadline is None:
+            deadline = time.monotonic() + max_wait_ms / 1000
+        if n_records >= max_batch_size:
+            yield pending
+            pending, n_records, deadline = [], 0, None
+    if pending:
+        yield pending
+
+
+async def amicro_batches(lines, max_batch_size, max_wait_ms):
+    """
+    micro_batches for an async iterable of lines (e.g. a request body), on the event loop.
+
+    Yields:
+        list: Same entries as micro_batches
+    """
+    q = asyncio.Queue(maxsize=2 * max_batch_size)
+
+    async def read():
+        try:
+            async for line in lines:
+                await q.put(line)
+        except Exception as e:  # surfaced to the consumer
+            await q.put(e)
+        await q.put(_END)
+
+    reader = asyncio.create_task(read())
+    try:
+        pending = []
+        n_records = 0
+        line_no = 0
+        deadline = None
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                line = await asyncio.wait_for(q.get(), timeout)
+            except asyncio.TimeoutError:
+                yield pending
+                pending, n_records, deadline = [], 0, None
+                continue
+            if line is _END:
+                break
+            if isinstance(line, Exception):
+                raise line
+            line_no += 1
+            try:
+                record = parse_record(line)
+            except ValueError as e:
+                pending.append((line_no, None, e))
+            else:
+                if record is None:
+                    continue
+                pending.append((line_no, record, None))
+                n_records += 1
+            if deadline is None:
+                deadline = loop.time() + max_wait_ms / 1000
+            if n_records >= max_batch_size:
+                yield pending
+                pending, n_records, deadline = [], 0, None
+        if pending:
+            yield pending
+    finally:
+        reader.cancel()
+
+
+def label_batch(batch, labels):
+    """
+    Output records for one batch.
+
+    Args:
+        batch (list): Entries from micro_batches
+        labels (list): One label per record in the batch, in order
+
+    Returns:
+        list: Output records (input fields + target_label, or error records)
+    """
+    labels = iter(labels)
+    return [
+        error_record(line_no, error) if record is None else {**record, "target_label": next(labels)}
+        for line_no, record, error in batch
+    ]
+
+
+def classify_stream(lines, classify_fn, max_batch_size=256, max_wait_ms=200):
+    """
+    Classify an NDJSON stream incrementally.
+
+    Args:
+        lines (iterable): NDJSON lines; may be endless (stdin, a followed file)
+        classify_fn: Takes a list of (source, log_msg), returns (source, log_msg, label) tuples
+        max_batch_size (int): Records per classification call
+        max_wait_ms (float): Longest a record waits for its batch to fill
+
+    Yields:
+        dict: Output records in input order
+    """
+    for batch in micro_batches(lines, max_batch_size, max_wait_ms):
+        logs = [to_log(record) for _, record, _ in batch if record is not None]
+        results = classify_fn(logs) if logs else []
+        yield from label_batch(batch, [label for _, _, label in results])
+
+
+def follow(path, from_start=False, poll_interval=0.25):
+    """
+    Yield the lines appended to a file, forever (tail -f). Starts at the end
+    of the file unless from_start. Survives rotation (the path now names a new
+    file) and truncation by reopening from the start.
+    """
+    path = Path(path)
+    f = open(path, encoding="utf-8")
+    try:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        partial = ""
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+            time.sleep(poll_interval)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # mid-rotation
+            if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+                f.close()
+                f = open(path, encoding="utf-8")
+                partial = ""
+    finally:
+        f.close()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from config import NDJSON_BATCH_SIZE, NDJSON_MAX_WAIT_MS
+
+    parser = argparse.ArgumentParser(description="Classify an NDJSON log stream from stdin or a followed file")
+    parser.add_argument("--follow", type=Path, help="Follow this file as it grows instead of reading stdin")
+    parser.add_argument("--from-start", action="store_true", help="With --follow, classify the existing lines first")
+    parser.add_argument("--output", type=Path, help="Append labeled records here instead of stdout")
+    parser.add_argument("--batch-size", type=int, default=NDJSON_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=NDJSON_MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    from classify import classify_batch
+
+    lines = follow(args.follow, from_start=args.from_start) if args.follow else sys.stdin
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for record in classify_stream(lines, classify_batch, args.batch_size, args.max_wait_ms):
+            if "target_label" not in record:
+                print(f"line {record['line']}: {record['error']}", file=sys.stderr)
+                continue
+            out.write(dumps(record))
+            out.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
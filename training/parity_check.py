@@ -0,0 +1,192 @@
+"""
+Accuracy-parity check between encoder backends.
+
+Classifies every log message in resources/test.csv and synthetic_logs.csv
+with the reference PyTorch encoder and with the ONNX Runtime encoder (fp32
+or int8), using the deployed classifier, and reports label agreement and
+embedding similarity. Exits non-zero when agreement is below the threshold,
+so it can gate switching ENCODER_BACKEND.
+
+Both encoders are run the way the pipeline runs them (encode_bucketed:
+truncation on token ids, length bucketing). With --long N, N messages longer
+than the truncation limit are added, and each encoder is also checked for
+single-message vs batched parity on them (classify_with_bert vs
+classify_with_bert_batch), for never being fed more than its token limit
+and - with the default ENCODER_MAX_TOKENS=0 - for labeling them exactly as
+its own encode() does, i.e. as the deployed classifier was trained.
+
+Usage:
+  python training/parity_check.py [--quantized] [--min-agreement 0.99] [--long 200]
+  python training/parity_check.py --long 200 --truncation-only      # torch only, no ONNX export needed
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from processor_bert import (  # noqa: E402
+    TorchEncoder, OnnxEncoder, encode_bucketed, get_classifier, truncate_head_tail, truncation_limits,
+)
+from config import BERT_BATCH_SIZE, ENCODER_MAX_TOKENS, ONNX_MODEL_DIR, ONNX_INTRA_OP_THREADS  # noqa: E402
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DATASETS = [PROJECT_ROOT / "resources" / "test.csv", PROJECT_ROOT / "synthetic_logs.csv"]
+
+
+def _labels(embeddings):
+    """Same decision rule as classify_with_bert_batch."""
+    clf = get_classifier()
+    probabilities = clf.predict_proba(embeddings)
+    best = clf.classes_[probabilities.argmax(axis=1)]
+    return np.where(probabilities.max(axis=1) >= 0.5, best, "Unclassified")
+
+
+def run_parity_check(messages, reference, candidate, batch_size=BERT_BATCH_SIZE):
+    """
+    Compare two encoders on the same messages.
+
+    Returns:
+        dict: Label agreement, cosine similarity stats, timings and the disagreeing messages
+    """
+    t0 = time.perf_counter()
+    ref_emb = encode_bucketed(reference, messages, batch_size)
+    t1 = time.perf_counter()
+    cand_emb = encode_bucketed(candidate, messages, batch_size)
+    t2 = time.perf_counter()
+
+    ref_labels = _labels(ref_emb)
+    cand_labels = _labels(cand_emb)
+    cosine = (ref_emb * cand_emb).sum(axis=1) / (
+        np.linalg.norm(ref_emb, axis=1) * np.linalg.norm(cand_emb, axis=1)
+    )
+    differ = np.flatnonzero(ref_labels != cand_labels)
+    return {
+        "messages": len(messages),
+        "agreement": float(1 - len(differ) / len(messages)) if messages else 1.0,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "reference_logs_per_sec": len(messages) / (t1 - t0),
+        "candidate_logs_per_sec": len(messages) / (t2 - t1),
+        "disagreements": [(messages[i], ref_labels[i], cand_labels[i]) for i in differ],
+    }
+
+
+def long_messages(messages, count, min_tokens, tokenizer, seed=0):
+    """count messages of at least min_tokens tokens, each a run of random dataset messages."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        parts = []
+        while len(tokenizer(" ".join(parts), add_special_tokens=False, verbose=False)["input_ids"]) < min_tokens:
+            parts.extend(rng.choices(messages, k=8))
+        out.append(" ".join(parts))
+    return out
+
+
+def run_truncation_check(messages, encoder, batch_size=BERT_BATCH_SIZE):
+    """
+    Encode messages one at a time and batched, both through the pipeline's
+    truncation, and compare; also compare with the encoder's own encode().
+
+    Returns:
+        dict: Longest input fed to the encoder vs its limit, messages cut,
+        label agreement, minimum cosine similarity and the disagreeing
+        messages, and label agreement with encode()
+    """
+    specials = encoder.tokenizer.num_special_tokens_to_add()
+    token_ids, truncated = truncate_head_tail(encoder.tokenizer, messages, *truncation_limits(encoder))
+    batched = encode_bucketed(encoder, messages, batch_size)
+    single = np.vstack([encode_bucketed(encoder, [msg], 1) for msg in messages])
+    stock = np.asarray(encoder.encode(messages, batch_size=batch_size))
+
+    batch_labels = _labels(batched)
+    single_labels = _labels(single)
+    cosine = (batched * single).sum(axis=1) / (
+        np.linalg.norm(batched, axis=1) * np.linalg.norm(single, axis=1)
+    )
+    differ = np.flatnonzero(batch_labels != single_labels)
+    return {
+        "messages": len(messages),
+        "truncated": truncated,
+        "longest_input_tokens": max((len(ids) for ids in token_ids), default=0) + specials,
+        "max_length": encoder.max_length,
+        "agreement": float(1 - len(differ) / len(messages)) if messages else 1.0,
+        "cosine_min": float(cosine.min()) if messages else 1.0,
+        "disagreements": [(messages[i], single_labels[i], batch_labels[i]) for i in differ],
+        "stock_agreement": float(np.mean(_labels(stock) == batch_labels)) if messages else 1.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the ONNX encoder against the PyTorch encoder")
+    parser.add_argument("--quantized", action="store_true", help="Check model_int8.onnx instead of model.onnx")
+    parser.add_argument("--model-dir", type=Path, default=ONNX_MODEL_DIR)
+    parser.add_argument("--threads", type=int, default=ONNX_INTRA_OP_THREADS)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--long", type=int, default=0,
+                        help="Add this many messages longer than the truncation limit and check single vs batch")
+    parser.add_argument("--truncation-only", action="store_true",
+                        help="Only run the long-message check, on the PyTorch encoder")
+    args = parser.parse_args()
+
+    messages = []
+    for path in DATASETS:
+        messages.extend(pd.read_csv(path)["log_message"].dropna().astype(str))
+    messages = list(dict.fromkeys(messages))
+
+    encoders = [TorchEncoder()]
+    if not args.truncation_only:
+        encoders.append(OnnxEncoder(args.model_dir, quantized=args.quantized, intra_op_threads=args.threads))
+    long = long_messages(messages, args.long, 2 * truncation_limits(encoders[0])[0], encoders[0].tokenizer)
+    failed = False
+
+    if not args.truncation_only:
+        report = run_parity_check(messages + long, *encoders)
+
+        print("=" * 80)
+        print(f"ENCODER PARITY: torch vs {'onnx-int8' if args.quantized else 'onnx'}")
+        print("=" * 80)
+        print(f"Messages:          {report['messages']} ({len(long)} long)")
+        print(f"Label agreement:   {report['agreement']:.4%}")
+        print(f"Cosine mean / min: {report['cosine_mean']:.5f} / {report['cosine_min']:.5f}")
+        print(f"Throughput:        torch {report['reference_logs_per_sec']:.1f} logs/s, "
+              f"onnx {report['candidate_logs_per_sec']:.1f} logs/s")
+        for msg, ref, cand in report["disagreements"][:20]:
+            print(f"  {ref:<20} -> {cand:<20} {msg[:60]}")
+        print("=" * 80)
+        if report["agreement"] < args.min_agreement:
+            print(f"FAIL: agreement below {args.min_agreement:.2%}", file=sys.stderr)
+            failed = True
+
+    if long:
+        for encoder in encoders:
+            report = run_truncation_check(long, encoder)
+            print(f"TRUNCATION PARITY ({encoder.name}): single vs batch on {report['messages']} long messages")
+            print(f"  Cut to the limit:    {report['truncated']}")
+            print(f"  Longest input:       {report['longest_input_tokens']} tokens (limit {report['max_length']})")
+            print(f"  Label agreement:     {report['agreement']:.4%}")
+            print(f"  Cosine min:          {report['cosine_min']:.6f}")
+            print(f"  Agreement w/ encode: {report['stock_agreement']:.4%}")
+            for msg, single, batch in report["disagreements"][:20]:
+                print(f"  {single:<20} -> {batch:<20} {msg[:60]}")
+            if report["longest_input_tokens"] > report["max_length"]:
+                print(f"FAIL: {encoder.name} was fed more than {report['max_length']} tokens", file=sys.stderr)
+                failed = True
+            if report["agreement"] < 1.0:
+                print(f"FAIL: {encoder.name} single and batch labels differ", file=sys.stderr)
+                failed = True
+            if ENCODER_MAX_TOKENS <= 0 and report["stock_agreement"] < 1.0:
+                print(f"FAIL: {encoder.name} labels differ from its own encode()", file=sys.stderr)
+                failed = True
+
+    if failed:
+        sys.exit(1)
@@ -5,26 +5,467 @@ This module uses a pre-trained sentence transformer model (all-MiniLM-L6-v2)
 to convert log messages into embeddings, which are then classified using 
 a Logistic Regression model.
 
+Batches are encoded length-aware: messages are sorted by token count so each
+forward pass pads its lines to a similar length. Lines over the encoder's
+limit keep their head, as the encoder itself would cut them; with
+ENCODER_MAX_TOKENS set they are cut to that many tokens, head and tail. The
+cut is made on token ids, which are fed to the encoder as they are, so a
+message never exceeds the cap; single messages (classify_with_bert) go
+through the same path. The padding this saves is counted in the metrics.
+
 Author: Your Name
 Date: February 2026
 """
 
-from sentence_transformers import SentenceTransformer
+import json
+import threading
 import numpy as np
 import joblib
 from pathlib import Path
 
+import inference_sidecar
+import metrics
+import model_registry
+from config import (
+    BERT_BATCH_SIZE,
+    ENCODER_LENGTH_BUCKETING,
+    ENCODER_MAX_TOKENS,
+    ENCODER_TRUNCATE_TAIL_TOKENS,
+    EMBEDDING_STORE_DIR,
+    EMBEDDING_STORE_DTYPE,
+    EMBEDDING_STORE_INFERENCE,
+    ENCODER_BACKEND,
+    ENCODER_MODEL_NAME,
+    ONNX_MODEL_DIR,
+    ONNX_QUANTIZED,
+    ONNX_INTRA_OP_THREADS,
+)
+
+
+# ==================== ENCODER BACKENDS ====================
+# Every backend exposes encode(texts, batch_size) -> (n, 384) float32 matrix
+# (or a single vector for a single string), like SentenceTransformer.encode,
+# encode_ids(token_ids, batch_size) for messages already tokenized (and
+# truncated) without special tokens, plus its (fast) tokenizer and
+# max_length in tokens for length bucketing.
+
+def _special_tokens(tokenizer):
+    """
+    The ids a tokenizer puts before and after a single sequence (e.g. [CLS] / [SEP]),
+    read off its own output so any single-sequence template is reproduced.
+    """
+    plain = tokenizer("log", add_special_tokens=False)["input_ids"]
+    full = tokenizer("log")["input_ids"]
+    for start in range(len(full) - len(plain) + 1):
+        if full[start:start + len(plain)] == plain:
+            return full[:start], full[start + len(plain):]
+    raise ValueError("Could not locate the special tokens of the encoder's tokenizer")
+
+
+def _model_inputs(tokenizer, specials, token_ids):
+    """Add the special tokens to token id lists and right-pad them into int64 model inputs."""
+    prefix, suffix = specials
+    sequences = [prefix + list(ids) + suffix for ids in token_ids]
+    width = max((len(seq) for seq in sequences), default=0)
+    input_ids = np.full((len(sequences), width), tokenizer.pad_token_id or 0, dtype=np.int64)
+    attention_mask = np.zeros((len(sequences), width), dtype=np.int64)
+    for row, seq in enumerate(sequences):
+        input_ids[row, :len(seq)] = seq
+        attention_mask[row, :len(seq)] = 1
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if "token_type_ids" in tokenizer.model_input_names:
+        inputs["token_type_ids"] = np.zeros_like(input_ids)  # one segment
+    return inputs
+
+
+class TorchEncoder:
+    """The PyTorch SentenceTransformer model (reference backend)."""
+    
+    name = "torch"
+    
+    def __init__(self, model_name=ENCODER_MODEL_NAME):
+        # Imported here: torch + sentence_transformers take seconds to import
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.tokenizer = self.model.tokenizer
+        self.max_length = self.model.max_seq_length
+        self.specials = _special_tokens(self.tokenizer)
+    
+    def encode(self, texts, batch_size=BERT_BATCH_SIZE):
+        return self.model.encode(texts, batch_size=batch_size)
+    
+    def encode_ids(self, token_ids, batch_size=BERT_BATCH_SIZE):
+        import torch
+        chunks = []
+        for start in range(0, len(token_ids), batch_size):
+            inputs = _model_inputs(self.tokenizer, self.specials, token_ids[start:start + batch_size])
+            features = {k: torch.from_numpy(v).to(self.model.device) for k, v in inputs.items()}
+            # The same modules (transformer, pooling, normalization) encode() runs
+            with torch.no_grad():
+                chunks.append(self.model(features)["sentence_embedding"].float().cpu().numpy())
+        return np.vstack(chunks) if chunks else np.zeros((0, 384), dtype=np.float32)
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime export of the same model (see export_onnx.py), for CPU-only hosts.
+    
+    Reproduces the SentenceTransformer pipeline: tokenize, run the transformer,
+    mean-pool over the attention mask, L2-normalize.
+    """
+    
+    name = "onnx"
+    
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED,
+                 intra_op_threads=ONNX_INTRA_OP_THREADS):
+        """
+        Args:
+            model_dir (Path): Directory with model.onnx / model_int8.onnx and the tokenizer files
+            quantized (bool): Use the dynamically int8-quantized export
+            intra_op_threads (int): ONNX Runtime intra-op threads (0 = runtime default)
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        model_dir = Path(model_dir)
+        onnx_file = model_dir / ("model_int8.onnx" if quantized else "model.onnx")
+        if not onnx_file.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found: {onnx_file} (run training/export_onnx.py first)"
+            )
+        
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(
+            str(onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.specials = _special_tokens(self.tokenizer)
+        # Same truncation length as the SentenceTransformer model (256 for all-MiniLM-L6-v2)
+        encoder_config = model_dir / "encoder_config.json"
+        self.max_length = (
+            json.loads(encoder_config.read_text())["max_seq_length"]
+            if encoder_config.exists() else 256
+        )
+        self.name = "onnx-int8" if quantized else "onnx"
+    
+    def encode(self, texts, batch_size=BERT_BATCH_SIZE):
+        single = isinstance(texts, str)
+        texts = [texts] if single else [str(t) for t in texts]
+        # Like SentenceTransformer.encode: batch similar lengths together, restore order at the end
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                sorted_texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            chunks.append(self._run(tokens))
+        
+        if not chunks:
+            return np.zeros((0, 384), dtype=np.float32)
+        embeddings = np.empty((len(texts), chunks[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.vstack(chunks)
+        return embeddings[0] if single else embeddings
+    
+    def encode_ids(self, token_ids, batch_size=BERT_BATCH_SIZE):
+        chunks = [
+            self._run(_model_inputs(self.tokenizer, self.specials, token_ids[start:start + batch_size]))
+            for start in range(0, len(token_ids), batch_size)
+        ]
+        return np.vstack(chunks) if chunks else np.zeros((0, 384), dtype=np.float32)
+    
+    def _run(self, tokens):
+        feeds = {k: v.astype(np.int64) for k, v in tokens.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, feeds)[0]
+        
+        # Mean pooling over real (non-padding) tokens, then L2 normalization
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+ENCODER_BACKENDS = {
+    "torch": TorchEncoder,
+    "onnx": OnnxEncoder,
+}
+
+
+# ==================== LENGTH BUCKETING ====================
+ENCODER_TOKENS = metrics.REGISTRY.counter(
+    "bert_encoder_tokens_total",
+    "Tokens fed to the encoder, by kind (real, padding).",
+    ["kind"],
+)
+PADDING_SAVED = metrics.REGISTRY.counter(
+    "bert_padding_saved_tokens_total",
+    "Padding tokens avoided by length bucketing, versus batching in input order.",
+)
+TRUNCATED = metrics.REGISTRY.counter(
+    "bert_truncated_logs_total",
+    "Messages cut to the encoder's limit or to ENCODER_MAX_TOKENS (head and tail kept).",
+)
+
+
+def truncation_limits(model):
+    """
+    How an encoder's messages are cut, in tokens excluding special tokens.
+    
+    With ENCODER_MAX_TOKENS=0 (default) they are cut like SentenceTransformer
+    cuts them - the head, at the model's limit - so the vectors are those the
+    deployed classifier was trained on. Head + tail truncation changes the
+    vectors of long messages and needs a retrain.
+    
+    Returns:
+        tuple: (max tokens, tail tokens)
+    """
+    limit = model.max_length - model.tokenizer.num_special_tokens_to_add()
+    if ENCODER_MAX_TOKENS <= 0:
+        return limit, 0
+    return max(1, min(ENCODER_MAX_TOKENS, limit)), ENCODER_TRUNCATE_TAIL_TOKENS
+
+
+def truncate_head_tail(tokenizer, texts, max_tokens, tail_tokens=ENCODER_TRUNCATE_TAIL_TOKENS):
+    """
+    Tokenize messages and cut those longer than max_tokens to their first and last tokens.
+    
+    The encoder would otherwise keep only the head of a multi-KB line; the
+    tail often holds what matters in a log (status, error, outcome). The cut
+    is made on the token ids, which are encoded as they are: joining the
+    head and tail text and tokenizing it again can come out longer than the
+    cap (a word split differently at the seam).
+    
+    Args:
+        tokenizer: Tokenizer of the encoder
+        texts (list): Messages
+        max_tokens (int): Tokens kept per message, excluding special tokens
+        tail_tokens (int): How many of them come from the end
+        
+    Returns:
+        tuple: (token id list per message without special tokens, number of messages cut)
+    """
+    token_ids = tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]
+    tail = min(tail_tokens, max_tokens // 2)
+    head = max_tokens - tail
+    out, truncated = [], 0
+    for ids in token_ids:
+        if len(ids) > max_tokens:
+            ids = ids[:head] + (ids[-tail:] if tail else [])
+            truncated += 1
+        out.append(ids)
+    return out, truncated
+
+
+def _padding(lengths, batches):
+    """Padding tokens when each batch is padded to its longest message."""
+    return int(sum(len(batch) * lengths[batch].max() - lengths[batch].sum() for batch in batches))
+
+
+def encode_bucketed(model, texts, batch_size):
+    """
+    Encode messages in forward passes of batch_size, grouped by token count.
+    
+    Messages are tokenized and cut (see truncation_limits), sorted by token count, encoded batch by batch from those ids, and
+    the vectors put back in input order. Encoders without a tokenizer are
+    called directly.
+    
+    Args:
+        model: Encoder backend (see ENCODER_BACKENDS)
+        texts (list): Messages
+        batch_size (int): Messages per forward pass
+        
+    Returns:
+        ndarray: (n, dim) embeddings in input order
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None or len(texts) == 0:
+        return model.encode(texts, batch_size=batch_size)
+    
+    specials = tokenizer.num_special_tokens_to_add()
+    max_tokens, tail_tokens = truncation_limits(model)
+    token_ids, truncated = truncate_head_tail(tokenizer, [str(t) for t in texts], max_tokens, tail_tokens)
+    lengths = np.asarray([len(ids) for ids in token_ids]) + specials
+    
+    in_order = np.arange(len(token_ids))
+    order = np.argsort(lengths, kind="stable") if ENCODER_LENGTH_BUCKETING else in_order
+    batches = [order[start:start + batch_size] for start in range(0, len(token_ids), batch_size)]
+    padding = _padding(lengths, batches)
+    ENCODER_TOKENS.inc(int(lengths.sum()), kind="real")
+    ENCODER_TOKENS.inc(padding, kind="padding")
+    unsorted = [in_order[start:start + batch_size] for start in range(0, len(token_ids), batch_size)]
+    PADDING_SAVED.inc(_padding(lengths, unsorted) - padding)
+    TRUNCATED.inc(truncated)
+    
+    embeddings = None
+    for batch in batches:
+        vectors = model.encode_ids([token_ids[i] for i in batch], batch_size=len(batch))
+        if embeddings is None:
+            embeddings = np.empty((len(token_ids), vectors.shape[1]), dtype=np.float32)
+        embeddings[batch] = vectors
+    return embeddings
+
+
+def length_stats():
+    """
+    Length bucketing and truncation counters for GET /metrics.
+    
+    Returns:
+        dict: Settings, real / padding tokens encoded, padding saved versus
+        input-order batching (tokens and share) and truncated messages
+    """
+    tokens = ENCODER_TOKENS.values()
+    real, padding = tokens.get("real", 0), tokens.get("padding", 0)
+    saved = PADDING_SAVED.values().get((), 0)
+    return {
+        "bucketing": ENCODER_LENGTH_BUCKETING,
+        "max_tokens": ENCODER_MAX_TOKENS or "model",
+        "tail_tokens": ENCODER_TRUNCATE_TAIL_TOKENS if ENCODER_MAX_TOKENS > 0 else 0,
+        "real_tokens": real,
+        "padding_tokens": padding,
+        "padding_share": round(padding / (real + padding), 4) if real + padding else None,
+        "padding_saved_tokens": saved,
+        "padding_saved_share": round(saved / (padding + saved), 4) if padding + saved else None,
+        "truncated_logs": TRUNCATED.values().get((), 0),
+    }
+
+
+def create_encoder(backend=ENCODER_BACKEND):
+    """
+    Build the sentence encoder for a backend name ("torch" or "onnx").
+    """
+    try:
+        return ENCODER_BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown ENCODER_BACKEND {backend!r}; expected one of {sorted(ENCODER_BACKENDS)}"
+        ) from None
+
+
 # ==================== MODEL INITIALIZATION ====================
-# Load models once at module level for efficiency
-# This prevents reloading the model on every function call
+# Models are loaded once, on first use (or by warmup() at server startup), so
+# importing this module - and the server - stays fast.
+
+# Logistic Regression classifier: Trained on log embeddings (see training.ipynb / retrain.py).
+# The file served is that of the registry's active version (model_registry.served_files)
+
+_encoder = None
+_clf = None
+_clf_signature = None
+_store = None
+_load_lock = threading.Lock()
+
+
+def get_encoder():
+    """Return the sentence encoder (backend chosen by ENCODER_BACKEND), loading it on first use."""
+    global _encoder
+    if _encoder is None:
+        with _load_lock:
+            if _encoder is None:
+                _encoder = create_encoder()
+    return _encoder
+
+
+def get_classifier():
+    """
+    Return the Logistic Regression classifier, loading it on first use.
+    
+    Reloads it when the registry's active version changes (retraining or an
+    activate / rollback). The swap is a single reference assignment: batches
+    already running keep the classifier they started with, new batches get
+    the new one.
+    """
+    global _clf, _clf_signature
+    version, path, _ = model_registry.served_files()
+    if _clf is None or version != _clf_signature:
+        with _load_lock:
+            if _clf is None or version != _clf_signature:
+                if path is None:
+                    raise FileNotFoundError(f"No classifier: {model_registry.ACTIVE_MODEL_PATH} is missing")
+                clf = joblib.load(path)
+                _clf, _clf_signature = clf, version
+    return _clf
+
+
+def encoder_id():
+    """
+    Identify the encoder whose vectors the embedding store holds.
+    
+    Different backends / models produce (slightly) different vectors, so
+    switching either one must not reuse stored embeddings.
+    """
+    backend = "onnx-int8" if ENCODER_BACKEND == "onnx" and ONNX_QUANTIZED else ENCODER_BACKEND
+    if ENCODER_MAX_TOKENS <= 0:
+        return f"{backend}:{ENCODER_MODEL_NAME}"
+    # Head + tail truncation changes the vectors of long messages
+    return f"{backend}:{ENCODER_MODEL_NAME}:trunc-ids{ENCODER_MAX_TOKENS}/{ENCODER_TRUNCATE_TAIL_TOKENS}"
+
 
-# SentenceTransformer: Converts text to 384-dimensional embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
+def get_embedding_store():
+    """Return the persistent embedding store (see embedding_store.py), opening it on first use."""
+    global _store
+    if _store is None:
+        from embedding_store import EmbeddingStore
+        with _load_lock:
+            if _store is None:
+                _store = EmbeddingStore(EMBEDDING_STORE_DIR, encoder_id(), dtype=EMBEDDING_STORE_DTYPE)
+    return _store
 
-# Logistic Regression classifier: Trained on log embeddings (see training.ipynb / retrain.py)
-# Path is relative to project root so it works when running from training/ or server
-model_path = Path(__file__).parent.parent / 'models' / 'log_classification_model.pkl'
-clf = joblib.load(model_path)
+
+def encode_messages(log_msgs, batch_size=None, store_mode=EMBEDDING_STORE_INFERENCE):
+    """
+    Encode messages in length-bucketed chunks of batch_size, going through the embedding store.
+    
+    Args:
+        log_msgs (list): The log messages to encode
+        batch_size (int): Messages per encoder forward pass (default: BERT_BATCH_SIZE)
+        store_mode (str): "off", "read" (reuse stored vectors) or "readwrite"
+            (also store the vectors encoded here)
+        
+    Returns:
+        ndarray: (n, 384) embeddings in input order
+    """
+    if inference_sidecar.enabled():
+        return inference_sidecar.encode_messages(log_msgs, batch_size, store_mode)
+    model = get_encoder()
+    log_msgs = list(log_msgs)
+    batch_size = batch_size or BERT_BATCH_SIZE
+    if store_mode == "off":
+        return encode_bucketed(model, log_msgs, batch_size)
+    if store_mode not in ("read", "readwrite"):
+        raise ValueError(f"Embedding store mode must be 'off', 'read' or 'readwrite', got {store_mode!r}")
+    return get_embedding_store().encode(
+        log_msgs,
+        lambda msgs, size: encode_bucketed(model, msgs, size),
+        batch_size,
+        write=store_mode == "readwrite",
+    )
+
+
+def is_loaded():
+    """True once both the encoder and the classifier are in memory (in the sidecar, if one is used)."""
+    if inference_sidecar.enabled():
+        return inference_sidecar.status()["ready"]
+    return _encoder is not None and _clf is not None
+
+
+def model_signature():
+    """
+    Identify the classifier being served.
+    
+    Changes whenever retrain.py registers a new model or the registry
+    activates another version, so caches of BERT labels can tell that their
+    entries are stale.
+    
+    Returns:
+        str: The registry's active version id, or None if there is no model
+    """
+    return model_registry.served_files()[0]
 
 
 # ==================== CLASSIFICATION FUNCTION ====================
@@ -49,19 +490,49 @@ def classify_with_bert(log_msg):
         - Workflow Error
         - Deprecation Warning
     """
-    # Convert log message to embedding (384-dim vector)
-    log_embedding = model.encode(log_msg)
+    # Same encoding (head + tail truncation, embedding store) and decision
+    # rule as the batch path, so a message gets the same label either way
+    return classify_with_bert_batch([log_msg], batch_size=1)[0]
+
+
+def classify_with_bert_batch(log_msgs, batch_size=None):
+    """
+    Classify many log messages with one chunked encode and one predict_proba.
+    
+    classify_with_bert is this function on a single message. The argmax of
+    predict_proba is the class LogisticRegression.predict returns, so a single
+    probability matrix gives both the label and the confidence.
+    
+    Args:
+        log_msgs (list): The log messages to classify
+        batch_size (int): Messages per encoder forward pass (default: BERT_BATCH_SIZE)
+        
+    Returns:
+        list: One label (or "Unclassified") per input message, in input order
+    """
+    if len(log_msgs) == 0:
+        return []
+    if inference_sidecar.enabled():
+        return inference_sidecar.classify_with_bert_batch(log_msgs, batch_size)
+    
+    clf = get_classifier()
     
-    # Get prediction probabilities for all classes
-    probabilities = clf.predict_proba([log_embedding])[0]
+    # Encode all messages in chunks of batch_size -> (n, 384) matrix,
+    # reusing vectors already in the embedding store
+    with metrics.time_stage("bert_encode", len(log_msgs)):
+        embeddings = encode_messages(log_msgs, batch_size)
+    metrics.STAGE_BATCH_LOGS.observe(len(log_msgs), stage="bert")
     
-    # If confidence is too low (< 50%), return "Unclassified"
-    if max(probabilities) < 0.5:
-        return "Unclassified"
+    # One probability matrix for the whole batch
+    with metrics.time_stage("bert_predict", len(log_msgs)):
+        probabilities = clf.predict_proba(embeddings)
+    best = probabilities.argmax(axis=1)
+    confident = probabilities.max(axis=1) >= 0.5
     
-    # Predict the most likely class
-    label = clf.predict([log_embedding])[0]
-    return label
+    return [
+        clf.classes_[idx] if ok else "Unclassified"
+        for idx, ok in zip(best, confident)
+    ]
 
 
 # ==================== TESTING ====================
@@ -0,0 +1,265 @@
+"""
+Lexical Pre-classifier Stage
+
+Many logs that miss the regex rules are still lexically obvious ("status:
+200", "Unauthorized access", "Email service experiencing issues"). This
+stage answers them with a hashed bag-of-words linear model - a sparse dot
+product per message - before they reach the transformer encoder.
+
+Messages are reduced to their template first (template_miner), so IDs,
+numbers and IPs don't become features; the template's word unigrams and
+bigrams are hashed into a fixed-size vector (no vocabulary to store) and
+scored by Logistic Regression. The stage answers only when the top class
+probability reaches the threshold calibrated by retrain.py on held-out data
+(the lowest threshold whose answered rows are at least
+LEXICAL_TARGET_PRECISION correct); everything else falls through to BERT.
+
+Streaming retrains (RETRAIN_MODE=streaming) fit an SGD log-loss model on the
+same hashed features with partial_fit instead, one chunk at a time.
+
+The model is trained and registered together with the BERT classifier, so
+activating or rolling back a model version switches both. At inference a
+sample of answered logs (LEXICAL_SHADOW_RATE) is also sent to BERT, and
+agreement between the two is reported in GET /metrics.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import threading
+
+import joblib
+import numpy as np
+
+import metrics
+import model_registry
+from config import LEXICAL_ENABLED, LEXICAL_N_FEATURES, LEXICAL_TARGET_PRECISION, LEXICAL_MIN_CONFIDENCE
+from template_miner import extract_template
+
+_model = None
+_model_signature = None
+_load_lock = threading.Lock()
+
+OFFERED = metrics.REGISTRY.counter(
+    "lexical_logs_total",
+    "Logs offered to the lexical stage, by outcome (answered, deferred to BERT).",
+    ["outcome"],
+)
+SHADOW = metrics.REGISTRY.counter(
+    "lexical_shadow_checks_total",
+    "Lexically answered logs also classified by BERT, by result (agree, disagree).",
+    ["result"],
+)
+
+
+# ==================== TRAINING ====================
+def normalize(log_message):
+    """Feature text: the lowercased template, so variable tokens don't become features."""
+    return extract_template(str(log_message)).lower()
+
+
+def _vectorizer():
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        preprocessor=normalize,
+        ngram_range=(1, 2),
+        n_features=LEXICAL_N_FEATURES,
+        alternate_sign=False,
+    )
+
+
+def build_pipeline():
+    """Unfitted hashing-vectorizer + Logistic Regression pipeline."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(
+        _vectorizer(),
+        # saga: fast on sparse, high-dimensional input (lbfgs is ~5x slower here)
+        LogisticRegression(solver="saga", C=10.0, tol=1e-3, max_iter=500),
+    )
+
+
+def build_streaming_pipeline():
+    """
+    Unfitted hashing-vectorizer + SGD (log loss) pipeline for streaming
+    retrains: the vectorizer is stateless, so the model can be fit chunk by
+    chunk with partial_fit.
+    """
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(_vectorizer(), SGDClassifier(loss="log_loss", alpha=1e-6, random_state=42))
+
+
+def partial_fit(pipeline, messages, labels, classes):
+    """Update a streaming pipeline with one chunk of examples."""
+    pipeline[-1].partial_fit(pipeline[0].transform(messages), labels, classes=classes)
+
+
+def calibrate_threshold(confidence, correct, target=LEXICAL_TARGET_PRECISION):
+    """
+    Lowest confidence threshold whose answered rows are at least `target` correct.
+
+    Args:
+        confidence (ndarray): Top class probability per held-out row
+        correct (ndarray): Whether that row's prediction was right
+        target (float): Required precision of the answered rows
+
+    Returns:
+        float: The threshold (never below LEXICAL_MIN_CONFIDENCE); above 1.0
+        when no threshold reaches the target, i.e. the stage never answers
+    """
+    order = np.argsort(-confidence, kind="stable")
+    precision = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    ok = np.nonzero(precision >= target)[0]
+    if len(ok) == 0:
+        return 1.01
+    # Answering the top ok[-1] + 1 rows still meets the target; cut at the last of them
+    return float(max(confidence[order][ok[-1]], LEXICAL_MIN_CONFIDENCE))
+
+
+def train(messages, labels, holdout=None, bert_holdout_labels=None):
+    """
+    Fit the lexical model and calibrate its threshold.
+
+    Args:
+        messages (list): Log messages
+        labels (Series or list): Their labels
+        holdout (tuple): (train indexes, holdout indexes) used for calibration;
+            None uses LEXICAL_MIN_CONFIDENCE uncalibrated
+        bert_holdout_labels (list): BERT's predictions for the holdout rows,
+            to report how often the two stages agree
+
+    Returns:
+        tuple: (model dict for save / the registry, metrics dict)
+    """
+    messages = np.asarray([str(m) for m in messages], dtype=object)
+    labels = np.asarray([str(label) for label in labels], dtype=object)
+    stats = {}
+    threshold = LEXICAL_MIN_CONFIDENCE
+    if holdout is not None:
+        train_idx, test_idx = holdout
+        pipeline = build_pipeline().fit(messages[train_idx], labels[train_idx])
+        probabilities = pipeline.predict_proba(messages[test_idx])
+        predicted = pipeline.classes_[probabilities.argmax(axis=1)]
+        threshold, stats = calibrate(predicted, probabilities.max(axis=1), labels[test_idx], bert_holdout_labels)
+
+    pipeline = build_pipeline().fit(messages, labels)
+    stats["threshold"] = round(threshold, 4)
+    stats["target_precision"] = LEXICAL_TARGET_PRECISION
+    return {"pipeline": pipeline, "threshold": threshold}, stats
+
+
+def calibrate(predicted, confidence, labels, bert_labels=None):
+    """
+    Threshold and held-out stats of a lexical model from its held-out predictions.
+
+    Args:
+        predicted (ndarray): Lexical label per held-out row
+        confidence (ndarray): Its top class probability
+        labels (ndarray): True labels
+        bert_labels (list): BERT's predictions for the same rows, or None
+
+    Returns:
+        tuple: (threshold, stats dict)
+    """
+    correct = predicted == labels
+    threshold = calibrate_threshold(confidence, correct)
+    answered = confidence >= threshold
+    stats = {
+        "holdout_accuracy": round(float(correct.mean()), 4),
+        "holdout_coverage": round(float(answered.mean()), 4),
+        "holdout_answered_precision": round(float(correct[answered].mean()), 4) if answered.any() else None,
+    }
+    if bert_labels is not None and answered.any():
+        bert = np.asarray([str(label) for label in bert_labels], dtype=object)
+        stats["holdout_bert_agreement"] = round(float((predicted[answered] == bert[answered]).mean()), 4)
+    return threshold, stats
+
+
+# ==================== MODEL LOADING ====================
+def model_signature():
+    """Registry version of the active lexical model, or None when that version has none."""
+    version, _, path = model_registry.served_files()
+    return version if path is not None else None
+
+
+def get_model():
+    """
+    Return the active lexical model dict (pipeline, threshold), or None when
+    the stage is disabled or the active version has none. Reloaded when the
+    registry activates another version, like processor_bert.get_classifier.
+    """
+    global _model, _model_signature
+    if not LEXICAL_ENABLED:
+        return None
+    version, _, path = model_registry.served_files()
+    signature = version if path is not None else None
+    if signature != _model_signature:
+        with _load_lock:
+            if signature != _model_signature:
+                _model = joblib.load(path) if path is not None else None
+                _model_signature = signature
+    return _model
+
+
+# ==================== CLASSIFICATION FUNCTION ====================
+def classify_with_lexical_batch(log_msgs):
+    """
+    Classify the messages the lexical model is confident about.
+
+    Args:
+        log_msgs (list): Log messages (regex misses)
+
+    Returns:
+        list: A label per message, or None where the message should go to BERT
+    """
+    model = get_model()
+    if model is None or not log_msgs:
+        return [None] * len(log_msgs)
+
+    with metrics.time_stage("lexical", len(log_msgs)):
+        pipeline = model["pipeline"]
+        probabilities = pipeline.predict_proba(log_msgs)
+        best = probabilities.argmax(axis=1)
+        confident = probabilities.max(axis=1) >= model["threshold"]
+    metrics.STAGE_BATCH_LOGS.observe(len(log_msgs), stage="lexical")
+
+    answered = int(confident.sum())
+    OFFERED.inc(answered, outcome="answered")
+    OFFERED.inc(len(log_msgs) - answered, outcome="deferred")
+    return [pipeline.classes_[idx] if ok else None for idx, ok in zip(best, confident)]
+
+
+def record_shadow(lexical_labels, bert_labels):
+    """Count agreement of lexically answered logs that were also sent to BERT."""
+    agree = sum(a == b for a, b in zip(lexical_labels, bert_labels))
+    SHADOW.inc(agree, result="agree")
+    SHADOW.inc(len(lexical_labels) - agree, result="disagree")
+
+
+def stats():
+    """
+    Coverage and BERT agreement for GET /metrics.
+
+    Returns:
+        dict: enabled, loaded, threshold, answered / deferred counts, coverage
+        (answered / offered) and agreement with BERT on the shadow sample
+    """
+    model = get_model()
+    offered = OFFERED.values()
+    shadow = SHADOW.values()
+    answered, deferred = offered.get("answered", 0), offered.get("deferred", 0)
+    checked = shadow.get("agree", 0) + shadow.get("disagree", 0)
+    return {
+        "enabled": LEXICAL_ENABLED,
+        "loaded": model is not None,
+        "threshold": round(model["threshold"], 4) if model is not None else None,
+        "answered": answered,
+        "deferred": deferred,
+        "coverage": round(answered / (answered + deferred), 4) if answered + deferred else None,
+        "shadow_checked": checked,
+        "bert_agreement": round(shadow.get("agree", 0) / checked, 4) if checked else None,
+    }
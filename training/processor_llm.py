@@ -5,14 +5,51 @@ This module uses Groq's LLM API to classify complex log messages that don't
 match regex patterns or are from legacy systems. It leverages large language 
 models for semantic understanding of log content.
 
+Every request has a timeout (LLM_REQUEST_TIMEOUT) and each batch a latency
+budget (LLM_BATCH_TIMEOUT). Failed requests feed a circuit breaker: after
+LLM_BREAKER_FAILURES consecutive failures no request is sent for
+LLM_BREAKER_RESET_SECONDS, then one probe decides whether it closes again.
+Logs the LLM does not answer come back as None, and classify.py applies
+the LLM_FALLBACK.
+
+Answers are normalized to LLM_LABELS and kept in a persistent response
+cache (llm_cache.py, keyed on message, LLM_MODEL and PROMPT_VERSION), so a
+repeated message is not sent again, even after a restart or while the
+breaker is open.
+
 Author: Your Name
 Date: February 2026
 """
 
-from groq import Groq
+import asyncio
+import email.utils
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from pathlib import Path
+
+import groq as groq_errors
+from groq import AsyncGroq
 from dotenv import load_dotenv
-import os 
-from pathlib import Path 
+
+import llm_cache
+import metrics
+from config import (
+    LLM_MODEL,
+    LLM_CONCURRENCY,
+    LLM_REQUESTS_PER_SECOND,
+    LLM_MAX_RETRIES,
+    LLM_PACK_SIZE,
+    LLM_REQUEST_TIMEOUT,
+    LLM_BATCH_TIMEOUT,
+    LLM_BREAKER_FAILURES,
+    LLM_BREAKER_RESET_SECONDS,
+    LLM_CACHE_ENABLED,
+)
 
 # ==================== ENVIRONMENT SETUP ====================
 # Get the directory where this script is located
@@ -22,8 +59,235 @@ env_path = current_dir / '.env'
 # Load environment variables from .env file (contains GROQ_API_KEY)
 load_dotenv(dotenv_path=env_path)
 
-# Initialize Groq client with API key from environment
-groq = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# The Groq client reads GROQ_API_KEY from the environment. It is created on
+# first use so importing this module works without a key. GROQ_BASE_URL (read
+# by the Groq SDK) points it at another chat-completions server, e.g.
+# llm_stub_server.py for offline runs.
+#
+# LLM_CONCURRENCY and LLM_REQUESTS_PER_SECOND are limits for the whole
+# process, so the semaphore, the rate limiter and the client are held once
+# per event loop (asyncio primitives can't be shared between loops), and the
+# synchronous entry points all run on one long-lived loop (_llm_loop) rather
+# than a fresh asyncio.run per call.
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+_shared = weakref.WeakKeyDictionary()  # event loop -> _SharedLimits
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def is_configured():
+    """True if an API key is available, i.e. LLM calls can be attempted."""
+    return bool(os.getenv("GROQ_API_KEY"))
+
+# Labels the LLM is asked to choose from
+LLM_LABELS = ("Workflow Error", "Deprecation Warning", "Unclassified")
+
+# Errors worth retrying: throttling, timeouts, dropped connections and 5xx.
+# Only these count as breaker failures; a 4xx (bad request, auth) means the
+# API is up and the request itself is wrong.
+_RETRYABLE_ERRORS = (
+    groq_errors.RateLimitError,
+    groq_errors.APITimeoutError,
+    groq_errors.APIConnectionError,
+    groq_errors.InternalServerError,
+)
+# Longest Retry-After honored; the batch budget bounds the total wait anyway
+_MAX_RETRY_AFTER = 60.0
+
+UNANSWERED = metrics.REGISTRY.counter(
+    "llm_unanswered_logs_total",
+    "Logs the LLM stage gave no label, by reason (breaker_open, error, budget, not_configured).",
+    ["reason"],
+)
+BREAKER_TRANSITIONS = metrics.REGISTRY.counter(
+    "llm_breaker_transitions_total",
+    "Circuit breaker state changes, by new state (open, half_open, closed).",
+    ["state"],
+)
+
+
+# ==================== CIRCUIT BREAKER ====================
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open: the request was not sent."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker shared by every LLM request of the process.
+
+    closed: requests are sent; `failure_threshold` failures in a row open it.
+    open: requests are refused for `reset_seconds`, then it turns half_open.
+    half_open: a single probe request is let through; its success closes the
+    breaker, its failure opens it again. A threshold of 0 disables it.
+    """
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_TRANSITIONS.inc(state=state)
+
+    def allow(self):
+        """True if a request may be sent now (in half_open, only for the one probe)."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._set_state("half_open")
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def is_open(self):
+        """True while requests would be refused (without claiming the half-open probe)."""
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def release_probe(self):
+        """End a request that says nothing about the API's health (cancelled, 4xx) without a verdict."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def stats(self):
+        """State, consecutive failures and seconds until the next probe (while open)."""
+        with self._lock:
+            retry_in = None
+            if self.state == "open":
+                retry_in = round(max(0.0, self.opened_at + self.reset_seconds - time.monotonic()), 3)
+            return {
+                "enabled": self.failure_threshold > 0,
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in_seconds": retry_in,
+            }
+
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+
+
+def stats():
+    """Circuit breaker state, unanswered-log counts and response cache stats for GET /metrics."""
+    cache = get_cache()
+    return {
+        "configured": is_configured(),
+        "request_timeout_seconds": LLM_REQUEST_TIMEOUT,
+        "batch_timeout_seconds": LLM_BATCH_TIMEOUT,
+        "breaker": breaker.stats(),
+        "unanswered": UNANSWERED.values(),
+        "cache": {"enabled": True, **cache.stats()} if cache is not None else {"enabled": False},
+    }
+
+
+# ==================== PROMPTS ====================
+def _build_prompt(log_message):
+    return f'''Classify the following log message into one of these categories: 
+    (1) Workflow Error, (2) Deprecation Warning. 
+    
+    If you are not sure, return "Unclassified".
+    Only return the category name, no other text or explanation.
+    
+    Log message: {log_message}
+    '''
+
+
+def _build_packed_prompt(log_messages):
+    numbered = "\n".join(f"{i}. {msg}" for i, msg in enumerate(log_messages, start=1))
+    return f'''Classify each of the following log messages into one of these categories: 
+    (1) Workflow Error, (2) Deprecation Warning. 
+    
+    If you are not sure about a message, use "Unclassified".
+    Answer with exactly one line per message, in the same order, formatted as
+    "<number>. <category name>", and no other text or explanation.
+    
+    Log messages:
+{numbered}
+    '''
+
+
+# Part of the response cache key: editing a prompt starts a fresh set of cached answers
+PROMPT_VERSION = hashlib.blake2b(
+    (_build_prompt("{log_message}") + _build_packed_prompt(["{log_message}"])).encode("utf-8"), digest_size=4
+).hexdigest()
+
+_PACKED_LINE = re.compile(r"^\s*(\d+)\s*[.):-]\s*(.+?)\s*$")
+
+
+def _parse_label(text):
+    """The LLM_LABELS entry a completion line names, or None if it names none of them."""
+    cleaned = text.strip().strip('"\'*` .').lower()
+    for label in LLM_LABELS:
+        if cleaned == label.lower():
+            return label
+    return None
+
+
+def _normalize_label(text):
+    """Map a completion line onto LLM_LABELS ("Unclassified" if it names none of them)."""
+    return _parse_label(text) or "Unclassified"
+
+
+def _parse_packed_response(text, count):
+    """
+    Parse one "<number>. <label>" line per message out of a packed completion.
+    
+    Returns:
+        list or None: Labels in message order (None where a line names no
+        label), or None if any message is missing
+    """
+    labels = {}
+    for line in text.splitlines():
+        m = _PACKED_LINE.match(line)
+        if m and 1 <= int(m.group(1)) <= count:
+            labels[int(m.group(1))] = _parse_label(m.group(2))
+    if len(labels) != count:
+        return None
+    return [labels[i] for i in range(1, count + 1)]
+
+
+# ==================== RESPONSE CACHE ====================
+def get_cache():
+    """The persistent response cache, opened on first use; None when LLM_CACHE_ENABLED is off."""
+    global _cache
+    if LLM_CACHE_ENABLED and _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = llm_cache.get_cache()
+    return _cache
+
+
+def warm_cache():
+    """Load the most recently used cached answers into memory (called at startup)."""
+    cache = get_cache()
+    return cache.warm() if cache is not None else 0
 
 
 # ==================== CLASSIFICATION FUNCTION ====================
@@ -40,35 +304,335 @@ def classify_with_llm(log_message):
         log_message (str): The log message to classify
         
     Returns:
-        str: The predicted category or "Unclassified" if uncertain
+        str: The predicted category (normalized to LLM_LABELS), or "Unclassified"
+        if uncertain or unanswered (no API key, breaker open, request failed;
+        counted in UNANSWERED like the batch stage)
         
     Categories:
         - Workflow Error
         - Deprecation Warning
         - Unclassified (if uncertain)
     """
-    # Create a detailed prompt for the LLM
-    prompt = f'''Classify the following log message into one of these categories: 
-    (1) Workflow Error, (2) Deprecation Warning. 
+    cache = get_cache()
+    if cache is not None:
+        key = cache.key(log_message, LLM_MODEL, PROMPT_VERSION)
+        cached = cache.get_many([key])
+        if key in cached:
+            return cached[key]
     
-    If you are not sure, return "Unclassified".
-    Only return the category name, no other text or explanation.
+    if not is_configured() or breaker.is_open():
+        UNANSWERED.inc(reason="breaker_open" if is_configured() else "not_configured")
+        return "Unclassified"
     
-    Log message: {log_message}
-    '''
+    async def classify():
+        # Same semaphore, rate limiter and breaker as the batch stage
+        limits = _limits()
+        return await _complete(
+            limits.client, _build_prompt(log_message), limits.semaphore, limits.limiter, LLM_MAX_RETRIES
+        )
     
     # Call Groq API; model name may change — see https://console.groq.com/docs/models
-    response = groq.chat.completions.create(
-        model="llama-3.1-8b-instant",
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+    try:
+        label = _parse_label(_run_coroutine(classify()))
+    except CircuitOpenError:
+        UNANSWERED.inc(reason="breaker_open")
+        return "Unclassified"
+    except Exception:
+        UNANSWERED.inc(reason="error")
+        return "Unclassified"
+    if label is None:
+        # An answer naming no label is not cached: the next call asks again
+        return "Unclassified"
+    if cache is not None:
+        cache.put_many([(key, label)], LLM_MODEL, PROMPT_VERSION)
+    return label
+
+
+# ==================== ASYNC BATCH STAGE ====================
+class AsyncRateLimiter:
+    """
+    Token-bucket limiter shared by all concurrent LLM requests on an event loop.
+    
+    Allows `rate` requests per second with bursts of up to `rate` requests;
+    a rate of 0 disables limiting.
+    """
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _SharedLimits:
+    """The semaphore, rate limiter and client every LLM request on one event loop goes through."""
+    
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+        self.limiter = AsyncRateLimiter(LLM_REQUESTS_PER_SECOND)
+        self.client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0, timeout=LLM_REQUEST_TIMEOUT)
+
+
+def _limits():
+    """The running event loop's _SharedLimits, created on first use (call from a coroutine)."""
+    loop = asyncio.get_running_loop()
+    limits = _shared.get(loop)
+    if limits is None:
+        limits = _shared[loop] = _SharedLimits()
+    return limits
+
+
+async def _complete(client, prompt, semaphore, limiter, max_retries):
+    """
+    Send one chat completion with bounded concurrency, rate limiting and retries.
+
+    Throttling (429), 5xx, timeouts and connection errors are retried with
+    jittered exponential backoff, or after the response's Retry-After, and
+    count as breaker failures. Other errors (e.g. 400, 401) and cancellation
+    are raised without touching the breaker's failure count.
+
+    Raises:
+        CircuitOpenError: If the breaker is (or turns) open before an attempt
+    """
+    for attempt in range(max_retries + 1):
+        async with semaphore:
+            await limiter.acquire()
+            if not breaker.allow():
+                raise CircuitOpenError("LLM circuit breaker is open")
+            t0 = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                )
+                metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - t0, outcome="ok")
+                breaker.record_success()
+                return response.choices[0].message.content
+            except _RETRYABLE_ERRORS as e:
+                outcome = "error" if attempt == max_retries else "retry"
+                metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - t0, outcome=outcome)
+                breaker.record_failure()
+                if attempt == max_retries:
+                    raise
+                delay = _retry_after_seconds(e)
+            except asyncio.CancelledError:
+                # Cancelled by the batch budget: not a verdict on the API
+                breaker.release_probe()
+                raise
+            except Exception:
+                # Non-retryable API errors (4xx) and anything unexpected
+                breaker.release_probe()
+                raise
+        if delay is None:
+            # Exponential backoff with jitter
+            delay = min(0.5 * 2 ** attempt, 8.0) * (0.5 + random.random())
+        # Outside the semaphore so other requests proceed
+        await asyncio.sleep(delay)
+
+
+def _retry_after_seconds(error):
+    """
+    Wait asked for by a throttled / unavailable response (retry-after-ms or
+    Retry-After in seconds or as an HTTP date), capped at _MAX_RETRY_AFTER.
+
+    Returns:
+        float or None: Seconds to wait, or None if the response set no (valid) header
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            seconds = float(headers["retry-after-ms"]) / 1000
+        elif "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                seconds = float(value)
+            except ValueError:
+                seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return min(max(0.0, seconds), _MAX_RETRY_AFTER)
+
+
+async def classify_with_llm_batch_async(
+    log_messages,
+    concurrency=None,
+    requests_per_second=None,
+    max_retries=None,
+    pack_size=None,
+    timeout=None,
+):
+    """
+    Classify many log messages with concurrent Groq requests.
+    
+    Args:
+        log_messages (list): The log messages to classify
+        concurrency (int): Maximum requests in flight (default: LLM_CONCURRENCY)
+        requests_per_second (float): Client-side rate limit, 0 = unlimited
+            (default: LLM_REQUESTS_PER_SECOND)
+        max_retries (int): Retries per request on throttling, timeouts and 5xx
+            (default: LLM_MAX_RETRIES)
+        pack_size (int): Messages packed into one prompt; 1 sends one prompt per
+            message exactly like classify_with_llm (default: LLM_PACK_SIZE)
+        timeout (float): Latency budget for the whole batch in seconds, 0 = none
+            (default: LLM_BATCH_TIMEOUT)
+        
+    Returns:
+        list: One label per input message, in input order, normalized to
+        LLM_LABELS; None for messages left unanswered (request failed, breaker
+        open or budget exhausted). Cached answers are reused and only the
+        distinct uncached messages are sent. With pack_size > 1 a pack whose
+        answer can't be parsed is retried one message per prompt. An answer
+        naming none of the labels comes back "Unclassified" and is not cached.
+    """
+    if len(log_messages) == 0:
+        return []
+    options = dict(
+        concurrency=concurrency, requests_per_second=requests_per_second,
+        max_retries=max_retries, pack_size=pack_size, timeout=timeout,
     )
+    cache = get_cache()
+    if cache is None:
+        return [label for label, _ in await _classify_uncached(list(log_messages), **options)]
+    
+    keys = [cache.key(msg, LLM_MODEL, PROMPT_VERSION) for msg in log_messages]
+    labels = cache.get_many(keys)
+    todo = {}  # key -> message, each distinct miss sent once
+    for key, msg in zip(keys, log_messages):
+        if key not in labels:
+            todo.setdefault(key, msg)
+    if todo:
+        answers = await _classify_uncached(list(todo.values()), **options)
+        cache.put_many(
+            [(key, label) for key, (label, parsed) in zip(todo, answers) if parsed], LLM_MODEL, PROMPT_VERSION
+        )
+        labels.update((key, label) for key, (label, _) in zip(todo, answers) if label is not None)
+    return [labels.get(key) for key in keys]
+
+
+async def _classify_uncached(log_messages, concurrency, requests_per_second, max_retries, pack_size, timeout):
+    """
+    classify_with_llm_batch_async without the cache: every message is sent.
+
+    Returns:
+        list: (label, parsed) per message: parsed is False for an answer naming
+        no label ("Unclassified") and for unanswered messages (None)
+    """
+    if not is_configured() or breaker.is_open():
+        UNANSWERED.inc(len(log_messages), reason="breaker_open" if is_configured() else "not_configured")
+        return [(None, False)] * len(log_messages)
+    
+    limits = _limits()
+    semaphore, limiter = limits.semaphore, limits.limiter
+    # Explicit limits (e.g. from a benchmark) get their own semaphore / limiter for this call
+    if concurrency is not None and concurrency != LLM_CONCURRENCY:
+        semaphore = asyncio.Semaphore(concurrency)
+    if requests_per_second is not None and requests_per_second != LLM_REQUESTS_PER_SECOND:
+        limiter = AsyncRateLimiter(requests_per_second)
+    client = limits.client
+    retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+    pack_size = max(1, pack_size or LLM_PACK_SIZE)
+    budget = LLM_BATCH_TIMEOUT if timeout is None else timeout
+    
+    async def classify_one(log_message):
+        return await _complete(client, _build_prompt(log_message), semaphore, limiter, retries)
+    
+    async def classify_pack(pack):
+        try:
+            if len(pack) == 1:
+                labels = [_parse_label(await classify_one(pack[0]))]
+            else:
+                text = await _complete(client, _build_packed_prompt(pack), semaphore, limiter, retries)
+                labels = _parse_packed_response(text, len(pack))
+                if labels is None:
+                    single = await asyncio.gather(*(classify_one(msg) for msg in pack))
+                    labels = [_parse_label(label) for label in single]
+            return [(label, True) if label is not None else ("Unclassified", False) for label in labels]
+        except CircuitOpenError:
+            UNANSWERED.inc(len(pack), reason="breaker_open")
+        except Exception:
+            UNANSWERED.inc(len(pack), reason="error")
+        return [(None, False)] * len(pack)
+    
+    packs = [list(log_messages[i:i + pack_size]) for i in range(0, len(log_messages), pack_size)]
+    tasks = [asyncio.ensure_future(classify_pack(pack)) for pack in packs]
+    done, pending = await asyncio.wait(tasks, timeout=budget or None)
+    for task in pending:
+        task.cancel()
+    # Let the cancelled requests unwind before reading the results
+    await asyncio.gather(*pending, return_exceptions=True)
     
-    return response.choices[0].message.content
+    results = []
+    for pack, task in zip(packs, tasks):
+        if task in done:
+            results.extend(task.result())
+        else:
+            UNANSWERED.inc(len(pack), reason="budget")
+            results.extend([(None, False)] * len(pack))
+    return results
+
+
+def _llm_loop():
+    """The process's LLM event loop, running on a daemon thread started on first use."""
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+        return _loop
+
+
+def _run_coroutine(coro):
+    """
+    Run a coroutine to completion from synchronous code.
+    
+    The coroutine runs on the shared LLM event loop, so every caller (request
+    threads, FastAPI endpoints, the deferred re-classifier) goes through the
+    same semaphore, rate limiter and client.
+    """
+    loop = _llm_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("Synchronous LLM calls can't be made from the LLM event loop; await them instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def classify_with_llm_batch(log_messages, **kwargs):
+    """
+    Synchronous wrapper around classify_with_llm_batch_async for classify_batch.
+    
+    Args:
+        log_messages (list): The log messages to classify
+        **kwargs: Options forwarded to classify_with_llm_batch_async
+        
+    Returns:
+        list: One label per input message, in input order (None where unanswered)
+    """
+    if len(log_messages) == 0:
+        return []
+    return _run_coroutine(classify_with_llm_batch_async(log_messages, **kwargs))
 
 
 # ==================== TESTING ====================
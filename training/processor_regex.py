@@ -5,11 +5,214 @@ This module uses regular expression pattern matching to quickly classify
 common log message patterns. It's faster than ML-based methods for 
 well-defined patterns.
 
+The rules live in REGEX_RULES_PATH. Every process (server workers, process-
+pool workers) checks the file's mtime at most once a second, from
+classify.pipeline_signature(), and swaps in the new rules when it changed,
+so POST /regex-rules/reload - or just editing the file - reaches all of them.
+
 Author: Your Name
 Date: February 2026
 """
 
+import json
+import logging
 import re
+import threading
+import time
+from pathlib import Path
+
+try:  # Python 3.11+
+    from re import _constants as _sre_constants, _parser as _sre_parse
+except ImportError:
+    import sre_constants as _sre_constants
+    import sre_parse as _sre_parse
+
+from config import REGEX_RULES_PATH
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the rules file for changes
+_CHECK_SECONDS = 1.0
+
+
+# ==================== RULE ENGINE ====================
+class RegexRuleEngine:
+    """
+    Compiled, single-pass matcher for an ordered list of (pattern, label) rules.
+    
+    All rules are combined into one case-insensitive alternation where rule i
+    is wrapped in the named group "r{i}", so a message is scanned once no
+    matter how many rules exist. The alternation reports the leftmost match,
+    while the rule list is first-match-wins (an earlier rule matching later in
+    the message still wins). The engine resolves that by re-searching only the
+    rules *before* the one that matched, past its position, using a
+    cached alternation of that prefix; a miss - the common case, since
+    misses go on to BERT - costs exactly one scan.
+    
+    Rule patterns must not use named groups or group references (\\1,
+    (?P=name), (?(1)...)), because every rule shares one compiled pattern
+    where group numbers shift; both are rejected when the engine is built.
+    """
+    
+    def __init__(self, rules):
+        """
+        Args:
+            rules (list): Ordered list of (pattern, label) tuples; first match wins
+        """
+        self.rules = list(rules)
+        self.labels = [label for _, label in self.rules]
+        
+        for pattern, _ in self.rules:
+            compiled = re.compile(pattern, re.IGNORECASE)
+            if compiled.groupindex:
+                raise ValueError(f"Regex rule must not use named groups: {pattern!r}")
+            if _uses_group_references(pattern):
+                raise ValueError(f"Regex rule must not use backreferences: {pattern!r}")
+        
+        # _prefix[k] matches any of rules 0..k-1. The full alternation is built
+        # up front; shorter prefixes are compiled on first use and then reused.
+        self._prefix = {}
+        if self.rules:
+            self._get_prefix(len(self.rules))
+    
+    def _get_prefix(self, k):
+        compiled = self._prefix.get(k)
+        if compiled is None:
+            alternation = "|".join(
+                f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(self.rules[:k])
+            )
+            compiled = self._prefix[k] = re.compile(alternation, re.IGNORECASE)
+        return compiled
+    
+    def match(self, log_message):
+        """
+        Return the label of the first rule (in rule order) that matches, or None.
+        """
+        if not self.rules:
+            return None
+        
+        m = self._get_prefix(len(self.rules)).search(log_message)
+        if m is None:
+            return None
+        
+        best = int(m.lastgroup[1:])
+        # Only rules earlier than `best` can still win, and only after this position
+        while best > 0:
+            m = self._get_prefix(best).search(log_message, m.start() + 1)
+            if m is None:
+                break
+            best = int(m.lastgroup[1:])
+        return self.labels[best]
+
+
+def _uses_group_references(pattern):
+    """True if a pattern refers to a group (\\1, (?P=name) or a (?(1)...) conditional)."""
+    refs = (_sre_constants.GROUPREF, _sre_constants.GROUPREF_EXISTS, _sre_constants.GROUPREF_IGNORE)
+    
+    def walk(node):
+        if isinstance(node, _sre_parse.SubPattern):
+            return any(walk(item) for item in node.data)
+        if isinstance(node, (list, tuple)):
+            # Opcodes are singletons, so `is` can't mistake a plain int argument for one
+            if node and any(node[0] is op for op in refs):
+                return True
+            return any(walk(item) for item in node)
+        return False
+    
+    return walk(_sre_parse.parse(pattern, re.IGNORECASE))
+
+
+def load_rules(path=None):
+    """
+    Load ordered (pattern, label) rules from a JSON file.
+    
+    The file holds a list of {"pattern": ..., "label": ...} objects; their
+    order is the matching priority.
+    
+    Args:
+        path (str or Path): Rules file (default: REGEX_RULES_PATH)
+        
+    Returns:
+        list: List of (pattern, label) tuples
+    """
+    path = Path(path or REGEX_RULES_PATH)
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [(entry["pattern"], entry["label"]) for entry in entries]
+
+
+def _file_signature(path):
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# Compiled once at import; reload_rules() swaps in a new engine atomically.
+# The signature is taken before reading, so a write during the read is seen
+# as a change at the next check.
+_rules_path = Path(REGEX_RULES_PATH)
+_rules_signature = _file_signature(_rules_path)
+_engine = RegexRuleEngine(load_rules(_rules_path))
+_rules_version = 0
+_rejected_signature = None  # an invalid file is reported once, not on every check
+_checked_at = time.monotonic()
+_reload_lock = threading.Lock()
+
+
+def rules_version():
+    """Return a counter that increases every time the rules are reloaded."""
+    return _rules_version
+
+
+def reload_rules(path=None):
+    """
+    Re-read the rules file and swap in a freshly compiled engine.
+    
+    In-flight classifications keep using the engine they started with. If the
+    file is invalid the current engine stays active and the error is raised.
+    
+    Args:
+        path (str or Path): Rules file (default: REGEX_RULES_PATH)
+        
+    Returns:
+        int: Number of rules now active
+    """
+    global _engine, _rules_version, _rules_path, _rules_signature
+    path = Path(path or REGEX_RULES_PATH)
+    with _reload_lock:
+        signature = _file_signature(path)
+        engine = RegexRuleEngine(load_rules(path))
+        _engine, _rules_path, _rules_signature = engine, path, signature
+        _rules_version += 1
+    return len(engine.rules)
+
+
+def reload_if_changed():
+    """
+    Reload the rules if their file changed since they were loaded; checked
+    at most every _CHECK_SECONDS. An invalid file keeps the current rules
+    and is logged once.
+    
+    Returns:
+        bool: True if new rules were loaded
+    """
+    global _checked_at, _rejected_signature
+    now = time.monotonic()
+    if now - _checked_at < _CHECK_SECONDS:
+        return False
+    _checked_at = now
+    signature = _file_signature(_rules_path)
+    if signature is None or signature in (_rules_signature, _rejected_signature):
+        return False
+    try:
+        reload_rules(_rules_path)
+    except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+        _rejected_signature = signature
+        logger.warning("Keeping the current regex rules, %s is invalid: %s", _rules_path, e)
+        return False
+    return True
 
 
 # ==================== CLASSIFICATION FUNCTION ====================
@@ -27,35 +230,14 @@ def classify_with_regex(log_message):
     Returns:
         str or None: The classification label if matched, None otherwise
         
-    Patterns matched:
+    Patterns matched (see regex_rules.json):
         - User login/logout actions
         - System notifications (backups, updates, file uploads, etc.)
         - System maintenance operations
     """
-    # Dictionary of regex patterns and their corresponding labels
-    # Key: regex pattern, Value: classification label
-    regex_patterns = {
-        # User Actions
-        r"User User\d+ logged (in|out).": "User Action",
-        r"Account with ID .* created by .*": "User Action",
-        
-        # System Notifications
-        r"Backup (started|ended) at .*": "System Notification",
-        r"Backup completed successfully.": "System Notification",
-        r"System updated to version .*": "System Notification",
-        r"File .* uploaded successfully by user .*": "System Notification",
-        r"Disk cleanup completed successfully.": "System Notification",
-        r"System reboot initiated by user .*": "System Notification",
-    }
-    
-    # Check each pattern against the log message
-    for pattern, label in regex_patterns.items():
-        # Case-insensitive matching
-        if re.search(pattern, str(log_message), re.IGNORECASE):
-            return label
-    
-    # No pattern matched - return None for downstream processing
-    return None
+    if not isinstance(log_message, str):
+        log_message = str(log_message)
+    return _engine.match(log_message)
 
 
 # ==================== TESTING ====================
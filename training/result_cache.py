@@ -0,0 +1,151 @@
+"""
+Pipeline Result Cache
+
+Bounded LRU cache of final labels keyed on (source, log_message), placed in
+front of the whole classification pipeline so hot messages skip regex, BERT
+and - most importantly - the Groq LLM call.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Stages whose answers depend on the regex rules / trained model. Their entries
+# are only valid for the pipeline signature they were computed with; LLM
+# answers are independent of both and only expire by TTL.
+MODEL_STAGES = ("regex", "lexical", "template", "bert")
+
+# Rough per-entry overhead of the OrderedDict slot, key tuple and entry tuple
+_ENTRY_OVERHEAD_BYTES = 240
+
+
+class ResultCache:
+    """
+    Size- and memory-bounded LRU cache with optional TTL.
+
+    Each entry remembers the stage that produced it, so hit rates can be
+    reported per stage: a "bert" hit is an encoder pass saved, an "llm" hit is
+    a Groq request saved.
+    """
+
+    def __init__(self, max_entries, max_bytes, ttl_seconds=0):
+        """
+        Args:
+            max_entries (int): Maximum number of cached results; 0 disables the cache
+            max_bytes (int): Approximate memory budget for keys and labels
+            ttl_seconds (float): Entry lifetime in seconds; 0 means no expiry
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (source, msg) -> (label, stage, signature, expires_at, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits_by_stage = defaultdict(int)
+        self.computed_by_stage = defaultdict(int)
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, source, log_msg, signature):
+        """
+        Look up a cached result.
+
+        Args:
+            source (str): Log source
+            log_msg (str): Log message
+            signature: Current pipeline signature (regex rules + model version)
+
+        Returns:
+            tuple or None: (label, stage) on a hit, None on a miss
+        """
+        key = (source, log_msg)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                label, stage, entry_signature, expires_at, _ = entry
+                if expires_at is not None and expires_at <= time.monotonic():
+                    self._drop(key)
+                    self.expirations += 1
+                elif stage in MODEL_STAGES and entry_signature != signature:
+                    self._drop(key)
+                    self.invalidations += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits_by_stage[stage] += 1
+                    return label, stage
+            self.misses += 1
+            return None
+
+    def put(self, source, log_msg, label, stage, signature):
+        """
+        Store the result computed by `stage` and evict down to the size and memory bounds.
+        """
+        key = (source, log_msg)
+        nbytes = (
+            sys.getsizeof(source) + sys.getsizeof(log_msg) + sys.getsizeof(label)
+            + _ENTRY_OVERHEAD_BYTES
+        )
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self.computed_by_stage[stage] += 1
+            if not self.enabled:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (label, stage, signature, expires_at, nbytes)
+            self._bytes += nbytes
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return size, memory use and hit rates overall and per stage."""
+        with self._lock:
+            hits = sum(self.hits_by_stage.values())
+            lookups = hits + self.misses
+            stages = set(self.hits_by_stage) | set(self.computed_by_stage)
+            by_stage = {}
+            for stage in sorted(stages):
+                stage_hits = self.hits_by_stage[stage]
+                served = stage_hits + self.computed_by_stage[stage]
+                by_stage[stage] = {
+                    "hits": stage_hits,
+                    "computed": self.computed_by_stage[stage],
+                    "hit_rate": round(stage_hits / served, 4) if served else 0.0,
+                }
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "by_stage": by_stage,
+            }
@@ -1,39 +1,97 @@
 """
-Retrain the BERT-based log classifier from a CSV of labeled examples.
+Retrain the BERT-based log classifier from the training data store or a CSV
+of labeled examples.
 
-CSV must have columns: source, log_message, target_label
+By default the examples come from the deduplicated training store (see
+training_store.py), streamed in chunks; it is seeded from
+dataset/labeled_logs.csv or synthetic_logs.csv the first time. A CSV given
+on the command line must have columns: source, log_message, target_label
 (optional: timestamp, complexity — will be dropped if present)
 
+The lexical pre-classifier (processor_lexical.py) is trained on the same
+examples, with its confidence threshold calibrated on the held-out rows.
+
+Batch mode (the default) encodes every example into one matrix and fits
+LogisticRegression on it. Streaming mode (RETRAIN_MODE=streaming or
+--streaming) never holds more than one chunk: it reads, encodes and fits the
+examples chunk by chunk with SGDClassifier.partial_fit (log loss, so
+predict_proba still gives the confidence), RETRAIN_STREAMING_EPOCHS passes
+over the data, and evaluates on a hash-based holdout. With --warm-start it
+continues from the deployed model instead of starting from scratch.
+
+Every trained model is registered as a new version in models/registry/
+(see model_registry.py) and activated, which the running server picks up
+without a restart.
+
 Usage:
-  python -m training.retrain [path_to_csv]
-  Default path: dataset/labeled_logs.csv (relative to project root)
+  python -m training.retrain               # train on the training store
+  python -m training.retrain path/to.csv   # train on a CSV instead
+  python -m training.retrain --streaming [--warm-start] [--epochs 3] [path/to.csv]
 """
 
+import argparse
+import copy
 import sys
+import time
 from pathlib import Path
 
-import pandas as pd
 import joblib
-from sentence_transformers import SentenceTransformer
-from sklearn.linear_model import LogisticRegression
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import train_test_split
+
+# Sibling modules are imported by name, also when run as `python -m training.retrain`
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from config import (  # noqa: E402
+    BERT_BATCH_SIZE,
+    EMBEDDING_STORE_RETRAIN,
+    LEXICAL_ENABLED,
+    RETRAIN_HOLDOUT_FRACTION,
+    RETRAIN_MODE,
+    RETRAIN_STREAMING_EPOCHS,
+    RETRAIN_WARM_START,
+    RETRAIN_CALIBRATION_ROWS,
+    TRAINING_READ_CHUNK_SIZE,
+)
+import model_registry  # noqa: E402
+import processor_bert  # noqa: E402
+import processor_lexical  # noqa: E402
+import training_store  # noqa: E402
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-MODEL_PATH = PROJECT_ROOT / "models" / "log_classification_model.pkl"
-DEFAULT_DATA_PATH = PROJECT_ROOT / "dataset" / "labeled_logs.csv"
+# Pre-store training CSV; imported into the training store once if present
+LEGACY_DATA_PATH = PROJECT_ROOT / "dataset" / "labeled_logs.csv"
+SYNTHETIC_DATA_PATH = PROJECT_ROOT / "synthetic_logs.csv"
+REQUIRED_COLUMNS = training_store.COLUMNS
+
 
+def open_training_store():
+    """Open the configured training store, seeding it on first use."""
+    store = training_store.get_store()
+    store.seed_if_empty(LEGACY_DATA_PATH, SYNTHETIC_DATA_PATH)
+    return store
 
-def run_retrain(csv_path: Path) -> str:
+
+def add_training_data(new_df, origin=None):
     """
-    Load CSV, encode log_message with SentenceTransformer, train LogisticRegression, save model.
-    Returns a short status message.
+    Append labeled rows to the training store; duplicates are skipped and
+    label conflicts resolved by TRAINING_CONFLICT_POLICY.
+
+    Returns:
+        dict: Append counts plus the number of examples now in the store
     """
-    csv_path = Path(csv_path)
-    if not csv_path.exists():
-        raise FileNotFoundError(f"Data file not found: {csv_path}")
+    store = open_training_store()
+    counts = store.append(new_df, origin=origin)
+    counts["examples"] = store.count()
+    return counts
+
 
+def _csv_chunks(csv_path):
+    """Load and clean a labeled CSV, then hand it out in encoder-sized slices."""
     df = pd.read_csv(csv_path)
 
-    for col in ["source", "log_message", "target_label"]:
+    for col in REQUIRED_COLUMNS:
         if col not in df.columns:
             raise ValueError(f"CSV must contain column: {col}")
 
@@ -43,29 +101,404 @@ def run_retrain(csv_path: Path) -> str:
             df = df.drop(columns=[drop])
 
     df = df.dropna(subset=["log_message", "target_label"])
-    if len(df) == 0:
+    slice_size = max(BERT_BATCH_SIZE * 8, len(df) // 20)
+    return len(df), (df.iloc[start:start + slice_size] for start in range(0, len(df), slice_size))
+
+
+def _encode_chunks(total, chunks, progress):
+    """
+    Encode chunk by chunk, reporting progress; the embedding store skips known messages.
+
+    Returns:
+        tuple: (X, y, messages) for all chunks
+    """
+    store_mode = "readwrite" if EMBEDDING_STORE_RETRAIN else "off"
+    X_parts, y_parts, messages, done = [], [], [], 0
+    for chunk in chunks:
+        chunk_messages = chunk["log_message"].astype(str).tolist()
+        X_parts.append(processor_bert.encode_messages(chunk_messages, store_mode=store_mode))
+        y_parts.append(chunk["target_label"].astype(str))
+        messages.extend(chunk_messages)
+        done += len(chunk)
+        progress("encoding", done / total)
+    if not X_parts:
         raise ValueError("No rows with valid log_message and target_label")
+    return np.vstack(X_parts), pd.concat(y_parts, ignore_index=True), messages
+
+
+def _holdout_split(y):
+    """(train, holdout) row indexes with RETRAIN_HOLDOUT_FRACTION held out, or None for too little data."""
+    counts = y.value_counts()
+    if RETRAIN_HOLDOUT_FRACTION <= 0 or len(counts) < 2 or len(y) < 10:
+        return None
+    return train_test_split(
+        np.arange(len(y)),
+        test_size=RETRAIN_HOLDOUT_FRACTION,
+        random_state=42,
+        stratify=y if counts.min() >= 2 else None,
+    )
+
+
+def _holdout_accuracy(X, y, split):
+    """
+    Accuracy of a model fit on the rest of the data, on the held-out rows.
+
+    Returns:
+        tuple: (accuracy, its predictions for the held-out rows), or (None, None) without a split
+    """
+    if split is None:
+        return None, None
+    train_idx, test_idx = split
+    clf = LogisticRegression(max_iter=1000).fit(X[train_idx], y.iloc[train_idx])
+    predicted = clf.predict(X[test_idx])
+    return round(float((predicted == y.iloc[test_idx].to_numpy()).mean()), 4), predicted
+
+
+# ==================== STREAMING MODE ====================
+def check_mode(mode, warm_start=False, epochs=RETRAIN_STREAMING_EPOCHS):
+    """
+    Validate a retrain mode and its options.
+
+    Raises:
+        ValueError: For an unknown mode, warm_start outside streaming mode, or
+            fewer than one epoch in streaming mode
+    """
+    if mode not in ("batch", "streaming"):
+        raise ValueError(f"Retrain mode must be 'batch' or 'streaming', got {mode!r}")
+    if warm_start and mode != "streaming":
+        raise ValueError("Continuing from the deployed model needs the streaming mode")
+    if mode == "streaming" and epochs < 1:
+        raise ValueError(f"Streaming retrain needs at least 1 epoch, got {epochs}")
+
+
+def _csv_stream(csv_path):
+    """Reader of a labeled CSV in chunks of TRAINING_READ_CHUNK_SIZE rows, cleaned like _csv_chunks."""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    for col in REQUIRED_COLUMNS:
+        if col not in header:
+            raise ValueError(f"CSV must contain column: {col}")
+
+    def chunks():
+        reader = pd.read_csv(csv_path, usecols=REQUIRED_COLUMNS, chunksize=TRAINING_READ_CHUNK_SIZE)
+        for chunk in reader:
+            yield chunk.dropna(subset=["log_message", "target_label"])
+    return chunks
+
+
+def _holdout_mask(messages):
+    """
+    Held-out rows of a chunk, picked by a hash of the message: the same
+    message is on the same side in every pass and every retrain, with no
+    index of the whole dataset in memory.
+    """
+    if RETRAIN_HOLDOUT_FRACTION <= 0:
+        return np.zeros(len(messages), dtype=bool)
+    cut = RETRAIN_HOLDOUT_FRACTION * 2 ** 32
+    return np.fromiter(
+        (int.from_bytes(training_store.content_key(m)[:4], "little") < cut for m in messages),
+        dtype=bool, count=len(messages),
+    )
+
+
+def _scan(chunks):
+    """First pass: row and class counts, which partial_fit needs up front (labels only, no encoding)."""
+    rows, holdout_rows, class_counts = 0, 0, {}
+    for chunk in chunks():
+        labels = chunk["target_label"].astype(str)
+        for label, count in labels.value_counts().items():
+            class_counts[label] = class_counts.get(label, 0) + int(count)
+        rows += len(chunk)
+        holdout_rows += int(_holdout_mask(chunk["log_message"].astype(str)).sum())
+    if not rows:
+        raise ValueError("No rows with valid log_message and target_label")
+    return rows, holdout_rows, class_counts
+
+
+def _warm_start(clf, deployed, classes, rows):
+    """
+    Start an SGDClassifier from a deployed linear model's weights.
+
+    The deployed model can be this mode's SGDClassifier or batch mode's
+    LogisticRegression; classes it does not know start at zero. Its
+    learning-rate schedule continues as if it had already seen `rows` examples,
+    so the first chunks refine the weights instead of overwriting them.
+
+    From a LogisticRegression the start is approximate: its weights are those
+    of one multinomial (softmax) model, while SGDClassifier fits one-vs-rest
+    binary models. Copied as they are, they keep the deployed model's ranking
+    of the classes (the same predicted label) but not its probabilities, so
+    confidence-based routing only matches it again after the first epoch has
+    refit each class against the rest.
+    """
+    if not hasattr(deployed, "coef_"):
+        raise ValueError(f"The deployed {type(deployed).__name__} has no linear weights to continue from")
+    if isinstance(deployed, SGDClassifier) and list(deployed.classes_) == list(classes):
+        return copy.deepcopy(deployed)
+    # One weight row per deployed class (a binary model stores only the positive class)
+    coef, intercept = deployed.coef_, deployed.intercept_
+    if len(deployed.classes_) == 2:
+        coef = np.vstack([np.zeros_like(coef[0]), coef[0]])
+        intercept = np.array([0.0, intercept[0]])
+    rows_of = {str(c): i for i, c in enumerate(deployed.classes_)}
+    by_class = [
+        (coef[rows_of[c]], intercept[rows_of[c]]) if c in rows_of else (np.zeros(coef.shape[1]), 0.0)
+        for c in classes
+    ]
+    if len(classes) == 2:
+        by_class = [(by_class[1][0] - by_class[0][0], by_class[1][1] - by_class[0][1])]
+    clf.coef_ = np.array([w for w, _ in by_class], dtype=np.float64)
+    clf.intercept_ = np.array([b for _, b in by_class], dtype=np.float64)
+    clf.t_ = float(rows)
+    return clf
+
+
+def train_streaming(csv_path=None, progress=None, warm_start=False, epochs=RETRAIN_STREAMING_EPOCHS):
+    """
+    Fit the classifier (and the lexical model) chunk by chunk, so peak memory
+    follows TRAINING_READ_CHUNK_SIZE instead of the dataset size.
+
+    A first pass collects the classes; then `epochs` passes encode the
+    training rows of each chunk (shuffled within the chunk) and update an
+    SGDClassifier with partial_fit. Held-out rows (_holdout_mask) are never
+    trained on; a last pass scores them. train_accuracy is progressive: each
+    chunk of the last pass is scored just before it is fit.
+
+    Returns:
+        tuple: (classifier, lexical model dict or None, metrics dict)
+    """
+    progress = progress or (lambda stage, fraction: None)
+    progress("scanning", 0.0)
+    if csv_path is None:
+        store = open_training_store()
+        chunks = lambda: store.iter_chunks(TRAINING_READ_CHUNK_SIZE)  # noqa: E731
+    else:
+        csv_path = Path(csv_path)
+        if not csv_path.exists():
+            raise FileNotFoundError(f"Data file not found: {csv_path}")
+        chunks = _csv_stream(csv_path)
+    rows, holdout_rows, class_counts = _scan(chunks)
+
+    clf = SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42)
+    lexical = processor_lexical.build_streaming_pipeline() if LEXICAL_ENABLED else None
+    warm_from = None
+    classes = set(class_counts)
+    if warm_start:
+        # Both models from one version, even if another is activated meanwhile
+        warm_from, model_file, lexical_file = model_registry.served_files()
+        deployed = joblib.load(model_file)
+        classes |= {str(c) for c in deployed.classes_}
+        deployed_lexical = joblib.load(lexical_file) if LEXICAL_ENABLED and lexical_file is not None else None
+        if deployed_lexical is not None:
+            classes |= {str(c) for c in deployed_lexical["pipeline"].classes_}
+    classes = np.array(sorted(classes), dtype=object)
+    if warm_start:
+        clf = _warm_start(clf, deployed, classes, rows - holdout_rows)
+        if lexical is not None and deployed_lexical is not None:
+            lexical.steps[-1] = (
+                lexical.steps[-1][0],
+                _warm_start(lexical[-1], deployed_lexical["pipeline"][-1], classes, rows - holdout_rows),
+            )
+
+    store_mode = "readwrite" if EMBEDDING_STORE_RETRAIN else "off"
+    rng = np.random.default_rng(42)
+    encode_seconds = fit_seconds = 0.0
+    scored = correct = 0
+    for epoch in range(epochs):
+        done = 0
+        for chunk in chunks():
+            messages = chunk["log_message"].astype(str).to_numpy(dtype=object)
+            labels = chunk["target_label"].astype(str).to_numpy(dtype=object)
+            done += len(chunk)
+            # Rows appended to the store after the scan may carry a label it did not see
+            train = ~_holdout_mask(messages) & np.isin(labels, classes)
+            order = rng.permutation(np.flatnonzero(train))
+            if len(order):
+                t0 = time.perf_counter()
+                # float64 like the weights _warm_start copies from a deployed model (SGD needs them to match)
+                X = processor_bert.encode_messages(list(messages[order]), store_mode=store_mode).astype(np.float64)
+                encode_seconds += time.perf_counter() - t0
+                t0 = time.perf_counter()
+                if epoch == epochs - 1 and hasattr(clf, "classes_"):
+                    scored += len(order)
+                    correct += int((clf.predict(X) == labels[order]).sum())
+                clf.partial_fit(X, labels[order], classes=classes)
+                if lexical is not None:
+                    processor_lexical.partial_fit(lexical, messages[order], labels[order], classes)
+                fit_seconds += time.perf_counter() - t0
+            progress("training", (epoch + done / rows) / epochs)
+    if not hasattr(clf, "classes_"):
+        raise ValueError("Every row was held out: lower RETRAIN_HOLDOUT_FRACTION or add data")
+
+    holdout_accuracy = lexical_stats = None
+    threshold = processor_lexical.LEXICAL_MIN_CONFIDENCE
+    if holdout_rows:
+        progress("evaluating", 0.0)
+        held, held_correct, done = 0, 0, 0
+        # Lexical calibration keeps per-row results for at most RETRAIN_CALIBRATION_ROWS rows
+        calibration = {"predicted": [], "confidence": [], "labels": [], "bert": []}
+        for chunk in chunks():
+            messages = chunk["log_message"].astype(str).to_numpy(dtype=object)
+            labels = chunk["target_label"].astype(str).to_numpy(dtype=object)
+            done += len(chunk)
+            rows_held = np.flatnonzero(_holdout_mask(messages))
+            if len(rows_held):
+                X = processor_bert.encode_messages(list(messages[rows_held]), store_mode=store_mode).astype(np.float64)
+                predicted = clf.predict(X)
+                held += len(rows_held)
+                held_correct += int((predicted == labels[rows_held]).sum())
+                room = RETRAIN_CALIBRATION_ROWS - sum(len(p) for p in calibration["predicted"])
+                if lexical is not None and room > 0:
+                    keep = rows_held[:room]
+                    probabilities = lexical.predict_proba(messages[keep])
+                    calibration["predicted"].append(lexical.classes_[probabilities.argmax(axis=1)])
+                    calibration["confidence"].append(probabilities.max(axis=1))
+                    calibration["labels"].append(labels[keep])
+                    calibration["bert"].append(predicted[:room])
+            progress("evaluating", done / rows)
+        holdout_accuracy = round(held_correct / held, 4) if held else None
+        if lexical is not None and calibration["predicted"]:
+            threshold, lexical_stats = processor_lexical.calibrate(
+                *(np.concatenate(calibration[k]) for k in ("predicted", "confidence", "labels", "bert"))
+            )
+
+    metrics = {
+        "mode": "streaming",
+        "rows": rows,
+        "holdout_rows": holdout_rows,
+        "epochs": epochs,
+        "warm_start_from": warm_from,
+        "class_counts": class_counts,
+        "train_accuracy": round(correct / scored, 4) if scored else None,
+        "holdout_accuracy": holdout_accuracy,
+        "encode_seconds": round(encode_seconds, 3),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+    lexical_model = None
+    if lexical is not None:
+        metrics["lexical"] = {
+            **(lexical_stats or {}),
+            "threshold": round(threshold, 4),
+            "target_precision": processor_lexical.LEXICAL_TARGET_PRECISION,
+        }
+        lexical_model = {"pipeline": lexical, "threshold": threshold}
+    return clf, lexical_model, metrics
+
+
+def train_model(
+    csv_path: Path = None,
+    progress=None,
+    activate=True,
+    source="retrain",
+    mode=RETRAIN_MODE,
+    warm_start=RETRAIN_WARM_START,
+    epochs=RETRAIN_STREAMING_EPOCHS,
+) -> dict:
+    """
+    Stream the training examples, encode log_message with the serving encoder,
+    train the classifier and register the result as a new model version.
+
+    Only messages missing from the embedding store are encoded; the rest are
+    read from its memory-mapped vectors.
+
+    Args:
+        csv_path (Path): Labeled CSV (source, log_message, target_label);
+            None trains on the training store
+        progress: Optional callback progress(stage, fraction) with fraction in [0, 1]
+        activate (bool): Serve the new version immediately
+        source (str): Description stored in the registry
+        mode (str): "batch" (LogisticRegression on all embeddings in memory) or
+            "streaming" (SGDClassifier fit chunk by chunk, see train_streaming)
+        warm_start (bool): Streaming mode: continue from the deployed model
+        epochs (int): Streaming mode: passes over the data
+
+    Returns:
+        dict: version, rows and training metrics
+
+    Raises:
+        ValueError: For an unknown mode, warm_start in batch mode, fewer than
+            one streaming epoch, or no usable rows
+    """
+    check_mode(mode, warm_start, epochs)
+    progress = progress or (lambda stage, fraction: None)
+    if mode == "streaming":
+        clf, lexical, metrics = train_streaming(csv_path, progress, warm_start, epochs)
+        progress("registering", 0.0)
+        version = model_registry.register(clf, metrics, source=source, activate=activate, lexical=lexical)
+        progress("done", 1.0)
+        return {"version": version, "rows": metrics["rows"], "metrics": metrics}
+
+    progress("loading", 0.0)
+    if csv_path is None:
+        store = open_training_store()
+        total, chunks = store.count(), store.iter_chunks(TRAINING_READ_CHUNK_SIZE)
+    else:
+        csv_path = Path(csv_path)
+        if not csv_path.exists():
+            raise FileNotFoundError(f"Data file not found: {csv_path}")
+        total, chunks = _csv_chunks(csv_path)
 
     # Same encoder as processor_bert so the saved classifier is compatible
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    embeddings = model.encode(df["log_message"].tolist())
-    X = embeddings
-    y = df["target_label"]
+    t0 = time.perf_counter()
+    X, y, messages = _encode_chunks(total, chunks, progress)
+    encode_seconds = time.perf_counter() - t0
+
+    progress("evaluating", 0.0)
+    split = _holdout_split(y)
+    holdout_accuracy, holdout_predictions = _holdout_accuracy(X, y, split)
 
+    progress("training", 0.0)
+    t0 = time.perf_counter()
     clf = LogisticRegression(max_iter=1000)
     clf.fit(X, y)
+    fit_seconds = time.perf_counter() - t0
+
+    metrics = {
+        "mode": "batch",
+        "rows": len(y),
+        "class_counts": {str(k): int(v) for k, v in y.value_counts().items()},
+        "train_accuracy": round(float(clf.score(X, y)), 4),
+        "holdout_accuracy": holdout_accuracy,
+        "encode_seconds": round(encode_seconds, 3),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+
+    lexical = None
+    if LEXICAL_ENABLED:
+        progress("lexical", 0.0)
+        t0 = time.perf_counter()
+        lexical, metrics["lexical"] = processor_lexical.train(messages, y, split, holdout_predictions)
+        metrics["lexical"]["fit_seconds"] = round(time.perf_counter() - t0, 3)
 
-    MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(clf, MODEL_PATH)  # Overwrites the model used by processor_bert
+    progress("registering", 0.0)
+    version = model_registry.register(clf, metrics, source=source, activate=activate, lexical=lexical)
+    progress("done", 1.0)
+    return {"version": version, "rows": len(y), "metrics": metrics}
 
-    return f"Model saved to {MODEL_PATH} (trained on {len(df)} rows)"
+
+def run_retrain(csv_path: Path = None, **options) -> str:
+    """
+    Retrain from csv_path (default: the training store) and activate the new model.
+    options are passed to train_model (mode, warm_start, epochs).
+    Returns a short status message.
+    """
+    result = train_model(csv_path, **options)
+    return f"Model {result['version']} saved to {model_registry.REGISTRY_DIR / result['version']} (trained on {result['rows']} rows)"
 
 
 if __name__ == "__main__":
-    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DATA_PATH
-    path = Path(path)
+    parser = argparse.ArgumentParser(description="Retrain the classifier and register a new model version")
+    parser.add_argument("csv", nargs="?", type=Path, help="Labeled CSV (default: the training store)")
+    parser.add_argument("--streaming", action="store_true", help="Fit chunk by chunk (RETRAIN_MODE=streaming)")
+    parser.add_argument("--warm-start", action="store_true", help="Streaming: continue from the deployed model")
+    parser.add_argument("--epochs", type=int, default=RETRAIN_STREAMING_EPOCHS, help="Streaming: passes over the data")
+    args = parser.parse_args()
     try:
-        msg = run_retrain(path)
+        msg = run_retrain(
+            args.csv,
+            mode="streaming" if args.streaming or args.warm_start else RETRAIN_MODE,
+            warm_start=args.warm_start or RETRAIN_WARM_START,
+            epochs=args.epochs,
+        )
         print(msg)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
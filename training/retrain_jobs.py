@@ -0,0 +1,126 @@
+"""
+Background Retrain Jobs
+
+POST /retrain used to encode and fit inside the request. Jobs now run one at
+a time on a dedicated thread; the request only validates the upload and gets
+a job ID back, and GET /retrain/jobs/{id} reports stage, progress and, once
+finished, the new model version and its training metrics.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import RETRAIN_JOB_HISTORY, RETRAIN_MODE, RETRAIN_STREAMING_EPOCHS, RETRAIN_WARM_START
+
+# One retrain at a time in this process: jobs append to the same training store
+# (training_store.py) and register their models in order
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrain")
+_jobs = OrderedDict()  # job_id -> job dict
+_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+def _update(job_id, **fields):
+    with _lock:
+        _jobs[job_id].update(fields)
+
+
+def _run(job_id, new_df, mode, warm_start, epochs):
+    import retrain
+
+    def progress(stage, fraction):
+        _update(job_id, stage=stage, progress=round(fraction, 4))
+
+    _update(job_id, status="running", started_at=time.time())
+    try:
+        progress("storing", 0.0)
+        data = retrain.add_training_data(new_df, origin=job_id)
+        _update(job_id, data=data)
+        result = retrain.train_model(
+            progress=progress, source=f"retrain job {job_id}", mode=mode, warm_start=warm_start, epochs=epochs
+        )
+        _update(
+            job_id,
+            status="succeeded",
+            training_rows=result["rows"],
+            version=result["version"],
+            metrics=result["metrics"],
+            finished_at=time.time(),
+        )
+    except Exception as e:
+        _update(job_id, status="failed", error=f"{type(e).__name__}: {e}", finished_at=time.time())
+
+
+def submit(new_df, mode=RETRAIN_MODE, warm_start=RETRAIN_WARM_START, epochs=RETRAIN_STREAMING_EPOCHS):
+    """
+    Queue a retrain on the uploaded rows added to the training store.
+
+    Args:
+        new_df (DataFrame): Validated rows with source, log_message, target_label
+        mode (str): "batch" or "streaming" (see retrain.train_model)
+        warm_start (bool): Streaming mode: continue from the deployed model
+        epochs (int): Streaming mode: passes over the data
+
+    Returns:
+        dict: The new job (status "queued")
+
+    Raises:
+        ValueError: For an unknown mode, warm_start in batch mode, or fewer
+            than one streaming epoch
+    """
+    import retrain
+
+    retrain.check_mode(mode, warm_start, epochs)
+    job_id = f"job-{next(_ids):05d}"
+    with _lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "status": "queued",
+            "stage": None,
+            "progress": 0.0,
+            "new_rows": len(new_df),
+            "mode": mode,
+            "warm_start": warm_start,
+            "epochs": epochs if mode == "streaming" else None,
+            "training_rows": None,
+            "data": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "version": None,
+            "metrics": None,
+            "error": None,
+        }
+        _evict()
+        job = dict(_jobs[job_id])
+    _executor.submit(_run, job_id, new_df, mode, warm_start, epochs)
+    return job
+
+
+def _evict():
+    """Forget the oldest finished jobs beyond RETRAIN_JOB_HISTORY."""
+    finished = [jid for jid, job in _jobs.items() if job["status"] in ("succeeded", "failed")]
+    for jid in finished[:max(0, len(finished) - RETRAIN_JOB_HISTORY)]:
+        del _jobs[jid]
+
+
+def get(job_id):
+    """Return a copy of one job, or None if it is unknown."""
+    with _lock:
+        job = _jobs.get(job_id)
+        return None if job is None else dict(job)
+
+
+def list_jobs():
+    """Return all known jobs, newest first."""
+    with _lock:
+        return [
+            {k: v for k, v in job.items() if k != "metrics"}
+            for job in reversed(_jobs.values())
+        ]
@@ -0,0 +1,313 @@
+"""
+Upload and Download Formats
+
+Log exports usually arrive compressed or columnar, not as plain CSV. This
+module reads and writes the formats POST /classify and the classification
+jobs accept, picked by file name:
+
+    csv        .csv
+    csv.gz     .csv.gz            (gzip-compressed CSV)
+    csv.zst    .csv.zst           (zstd-compressed CSV; needs zstandard)
+    parquet    .parquet, .pq      (needs pyarrow)
+    arrow      .arrow, .feather   (Arrow IPC file or stream; needs pyarrow)
+
+Only the source and log_message columns are kept: Parquet reads just
+their column chunks, Arrow selects them from each record batch without
+copying, and CSV parsing drops the others as it goes. Results are written
+back in the same format (or another one on request) with target_label
+added. Large inputs are read chunk by chunk (iter_tables), so memory
+follows the chunk size for every format.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import gzip
+import shutil
+
+import pandas as pd
+
+COLUMNS = ["source", "log_message"]
+OUTPUT_COLUMNS = COLUMNS + ["target_label"]
+
+# name -> (file name suffixes, media type); the first suffix is used for output files
+FORMATS = {
+    "csv": ((".csv",), "text/csv"),
+    "csv.gz": ((".csv.gz", ".csv.gzip"), "application/gzip"),
+    "csv.zst": ((".csv.zst", ".csv.zstd"), "application/zstd"),
+    "parquet": ((".parquet", ".pq"), "application/vnd.apache.parquet"),
+    "arrow": ((".arrow", ".feather", ".ipc"), "application/vnd.apache.arrow.file"),
+}
+_CSV_COMPRESSION = {"csv": None, "csv.gz": "gzip", "csv.zst": "zstd"}
+# Optional dependency per format: (module, pip package)
+_REQUIRES = {"csv.zst": ("zstandard", "zstandard"), "parquet": ("pyarrow", "pyarrow"), "arrow": ("pyarrow", "pyarrow")}
+
+
+class UnsupportedFormat(ValueError):
+    """The file name does not end in a supported suffix."""
+
+
+class FormatUnavailable(RuntimeError):
+    """The format needs an optional dependency that is not installed."""
+
+
+# ==================== FORMATS ====================
+def detect_format(filename):
+    """
+    Format name for a file name, from its suffix (case-insensitive).
+
+    Raises:
+        UnsupportedFormat: For any other suffix
+    """
+    name = (filename or "").lower()
+    for fmt, (suffixes, _) in FORMATS.items():
+        if name.endswith(suffixes):
+            return fmt
+    supported = ", ".join(s for suffixes, _ in FORMATS.values() for s in suffixes)
+    raise UnsupportedFormat(f"Unsupported file type: {filename!r} (expected one of {supported})")
+
+
+def check_format(fmt):
+    """
+    Validate a format name and check that its optional dependency is installed.
+
+    Returns:
+        str: The format name
+
+    Raises:
+        UnsupportedFormat: For an unknown name
+        FormatUnavailable: If the format's dependency is missing
+    """
+    if fmt not in FORMATS:
+        raise UnsupportedFormat(f"Unknown format {fmt!r} (expected one of {', '.join(FORMATS)})")
+    if fmt in _REQUIRES:
+        module, package = _REQUIRES[fmt]
+        try:
+            __import__(module)
+        except ImportError:
+            raise FormatUnavailable(f"The {fmt} format needs the '{package}' package (pip install {package})")
+    return fmt
+
+
+def stem(filename):
+    """File name without its format suffix ("app.csv.gz" -> "app")."""
+    for suffixes, _ in FORMATS.values():
+        for s in suffixes:
+            if filename.lower().endswith(s):
+                return filename[: -len(s)]
+    return filename
+
+
+def suffix(fmt):
+    """File name suffix for output in this format."""
+    return FORMATS[fmt][0][0]
+
+
+def media_type(fmt):
+    """HTTP media type of this format."""
+    return FORMATS[fmt][1]
+
+
+def _check_columns(names):
+    missing = [c for c in COLUMNS if c not in names]
+    if missing:
+        raise ValueError(f"Input must contain 'source' and 'log_message' columns (missing: {missing})")
+
+
+def _size(f):
+    """Size of an open binary file, keeping its position."""
+    position = f.tell()
+    size = f.seek(0, 2)
+    f.seek(position)
+    return max(1, size)
+
+
+# ==================== READING ====================
+def _arrow_reader(f):
+    """Open an Arrow IPC file, or failing that an IPC stream, as a record batch reader."""
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    try:
+        reader = pyarrow.ipc.open_file(f)
+    except pa.ArrowInvalid:
+        f.seek(0)
+        stream = pyarrow.ipc.open_stream(f)
+        return stream.schema, iter(stream), None
+    batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    return reader.schema, batches, reader.num_record_batches
+
+
+def iter_tables(f, fmt, chunksize):
+    """
+    Read the source and log_message columns of an input, chunk by chunk.
+
+    Args:
+        f: Binary file object, positioned at the start of the input
+        fmt (str): Format name (see FORMATS)
+        chunksize (int): Rows per chunk
+
+    Yields:
+        tuple: (DataFrame with the two columns, fraction of the input read so far)
+
+    Raises:
+        ValueError: If a column is missing or the input cannot be parsed
+        FormatUnavailable: If the format's dependency is missing
+    """
+    check_format(fmt)
+    if fmt in _CSV_COMPRESSION:
+        size = _size(f)
+        reader = pd.read_csv(
+            f, usecols=lambda c: c in COLUMNS, chunksize=chunksize, compression=_CSV_COMPRESSION[fmt]
+        )
+        for chunk in reader:
+            _check_columns(chunk.columns)
+            # Compressed input: f.tell() counts compressed bytes, which is what was read
+            yield chunk[COLUMNS], min(f.tell() / size, 1.0)
+        return
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(f)
+        _check_columns(parquet.schema_arrow.names)
+        total = max(1, parquet.metadata.num_rows)
+        rows = 0
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=COLUMNS):
+            rows += batch.num_rows
+            yield batch.to_pandas(), rows / total
+        return
+
+    import pyarrow as pa
+
+    schema, batches, n_batches = _arrow_reader(f)
+    _check_columns(schema.names)
+    # Record batches can be of any size: regroup them into chunks of chunksize rows
+    pending = []
+    n_pending = 0
+    fraction = None
+    for i, batch in enumerate(batches):
+        pending.append(batch.select(COLUMNS))
+        n_pending += batch.num_rows
+        # An IPC stream has no batch count up front, so its progress is unknown (None)
+        fraction = (i + 1) / n_batches if n_batches else None
+        while n_pending >= chunksize:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, chunksize).to_pandas(), fraction
+            rest = table.slice(chunksize)
+            pending, n_pending = rest.to_batches(), rest.num_rows
+    if n_pending:
+        yield pa.Table.from_batches(pending).to_pandas(), fraction
+
+
+def read_table(f, fmt):
+    """
+    Read the source and log_message columns of a whole input.
+
+    Args:
+        f: Binary file object
+        fmt (str): Format name
+
+    Returns:
+        DataFrame: The two columns
+
+    Raises:
+        ValueError: If a column is missing or the input cannot be parsed
+        FormatUnavailable: If the format's dependency is missing
+    """
+    check_format(fmt)
+    if fmt in _CSV_COMPRESSION:
+        df = pd.read_csv(f, usecols=lambda c: c in COLUMNS, compression=_CSV_COMPRESSION[fmt])
+        _check_columns(df.columns)
+        return df[COLUMNS]
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(f)
+        _check_columns(parquet.schema_arrow.names)
+        return parquet.read(columns=COLUMNS).to_pandas()
+
+    import pyarrow as pa
+
+    schema, batches, _ = _arrow_reader(f)
+    _check_columns(schema.names)
+    selected = pa.schema([schema.field(c) for c in COLUMNS])
+    return pa.Table.from_batches([b.select(COLUMNS) for b in batches], schema=selected).to_pandas()
+
+
+def check_columns(path, fmt):
+    """Check an input file's columns without reading its rows (raises like read_table)."""
+    check_format(fmt)
+    with open(path, "rb") as f:
+        if fmt in _CSV_COMPRESSION:
+            names = pd.read_csv(f, nrows=0, compression=_CSV_COMPRESSION[fmt]).columns
+        elif fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            names = pq.ParquetFile(f).schema_arrow.names
+        else:
+            names = _arrow_reader(f)[0].names
+    _check_columns(names)
+
+
+# ==================== WRITING ====================
+def write_table(df, path, fmt):
+    """
+    Write a classified DataFrame (source, log_message, target_label) in a format.
+
+    Args:
+        df (DataFrame): Rows to write
+        path (str or Path): Output file
+        fmt (str): Format name
+    """
+    check_format(fmt)
+    if fmt in _CSV_COMPRESSION:
+        df.to_csv(path, index=False, compression=_CSV_COMPRESSION[fmt])
+    elif fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        # Feather v2 is the Arrow IPC file format
+        df.reset_index(drop=True).to_feather(path)
+
+
+def join_csv_parts(parts, path, fmt):
+    """
+    Join CSV part files (header only in the first) into one output file in a format,
+    one part in memory at a time.
+
+    Args:
+        parts (list): Part file paths, in order
+        path (str or Path): Output file
+        fmt (str): Format name
+    """
+    check_format(fmt)
+    if fmt in _CSV_COMPRESSION:
+        if fmt == "csv.gz":
+            out = gzip.open(path, "wb")
+        elif fmt == "csv.zst":
+            import zstandard
+
+            out = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        else:
+            out = open(path, "wb")
+        with out:
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+        return
+
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.string()) for c in OUTPUT_COLUMNS])
+    with (pq.ParquetWriter(path, schema) if fmt == "parquet" else pyarrow.ipc.new_file(path, schema)) as writer:
+        for i, part in enumerate(parts):
+            df = pd.read_csv(
+                part,
+                header=0 if i == 0 else None,
+                names=None if i == 0 else OUTPUT_COLUMNS,
+                dtype=str,
+                keep_default_na=False,
+            )
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
@@ -0,0 +1,133 @@
+"""
+Log Template Mining Cache
+
+Production logs are mostly a handful of templates whose variable parts
+(request IDs, UUIDs, IPs, status codes, timings) change on every line. This
+module reduces a message to its template, Drain-style, by masking those
+variable tokens, and remembers the BERT label per template so repeated
+shapes are answered without running the transformer encoder.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+# ==================== TEMPLATE EXTRACTION ====================
+# Masks applied in order; every variable part becomes the wildcard "<*>"
+_MASKS = [
+    re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE),  # UUID
+    re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"),                # IPv4[:port]
+    re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{8,}\b", re.IGNORECASE),       # hex ids / hashes
+    re.compile(r"\d+(?:\.\d+)?"),                                        # numbers, timings
+]
+WILDCARD = "<*>"
+
+
+def extract_template(log_message):
+    """
+    Reduce a log message to its template by masking variable tokens.
+
+    Args:
+        log_message (str): Raw log message
+
+    Returns:
+        str: The message with variable parts replaced by "<*>"
+
+    Example:
+        "User User123 logged in from 10.0.0.1" -> "User User<*> logged in from <*>"
+    """
+    template = str(log_message)
+    for mask in _MASKS:
+        template = mask.sub(WILDCARD, template)
+    return " ".join(template.split())
+
+
+# ==================== TEMPLATE CACHE ====================
+class TemplateCache:
+    """
+    Bounded template -> label table with least-recently-used eviction.
+
+    Entries belong to the classifier that produced them: every lookup passes
+    the current model signature, and a different signature (the model was
+    retrained) clears the table before answering.
+    """
+
+    def __init__(self, max_size):
+        """
+        Args:
+            max_size (int): Maximum number of templates kept; 0 disables the cache
+        """
+        self.max_size = max_size
+        self._labels = OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def check_model(self, signature):
+        """Drop every entry if the classifier changed since they were stored."""
+        with self._lock:
+            if signature != self._signature:
+                if self._labels:
+                    self.invalidations += 1
+                self._labels.clear()
+                self._signature = signature
+
+    def get(self, template):
+        """Return the cached label for a template, or None on a miss."""
+        with self._lock:
+            label = self._labels.get(template)
+            if label is None:
+                self.misses += 1
+                return None
+            self._labels.move_to_end(template)
+            self.hits += 1
+            return label
+
+    def record_hit(self):
+        """Count a message answered by a template labeled earlier in the same batch."""
+        with self._lock:
+            self.hits += 1
+
+    def put(self, template, label):
+        """
+        Remember the label for a template.
+
+        "Unclassified" results are not stored: low confidence means the
+        template may be mixing messages the model would label differently.
+        """
+        if not self.enabled or label == "Unclassified":
+            return
+        with self._lock:
+            self._labels[template] = label
+            self._labels.move_to_end(template)
+            while len(self._labels) > self.max_size:
+                self._labels.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._labels.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._labels),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,248 @@
+"""
+Per-request Timing Traces and the Slow-request Log
+
+Two halves:
+
+- Worker side: classify_batch runs inside collect(), a thread-local stage
+  timer. Every stage that records into metrics.STAGE_SECONDS also records
+  here (metrics.observe_stage), so a worker part knows how long its regex,
+  template, BERT encode / predict and LLM stages took. workers.py ships the
+  part's timing back with its results, like the metrics delta.
+- Server side: a RequestTrace collects the server steps (CSV parsing,
+  classification, writing the output), every worker part and, for
+  streamed uploads, every chunk. finish() remembers traces that were asked
+  for or slow (GET /debug/traces/{id}) and writes requests slower than
+  SLOW_REQUEST_MS to a rotating JSON-lines log, together with the cProfile
+  data of their worker parts when SLOW_REQUEST_PROFILE is on.
+
+Stage times of parts that ran in parallel overlap, so their sum can exceed
+the request's wall time.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import cProfile
+import json
+import logging
+import logging.handlers
+import marshal
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import (
+    SLOW_REQUEST_MS,
+    SLOW_REQUEST_LOG_PATH,
+    SLOW_REQUEST_LOG_MAX_BYTES,
+    SLOW_REQUEST_LOG_BACKUPS,
+    SLOW_REQUEST_PROFILE,
+    TRACE_HISTORY,
+)
+
+# Response headers stay well below common proxy limits (8 KB)
+MAX_HEADER_BYTES = 4096
+
+_local = threading.local()
+
+
+# ==================== WORKER SIDE ====================
+def record(stage, seconds, logs=None):
+    """Add one stage call to the timing collected on this thread (no-op outside collect())."""
+    stages = getattr(_local, "stages", None)
+    if stages is None:
+        return
+    entry = stages.setdefault(stage, {"ms": 0.0, "calls": 0, "logs": 0})
+    entry["ms"] += seconds * 1000
+    entry["calls"] += 1
+    entry["logs"] += logs or 0
+
+
+@contextmanager
+def collect(profile=False):
+    """
+    Time the stages run inside the with-block on this thread.
+
+    Args:
+        profile (bool): Also run the block under cProfile
+
+    Yields:
+        dict: Filled on exit with worker, ms, stages and profile (marshalled
+        pstats data or None); picklable, so process workers can return it
+    """
+    part = {"worker": f"{os.getpid()}/{threading.current_thread().name}"}
+    previous = getattr(_local, "stages", None)
+    _local.stages = stages = {}
+    profiler = cProfile.Profile() if profile else None
+    if profiler is not None:
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active on this interpreter
+            profiler = None
+    t0 = time.perf_counter()
+    try:
+        yield part
+    finally:
+        part["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        part["profile"] = None
+        if profiler is not None:
+            profiler.disable()
+            profiler.create_stats()
+            part["profile"] = marshal.dumps(profiler.stats)
+        part["stages"] = {
+            name: {**entry, "ms": round(entry["ms"], 3)} for name, entry in stages.items()
+        }
+        _local.stages = previous
+
+
+# ==================== SERVER SIDE ====================
+class RequestTrace:
+    """
+    Timing of one API request: server steps, worker parts and stage totals.
+    """
+
+    def __init__(self, endpoint, debug=False):
+        """
+        Args:
+            endpoint (str): Endpoint name used in metrics and the slow-request log
+            debug (bool): The client asked for the timing breakdown
+        """
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.debug = debug
+        self.profile = SLOW_REQUEST_PROFILE
+        self.started_at = time.time()
+        self.rows = 0
+        self.total_ms = None
+        self.steps = []  # server-side steps, in order
+        self.parts = []  # worker parts
+        self._profiles = []  # marshalled cProfile stats of the parts
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def step(self, name, **info):
+        """Time a server-side step (read_csv, classify, write_csv, chunk...)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append({"name": name, "ms": round((time.perf_counter() - t0) * 1000, 3), **info})
+
+    def add_part(self, part, **info):
+        """Add the timing a worker part returned (see collect())."""
+        part = dict(part, **info)
+        profile = part.pop("profile", None)
+        if profile is not None:
+            self._profiles.append((len(self.parts), profile))
+        self.parts.append(part)
+
+    def stages(self):
+        """Stage timings summed over all parts."""
+        totals = {}
+        for part in self.parts:
+            for name, entry in part["stages"].items():
+                total = totals.setdefault(name, {"ms": 0.0, "calls": 0, "logs": 0})
+                for key in total:
+                    total[key] += entry[key]
+        return {name: {**entry, "ms": round(entry["ms"], 3)} for name, entry in totals.items()}
+
+    def to_dict(self, parts=True):
+        trace = {
+            "id": self.id,
+            "endpoint": self.endpoint,
+            "started_at": self.started_at,
+            "rows": self.rows,
+            "total_ms": self.total_ms,
+            "steps": self.steps,
+            "stages": self.stages(),
+        }
+        if parts:
+            trace["parts"] = self.parts
+        return trace
+
+    def header_value(self):
+        """
+        Compact JSON for a response header. Per-part detail is dropped when it
+        would make the header too large; the full trace stays available under
+        GET /debug/traces/{id}.
+        """
+        value = json.dumps(self.to_dict(), separators=(",", ":"))
+        if len(value) > MAX_HEADER_BYTES:
+            trace = self.to_dict(parts=False)
+            trace["parts_omitted"] = len(self.parts)
+            value = json.dumps(trace, separators=(",", ":"))
+        return value
+
+
+_recent = OrderedDict()  # trace id -> trace dict
+_recent_lock = threading.Lock()
+_slow_logger = None
+_slow_logger_lock = threading.Lock()
+
+
+def finish(trace, rows):
+    """
+    Close a request's trace: remember it if it was asked for or slow and
+    write slow requests to the slow-request log.
+
+    Returns:
+        float: The request's wall time in milliseconds
+    """
+    trace.rows = rows
+    trace.total_ms = round((time.perf_counter() - trace._t0) * 1000, 3)
+    slow = 0 < SLOW_REQUEST_MS <= trace.total_ms
+    if trace.debug or slow:
+        with _recent_lock:
+            _recent[trace.id] = trace.to_dict()
+            while len(_recent) > TRACE_HISTORY:
+                _recent.popitem(last=False)
+    if slow:
+        try:
+            _log_slow(trace)
+        except OSError as e:
+            logging.getLogger(__name__).warning("Could not write slow-request log: %s", e)
+    return trace.total_ms
+
+
+def get(trace_id):
+    """A remembered trace, or None."""
+    with _recent_lock:
+        return _recent.get(trace_id)
+
+
+def _slow_log():
+    global _slow_logger
+    with _slow_logger_lock:
+        if _slow_logger is None:
+            SLOW_REQUEST_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                SLOW_REQUEST_LOG_PATH,
+                maxBytes=SLOW_REQUEST_LOG_MAX_BYTES,
+                backupCount=SLOW_REQUEST_LOG_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("log_classification.slow_requests")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _slow_logger = logger
+    return _slow_logger
+
+
+def _log_slow(trace):
+    """Append one JSON line; cProfile data goes to profiles/<trace id>-part<n>.prof next to the log."""
+    entry = trace.to_dict()
+    if trace._profiles:
+        profile_dir = SLOW_REQUEST_LOG_PATH.parent / "profiles"
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        entry["profiles"] = []
+        for index, data in trace._profiles:
+            # Same format as Profile.dump_stats: load with pstats.Stats(path)
+            path = profile_dir / f"{trace.id}-part{index}.prof"
+            path.write_bytes(data)
+            entry["profiles"].append(str(path))
+    _slow_log().info(json.dumps(entry, separators=(",", ":")))
@@ -0,0 +1,281 @@
+"""
+Append-only Training Data Store
+
+SQLite replacement for rewriting dataset/labeled_logs.csv on every retrain.
+Uploads are appended in one transaction whose cost depends only on the new
+rows; each example is identified by a BLAKE2b hash of its log message, so
+resubmitted rows are counted as duplicates instead of growing the training
+set. When the same message arrives with a different label the conflict
+policy decides which label is trained on:
+
+    latest    - the most recent submission wins (default)
+    first     - the label stored first is kept
+    majority  - the label submitted most often wins, ties go to the most recent
+
+Every submission is counted in `votes`, which the majority policy resolves
+from; each label remembers the batch and the row within it of its latest
+submission, so "most recent" is well defined inside one upload too. Reads stream the examples in insertion order in
+chunks (iter_chunks), which retrain.py consumes directly.
+
+Usage:
+  python training/training_store.py stats
+  python training/training_store.py import path/to/labeled.csv
+  python training/training_store.py export path/to/out.csv
+
+Author: Your Name
+Date: February 2026
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from pathlib import Path
+
+import pandas as pd
+
+COLUMNS = ["source", "log_message", "target_label"]
+CONFLICT_POLICIES = ("latest", "first", "majority")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    added_at   REAL NOT NULL,
+    origin     TEXT,
+    rows       INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS examples (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    key          BLOB NOT NULL UNIQUE,
+    source       TEXT,
+    log_message  TEXT NOT NULL,
+    target_label TEXT NOT NULL,
+    added_seq    INTEGER NOT NULL,
+    updated_seq  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    key          BLOB NOT NULL,
+    target_label TEXT NOT NULL,
+    count        INTEGER NOT NULL,
+    last_seq     INTEGER NOT NULL,
+    last_row     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, target_label)
+);
+"""
+# Columns added after the first release: (table, column, definition)
+_MIGRATIONS = [
+    ("votes", "last_row", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+
+def content_key(log_message):
+    """Dedup key of an example: 16-byte BLAKE2b digest of the log message."""
+    return hashlib.blake2b(str(log_message).encode("utf-8"), digest_size=16).digest()
+
+
+class TrainingStore:
+    """
+    Deduplicated labeled examples in a SQLite file.
+    """
+
+    def __init__(self, path, conflict_policy="latest"):
+        """
+        Args:
+            path (str or Path): SQLite database file (created if missing)
+            conflict_policy (str): "latest", "first" or "majority"
+        """
+        if conflict_policy not in CONFLICT_POLICIES:
+            raise ValueError(
+                f"Conflict policy must be one of {CONFLICT_POLICIES}, got {conflict_policy!r}"
+            )
+        self.path = Path(path)
+        self.conflict_policy = conflict_policy
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            for table, column, definition in _MIGRATIONS:
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _connect(self):
+        # One connection per call: the store is used from request, job and worker threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    # ---------- writes ----------
+    def append(self, rows, origin=None, conn=None):
+        """
+        Append labeled rows, skipping duplicates and resolving label conflicts.
+
+        Args:
+            rows (DataFrame or iterable): source, log_message, target_label rows
+            origin (str): Where the rows came from (upload name, seed file)
+            conn: Open connection to write with, inside its transaction (default: a new one)
+
+        Returns:
+            dict: received, inserted, duplicates, conflicts and relabeled counts
+        """
+        if conn is None:
+            with closing(self._connect()) as conn, conn:
+                return self.append(rows, origin, conn)
+        if isinstance(rows, pd.DataFrame):
+            rows = rows[COLUMNS].dropna(subset=["log_message", "target_label"]).itertuples(index=False)
+        counts = {"received": 0, "inserted": 0, "duplicates": 0, "conflicts": 0, "relabeled": 0}
+
+        seq = conn.execute(
+            "INSERT INTO batches (added_at, origin, rows) VALUES (?, ?, 0)", (time.time(), origin)
+        ).lastrowid
+        for source, log_message, label in rows:
+            log_message, label = str(log_message), str(label)
+            key = content_key(log_message)
+            counts["received"] += 1
+            conn.execute(
+                "INSERT INTO votes (key, target_label, count, last_seq, last_row) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT (key, target_label) DO UPDATE SET "
+                "count = count + 1, last_seq = excluded.last_seq, last_row = excluded.last_row",
+                (key, label, seq, counts["received"]),
+            )
+            existing = conn.execute("SELECT target_label FROM examples WHERE key = ?", (key,)).fetchone()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO examples (key, source, log_message, target_label, added_seq, updated_seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, source, log_message, label, seq, seq),
+                )
+                counts["inserted"] += 1
+                continue
+            if existing[0] == label:
+                counts["duplicates"] += 1
+                continue
+            counts["conflicts"] += 1
+            resolved = self._resolve(conn, key, existing[0], label)
+            if resolved != existing[0]:
+                conn.execute(
+                    "UPDATE examples SET target_label = ?, updated_seq = ? WHERE key = ?",
+                    (resolved, seq, key),
+                )
+                counts["relabeled"] += 1
+        conn.execute("UPDATE batches SET rows = ? WHERE seq = ?", (counts["received"], seq))
+        return counts
+
+    def _resolve(self, conn, key, current, incoming):
+        """Pick the label to train on for a message submitted with conflicting labels."""
+        if self.conflict_policy == "latest":
+            return incoming
+        if self.conflict_policy == "first":
+            return current
+        return conn.execute(
+            "SELECT target_label FROM votes WHERE key = ? ORDER BY count DESC, last_seq DESC, last_row DESC LIMIT 1",
+            (key,),
+        ).fetchone()[0]
+
+    def import_csv(self, csv_path, chunk_size=50000, conn=None):
+        """
+        Append a labeled CSV chunk by chunk (extra columns are ignored).
+
+        Args:
+            csv_path (str or Path): Labeled CSV
+            chunk_size (int): Rows read and appended at a time
+            conn: Open connection to write with, inside its transaction
+                (default: one transaction per chunk)
+
+        Returns:
+            dict: Summed append counts
+        """
+        totals = {}
+        for chunk in pd.read_csv(csv_path, usecols=COLUMNS, chunksize=chunk_size):
+            for k, v in self.append(chunk, origin=Path(csv_path).name, conn=conn).items():
+                totals[k] = totals.get(k, 0) + v
+        return totals
+
+    def seed_if_empty(self, *csv_paths):
+        """
+        Import the first existing CSV when the store is still empty (e.g. the
+        old dataset/labeled_logs.csv, else synthetic_logs.csv).
+
+        The check and the import run in one write transaction, so two
+        processes seeding at once can't both import the file.
+
+        Returns:
+            dict or None: Append counts, or None if nothing was imported
+        """
+        with closing(self._connect()) as conn, conn:
+            # Take the write lock before counting: a second seeder waits, then sees the rows
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT COUNT(*) FROM examples").fetchone()[0] > 0:
+                return None
+            for csv_path in csv_paths:
+                if csv_path and Path(csv_path).exists():
+                    return self.import_csv(csv_path, conn=conn)
+        return None
+
+    # ---------- reads ----------
+    def count(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM examples").fetchone()[0]
+
+    def iter_chunks(self, chunk_size=10000):
+        """
+        Stream the deduplicated examples in insertion order.
+
+        Yields:
+            DataFrame: Up to chunk_size rows with source, log_message, target_label
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("SELECT source, log_message, target_label FROM examples ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=COLUMNS)
+
+    def stats(self):
+        """Return example / submission counts and the label distribution."""
+        with closing(self._connect()) as conn:
+            by_label = dict(conn.execute(
+                "SELECT target_label, COUNT(*) FROM examples GROUP BY target_label ORDER BY 2 DESC"
+            ).fetchall())
+            submissions = conn.execute("SELECT COALESCE(SUM(count), 0) FROM votes").fetchone()[0]
+            conflicted = conn.execute(
+                "SELECT COUNT(*) FROM (SELECT key FROM votes GROUP BY key HAVING COUNT(*) > 1)"
+            ).fetchone()[0]
+            batches = conn.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "conflict_policy": self.conflict_policy,
+            "examples": sum(by_label.values()),
+            "submissions": submissions,
+            "batches": batches,
+            "conflicting_messages": conflicted,
+            "by_label": by_label,
+        }
+
+
+def get_store():
+    """The store configured by TRAINING_STORE_PATH / TRAINING_CONFLICT_POLICY."""
+    from config import TRAINING_STORE_PATH, TRAINING_CONFLICT_POLICY
+    return TrainingStore(TRAINING_STORE_PATH, TRAINING_CONFLICT_POLICY)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    parser = argparse.ArgumentParser(description="Inspect and load the training data store")
+    parser.add_argument("command", choices=["stats", "import", "export"])
+    parser.add_argument("csv", nargs="?", type=Path)
+    args = parser.parse_args()
+    if args.command != "stats" and args.csv is None:
+        parser.error(f"{args.command} needs a CSV path")
+
+    store = get_store()
+    if args.command == "import":
+        print(json.dumps(store.import_csv(args.csv), indent=2))
+    elif args.command == "export":
+        for i, chunk in enumerate(store.iter_chunks()):
+            chunk.to_csv(args.csv, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        print(f"Exported {store.count()} examples to {args.csv}")
+    else:
+        print(json.dumps(store.stats(), indent=2))
@@ -0,0 +1,311 @@
+"""
+Execution Layer for the Classification Pipeline
+
+Keeps CPU-bound classification and blocking Groq I/O off the FastAPI event
+loop. LegacyCRM rows (network-bound LLM calls) run on a thread pool; all other
+rows (regex + BERT encoding) run on a configurable pool of threads or of
+processes that each preload the model, so large requests use several cores
+and other clients keep being served. With an inference sidecar
+(inference_sidecar.py) the BERT stage of either pool runs in the sidecar.
+
+Author: Your Name
+Date: February 2026
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+import tracing
+from config import CLASSIFY_EXECUTOR, CLASSIFY_WORKERS, IO_WORKERS, BERT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_io_pool = None
+_cpu_pool = None
+_pool_lock = threading.Lock()
+_warmup_futures = []
+_in_worker_process = False
+_init_error = None  # why this worker process's initial warmup failed, if it did
+_worker_cache_stats = {}  # worker pid -> its latest cache stats (process executor)
+_stats_lock = threading.Lock()
+# Per-process limits, reported as they are instead of summed
+_LIMIT_FIELDS = ("max_entries", "max_bytes", "ttl_seconds", "max_size")
+
+
+# ==================== WORKER SIDE ====================
+def _init_worker():
+    """
+    Process-pool initializer: load the models once per worker process.
+
+    A failure is recorded instead of raised: an exception here would mark the
+    whole pool broken and fail every later request. The models then load on
+    the worker's first task, and _warmup_worker retries and reports the error.
+    """
+    global _in_worker_process, _init_error
+    _in_worker_process = True
+    metrics.mark_worker_process()
+    from classify import warmup
+    try:
+        warmup()
+    except Exception as e:
+        _init_error = f"{type(e).__name__}: {e}"
+        logger.exception("Worker %d could not load the models at startup", os.getpid())
+
+
+def _warmup_worker():
+    """Process-executor warmup task: raise if this worker's models are still not loaded."""
+    global _init_error
+    if _init_error is not None:
+        from classify import warmup
+        warmup()
+        _init_error = None
+
+
+def _warmup():
+    """Thread-executor warmup: load and warm the models inside this process."""
+    from classify import warmup
+    return warmup()
+
+
+def _classify_part(logs, batch_size, profile=False):
+    """
+    Run classify_batch on one slice of a request inside a worker.
+
+    Returns:
+        tuple: (results, metrics delta to merge in the server process or None
+        for threads, stage timing of this part - see tracing.collect, this
+        worker process's cache stats or None for threads)
+    """
+    from classify import classify_batch
+    with tracing.collect(profile=profile) as timing:
+        results = classify_batch(logs, batch_size=batch_size)
+    return results, metrics.worker_delta(), timing, _cache_stats() if _in_worker_process else None
+
+
+def _cache_stats():
+    from classify import result_cache, template_cache
+    return {"pid": os.getpid(), "result_cache": result_cache.stats(), "template_cache": template_cache.stats()}
+
+
+# ==================== POOLS ====================
+def _pools():
+    """Create the pools on first use."""
+    global _io_pool, _cpu_pool
+    with _pool_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="classify-io")
+        if _cpu_pool is None:
+            if CLASSIFY_EXECUTOR == "process":
+                # spawn, not fork: forking a process that already loaded torch can deadlock
+                _cpu_pool = ProcessPoolExecutor(
+                    max_workers=CLASSIFY_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            elif CLASSIFY_EXECUTOR == "thread":
+                _cpu_pool = ThreadPoolExecutor(
+                    max_workers=CLASSIFY_WORKERS, thread_name_prefix="classify-cpu"
+                )
+            else:
+                raise ValueError(f"CLASSIFY_EXECUTOR must be 'thread' or 'process', got {CLASSIFY_EXECUTOR!r}")
+    return _io_pool, _cpu_pool
+
+
+def _warm_llm_cache():
+    import processor_llm
+    return processor_llm.warm_cache()
+
+
+def start(warmup=True):
+    """
+    Create the pools and, with warmup=True, start loading the models in the
+    background: in-process for the thread executor, in every worker process
+    for the process executor. status() reports when that has finished. The
+    LLM response cache is loaded into memory alongside (not part of readiness).
+    """
+    io_pool, cpu_pool = _pools()
+    if not warmup:
+        return
+    # LegacyCRM rows run on this process's I/O threads: its LLM response cache is the one to warm
+    io_pool.submit(_warm_llm_cache)
+    if CLASSIFY_EXECUTOR == "process":
+        # Each task makes the pool spawn a worker; its initializer loads and warms the model
+        _warmup_futures[:] = [cpu_pool.submit(_warmup_worker) for _ in range(CLASSIFY_WORKERS)]
+    else:
+        _warmup_futures[:] = [cpu_pool.submit(_warmup)]
+
+
+def status():
+    """
+    Report whether the classification workers have their models loaded.
+
+    Returns:
+        dict: executor, workers, ready flag, the warmup error, if any, and the
+        inference sidecar's status (None when the models run in-process)
+    """
+    import inference_sidecar
+    import processor_bert
+
+    failed = [i for i, f in enumerate(_warmup_futures) if f.done() and f.exception()]
+    errors = [str(_warmup_futures[i].exception()) for i in failed]
+    if failed and CLASSIFY_EXECUTOR == "process" and _cpu_pool is not None:
+        # The pool keeps serving (models load on each task); retry so readiness can recover
+        for i in failed:
+            _warmup_futures[i] = _cpu_pool.submit(_warmup_worker)
+    sidecar = inference_sidecar.status() if inference_sidecar.enabled() else None
+    if sidecar is not None:
+        # The sidecar may have come up after a failed warmup: its status is what counts
+        ready = sidecar["ready"]
+        if ready:
+            errors = []
+    elif CLASSIFY_EXECUTOR == "process":
+        ready = bool(_warmup_futures) and all(f.done() for f in _warmup_futures) and not errors
+    else:
+        ready = processor_bert.is_loaded()
+    return {
+        "executor": CLASSIFY_EXECUTOR,
+        "workers": CLASSIFY_WORKERS,
+        "models_loaded": ready,
+        "warmup_error": errors[0] if errors else None,
+        "inference_sidecar": sidecar,
+    }
+
+
+def _add_stats(total, stats):
+    """Add one process's cache stats into total: counters and sizes summed, hit rates recomputed."""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            _add_stats(total.setdefault(key, {}), value)
+        elif key in _LIMIT_FIELDS or isinstance(value, bool) or not isinstance(value, (int, float)):
+            total.setdefault(key, value)
+        elif key != "hit_rate":
+            total[key] = total.get(key, 0) + value
+    if "hit_rate" in stats:
+        # hits / lookups overall, hits / (hits + computed) per stage
+        served = total["hits"] + total.get("misses", total.get("computed", 0))
+        total["hit_rate"] = round(total["hits"] / served, 4) if served else 0.0
+    return total
+
+
+def cache_stats(name, local):
+    """
+    Stats of one of classify's caches across processes, for GET /metrics.
+
+    With the process executor every worker keeps its own result and template
+    caches; their latest stats (shipped back with each part, like the metrics
+    delta) are added to this process's.
+
+    Args:
+        name (str): "result_cache" or "template_cache"
+        local (dict): The cache's stats() in this process
+
+    Returns:
+        dict: The summed stats, with "processes" (how many were added up)
+    """
+    with _stats_lock:
+        snapshots = [worker[name] for worker in _worker_cache_stats.values()]
+    total = {}
+    for stats in [local, *snapshots]:
+        _add_stats(total, stats)
+    return {**total, "processes": 1 + len(snapshots)}
+
+
+def shutdown():
+    """Stop both pools; called on application shutdown."""
+    global _io_pool, _cpu_pool
+    with _pool_lock:
+        if _io_pool is not None:
+            _io_pool.shutdown(wait=False, cancel_futures=True)
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = _cpu_pool = None
+
+
+# ==================== DISPATCH ====================
+def _submit(logs, batch_size, profile=False):
+    """
+    Split a batch across the pools.
+
+    Returns:
+        list: (row indexes, future) pairs; each future resolves to classify_batch results
+    """
+    io_pool, cpu_pool = _pools()
+    llm_rows = [i for i, (source, _) in enumerate(logs) if source == "LegacyCRM"]
+    cpu_rows = [i for i, (source, _) in enumerate(logs) if source != "LegacyCRM"]
+
+    parts = []
+    if llm_rows:
+        future = io_pool.submit(_classify_part, [logs[i] for i in llm_rows], batch_size, profile)
+        parts.append((llm_rows, future))
+
+    # Large requests are split so every CPU worker gets at least a couple of encoder batches
+    min_part = 2 * (batch_size or BERT_BATCH_SIZE)
+    n_parts = max(1, min(CLASSIFY_WORKERS, len(cpu_rows) // min_part))
+    step = -(-len(cpu_rows) // n_parts) if cpu_rows else 0
+    for start in range(0, len(cpu_rows), step or 1):
+        rows = cpu_rows[start:start + step]
+        future = cpu_pool.submit(_classify_part, [logs[i] for i in rows], batch_size, profile)
+        parts.append((rows, future))
+    return parts
+
+
+def _merge(logs, parts, part_results, trace=None, **trace_info):
+    labels = [None] * len(logs)
+    for (rows, _), (results, metrics_delta, timing, cache_stats) in zip(parts, part_results):
+        metrics.REGISTRY.merge(metrics_delta)
+        if cache_stats is not None:
+            with _stats_lock:
+                _worker_cache_stats[cache_stats["pid"]] = cache_stats
+        if trace is not None:
+            trace.add_part(timing, rows=len(rows), **trace_info)
+        for i, (_, _, label) in zip(rows, results):
+            labels[i] = label
+    return [(source, log_msg, label) for (source, log_msg), label in zip(logs, labels)]
+
+
+def classify_batch_parallel(logs, batch_size=None, trace=None, **trace_info):
+    """
+    Blocking version of classify_batch_async, for code already running off the event loop.
+
+    Args:
+        logs (list): List of tuples (source, log_msg)
+        batch_size (int): Encoder batch size for the BERT stage
+        trace (tracing.RequestTrace): Receives the timing of every worker part
+        **trace_info: Extra fields stored with each part (e.g. chunk=3)
+
+    Returns:
+        list: List of tuples (source, log_msg, label)
+    """
+    logs = [tuple(log) for log in logs]
+    parts = _submit(logs, batch_size, profile=trace is not None and trace.profile)
+    return _merge(logs, parts, [future.result() for _, future in parts], trace, **trace_info)
+
+
+async def classify_batch_async(logs, batch_size=None, trace=None):
+    """
+    Classify a batch on the worker pools without blocking the event loop.
+
+    Args:
+        logs (list): List of tuples (source, log_msg)
+        batch_size (int): Encoder batch size for the BERT stage
+        trace (tracing.RequestTrace): Receives the timing of every worker part
+
+    Returns:
+        list: List of tuples (source, log_msg, label)
+    """
+    logs = [tuple(log) for log in logs]
+    parts = _submit(logs, batch_size, profile=trace is not None and trace.profile)
+    part_results = await asyncio.gather(*(asyncio.wrap_future(future) for _, future in parts))
+    return _merge(logs, parts, part_results, trace)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run any blocking call (file parsing, retraining) on the I/O thread pool."""
+    io_pool, _ = _pools()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool, lambda: fn(*args, **kwargs))